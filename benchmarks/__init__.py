@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for cymod. Run from the repository root, e.g.
+
+    python -m benchmarks.throughput --help
+"""
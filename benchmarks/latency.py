@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks.latency
+~~~~~~~~~~~~~~~~~~
+
+A stand-in for a Neo4j driver which simulates the cost of talking to a remote
+database, so loader throughput can be measured without a server.
+
+"""
+from __future__ import print_function
+
+import time
+import random
+import threading
+
+
+class LatencyResult(object):
+    """Stand-in for the result of running a query, wrapping any real result."""
+
+    def __init__(self, result=None):
+        self._result = result
+
+    def single(self):
+        return self._result.single() if self._result is not None else None
+
+    def data(self):
+        return self._result.data() if self._result is not None else []
+
+    def consume(self):
+        if self._result is not None:
+            return self._result.consume()
+
+    def __iter__(self):
+        return iter(self._result) if self._result is not None else iter([])
+
+
+class LatencyTransaction(object):
+    """Explicit transaction which waits a round trip per query and on commit."""
+
+    def __init__(self, driver, inner=None):
+        self.driver = driver
+        self._inner = inner
+
+    def run(self, statement, params=None):
+        self.driver.wait(statements=1)
+        if self._inner is not None:
+            return LatencyResult(self._inner.run(statement, params))
+        return LatencyResult()
+
+    def commit(self):
+        self.driver.wait(statements=0)
+        if self._inner is not None:
+            self._inner.commit()
+
+    def rollback(self):
+        self.driver.wait(statements=0)
+        if self._inner is not None:
+            self._inner.rollback()
+
+
+class LatencySession(object):
+    """Session whose auto-commit queries each wait a single round trip."""
+
+    def __init__(self, driver, inner=None):
+        self.driver = driver
+        self._inner = inner
+
+    def run(self, statement, params=None):
+        self.driver.wait(statements=1)
+        if self._inner is not None:
+            return LatencyResult(self._inner.run(statement, params))
+        return LatencyResult()
+
+    def begin_transaction(self, metadata=None, timeout=None):
+        # BEGIN is pipelined with the first query, so costs no round trip
+        inner_tx = None
+        if self._inner is not None:
+            inner_tx = self._inner.begin_transaction(
+                metadata=metadata, timeout=timeout
+            )
+        return LatencyTransaction(self.driver, inner_tx)
+
+    def close(self):
+        if self._inner is not None:
+            self._inner.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LatencyDriver(object):
+    """Driver which sleeps to simulate network round trips and query execution.
+
+    Each query run, and each commit or rollback, costs one round trip. Queries
+    also cost `statement_cost` each. Every wait is scaled by a random factor
+    in [1 - jitter, 1 + jitter].
+
+    Args:
+        round_trip (float): Seconds per round trip. Defaults to 0.001.
+        statement_cost (float): Seconds the server spends on each query.
+            Defaults to 0.
+        jitter (float): Relative variation in each wait, between 0 and 1.
+            Defaults to 0.
+        inner (optional): Driver which actually runs the queries, e.g. a
+            :obj:`cymod.memgraph.MemoryDriver`. If not given queries are
+            discarded.
+        seed (int, optional): Seed for the jitter's random number generator.
+
+    Attributes:
+        round_trips (int): Number of round trips simulated so far.
+        waited (float): Total seconds spent sleeping, summed over threads.
+    """
+
+    def __init__(
+        self, round_trip=0.001, statement_cost=0.0, jitter=0.0, inner=None, seed=None
+    ):
+        if not 0 <= jitter <= 1:
+            raise ValueError("jitter must be between 0 and 1, not {0}".format(jitter))
+        self.round_trip = round_trip
+        self.statement_cost = statement_cost
+        self.jitter = jitter
+        self.inner = inner
+        self.round_trips = 0
+        self.waited = 0.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self, statements=1):
+        """Sleep for a round trip carrying the given number of statements."""
+        delay = self.round_trip + statements * self.statement_cost
+        with self._lock:
+            if self.jitter:
+                delay *= 1 + self._random.uniform(-self.jitter, self.jitter)
+            self.round_trips += 1
+            self.waited += delay
+        if delay > 0:
+            time.sleep(delay)
+
+    def session(self):
+        inner = self.inner.session() if self.inner is not None else None
+        return LatencySession(self, inner)
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks.micro
+~~~~~~~~~~~~~~~~
+
+Microbenchmarks of the query parsing and generation hot paths. Each benchmark
+prepares its inputs untimed, then times a single operation over several
+repeats. Results are saved as JSON and can be compared with a stored baseline,
+flagging benchmarks whose median time has grown by more than a threshold::
+
+    python -m benchmarks.micro run --output baseline.json
+    # ... change some code ...
+    python -m benchmarks.micro run --output current.json --baseline baseline.json
+    python -m benchmarks.micro compare baseline.json current.json
+
+Tables of up to 10^4 rows are used by default. Larger tables can be requested
+with e.g. `--rows 1000 10000 100000 1000000`.
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import random
+import shutil
+import fnmatch
+import tempfile
+import platform
+import argparse
+import datetime
+import warnings
+from collections import OrderedDict
+
+import pandas as pd
+
+from cymod.cyproc import CypherFile, CypherFileFinder
+from cymod.tabproc import TransTableProcessor, EnvrStateAliasTranslator
+from cymod.transtable import EnvironTransitionSet
+from cymod.load import EmbeddedGraphLoader
+from cymod.metrics import timer
+
+DEFAULT_ROWS = [1000, 10000]
+
+# Name/ (setup function, parameters) pairs, in the order benchmarks are run
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name, params=None):
+    """Register a benchmark.
+
+    The decorated function is called with a :obj:`Workspace` and each of the
+    parameters in turn, and returns the function to be timed.
+
+    Args:
+        name (str): Name of the benchmark. Each parameter is appended in
+            square brackets to give the names results are stored under.
+        params (list or callable, optional): Parameter values, or a function
+            of the parsed command line arguments returning them.
+    """
+
+    def register(setup):
+        BENCHMARKS[name] = (setup, params)
+        return setup
+
+    return register
+
+
+class Workspace(object):
+    """Temporary directories used by benchmarks, removed when closed."""
+
+    def __init__(self):
+        self._dirs = []
+
+    def mkdtemp(self):
+        directory = tempfile.mkdtemp(prefix="cymod_bench_")
+        self._dirs.append(directory)
+        return directory
+
+    def close(self):
+        for directory in self._dirs:
+            shutil.rmtree(directory, ignore_errors=True)
+        self._dirs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def transition_table(rows, n_states=50, seed=0):
+    """Build a transition table with coded states and conditions.
+
+    Returns:
+        :obj:`pandas.DataFrame`: Table with 'start' and 'end' state codes,
+            'delta_t' times and 'water' and 'fire' condition codes.
+    """
+    rng = random.Random(seed)
+    return pd.DataFrame(
+        {
+            "start": [rng.randrange(n_states) for _ in range(rows)],
+            "end": [rng.randrange(n_states) for _ in range(rows)],
+            "delta_t": [rng.randrange(1, 20) for _ in range(rows)],
+            "water": [rng.randrange(3) for _ in range(rows)],
+            "fire": [rng.randrange(2) for _ in range(rows)],
+        }
+    )
+
+
+def alias_translator(n_states=50):
+    translator = EnvrStateAliasTranslator()
+    translator.state_aliases = dict((i, "state{0}".format(i)) for i in range(n_states))
+    translator.add_cond_aliases("water", {0: "xeric", 1: "mesic", 2: "hydric"})
+    translator.add_cond_aliases("fire", {0: False, 1: True})
+    return translator
+
+
+def write_cypher_file(filename, n_queries, comment_lines=0, priority=0):
+    """Write a Cypher file of MERGE queries, optionally heavily commented."""
+    lines = ['{{"priority": {0}, "model": "bench"}}'.format(priority)]
+    for i in range(n_queries):
+        for j in range(comment_lines):
+            lines.append("// Comment {0}, MERGE (:NotAQuery {{n: {1}}});".format(j, i))
+        lines.append(
+            'MERGE (n:Thing {{id: {0}, name: "thing // {0}"}}) '
+            "// trailing comment".format(i)
+        )
+        lines.append("SET n.model = $model;")
+    with open(filename, "w") as f:
+        f.write("\n".join(lines))
+
+
+@benchmark("cypher_file_parse", ["small", "large", "comments"])
+def setup_cypher_file_parse(workspace, kind):
+    n_queries, comment_lines = {
+        "small": (10, 0),
+        "large": (5000, 0),
+        "comments": (500, 10),
+    }[kind]
+    filename = os.path.join(workspace.mkdtemp(), "model.cql")
+    write_cypher_file(filename, n_queries, comment_lines)
+    cypher_file = CypherFile(filename)
+    return cypher_file._parse_queries
+
+
+@benchmark("file_finder", ["wide", "deep"])
+def setup_file_finder(workspace, shape):
+    root = workspace.mkdtemp()
+    if shape == "wide":
+        # Many sibling directories, each with a few files
+        dirs = [os.path.join(root, "dir{0}".format(i)) for i in range(200)]
+    else:
+        # A single chain of nested directories
+        dirs = [
+            os.path.join(root, *["d{0}".format(i) for i in range(n)])
+            for n in range(1, 41)
+        ]
+    for directory in dirs:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for j in range(5):
+            write_cypher_file(os.path.join(directory, "f{0}.cql".format(j)), 5)
+        with open(os.path.join(directory, "notes.txt"), "w") as f:
+            f.write("Not a Cypher file")
+    finder = CypherFileFinder(root)
+    return lambda: list(finder.iterfiles(priority_sorted=True))
+
+
+def tabular_params(args):
+    return [
+        (rows, variant)
+        for rows in args.rows
+        for variant in ["plain", "global_params", "aliases"]
+    ]
+
+
+@benchmark("tabular_iterqueries", tabular_params)
+def setup_tabular_iterqueries(workspace, param):
+    rows, variant = param
+    df = transition_table(rows)
+    kwargs = {}
+    if variant == "global_params":
+        kwargs["global_params"] = {"model_ID": 1, "project": "bench"}
+    elif variant == "aliases":
+        kwargs["state_alias_translator"] = alias_translator()
+
+    def run():
+        processor = TransTableProcessor(df, "start", "end", **kwargs)
+        for _ in processor.iterqueries():
+            pass
+
+    return run
+
+
+@benchmark("environ_write_cypher_files", lambda args: args.rows)
+def setup_environ_write_cypher_files(workspace, rows):
+    df = transition_table(rows)
+    # File names are built from the state codes, so they must be strings
+    for col in ["start", "end"]:
+        df[col] = "s" + df[col].astype(str)
+    transition_set = EnvironTransitionSet(df, "start", "end", "delta_t")
+    directory = workspace.mkdtemp()
+    return lambda: transition_set.write_cypher_files(directory)
+
+
+@benchmark("embedded_query_generator", lambda args: args.rows)
+def setup_embedded_query_generator(workspace, rows):
+    directory = workspace.mkdtemp()
+    for i in range(10):
+        write_cypher_file(os.path.join(directory, "f{0}.cql".format(i)), 50)
+    loader = EmbeddedGraphLoader()
+    loader.load_cypher(directory, global_params={"model": "bench"})
+    loader.load_tabular(
+        transition_table(rows), "start", "end", global_params={"model_ID": 1}
+    )
+
+    def run():
+        for _ in loader.query_generator():
+            pass
+
+    return run
+
+
+def time_function(fn, repeat=5, min_time=0.1):
+    """Time a function, calling it enough times per repeat to be measurable.
+
+    Args:
+        fn (callable): Function of no arguments.
+        repeat (int): Number of repeats.
+        min_time (float): Minimum seconds each repeat should take. Quick
+            functions are called several times per repeat to reach it.
+
+    Returns:
+        dict: Seconds per call, summarised over the repeats.
+    """
+    start = timer()
+    fn()
+    elapsed = timer() - start
+    number = 1
+    if elapsed < min_time:
+        number = int(min_time / max(elapsed, 1e-9)) + 1
+
+    times = []
+    for _ in range(repeat):
+        start = timer()
+        for _ in range(number):
+            fn()
+        times.append((timer() - start) / number)
+
+    times.sort()
+    mean = sum(times) / len(times)
+    return OrderedDict(
+        [
+            ("min", times[0]),
+            ("median", times[len(times) // 2]),
+            ("mean", mean),
+            ("stdev", (sum((t - mean) ** 2 for t in times) / len(times)) ** 0.5),
+            ("repeat", repeat),
+            ("number", number),
+        ]
+    )
+
+
+def result_name(name, param):
+    if param is None:
+        return name
+    if isinstance(param, tuple):
+        param = "-".join(str(p) for p in param)
+    return "{0}[{1}]".format(name, param)
+
+
+def run_benchmarks(args):
+    """Run the selected benchmarks.
+
+    Returns:
+        dict: Machine details and results keyed by benchmark name.
+    """
+    results = OrderedDict()
+    with Workspace() as workspace, warnings.catch_warnings():
+        # Pandas deprecation warnings would swamp the output
+        warnings.simplefilter("ignore")
+        for name, (setup, params) in BENCHMARKS.items():
+            if callable(params):
+                params = params(args)
+            for param in params or [None]:
+                full_name = result_name(name, param)
+                if args.filter and not fnmatch.fnmatch(full_name, args.filter):
+                    continue
+                fn = setup(workspace, param)
+                results[full_name] = time_function(fn, args.repeat, args.min_time)
+                print(
+                    "{0:<50} {1:>12.6f} s".format(
+                        full_name, results[full_name]["median"]
+                    )
+                )
+                sys.stdout.flush()
+
+    return OrderedDict(
+        [
+            ("created", datetime.datetime.now().isoformat()),
+            (
+                "machine",
+                OrderedDict(
+                    [
+                        ("python", platform.python_version()),
+                        ("platform", platform.platform()),
+                        ("processor", platform.processor()),
+                    ]
+                ),
+            ),
+            ("benchmarks", results),
+        ]
+    )
+
+
+def compare(baseline, current, threshold=0.1):
+    """Compare median times with a baseline.
+
+    Args:
+        baseline (dict): Results of an earlier run.
+        current (dict): Results of the run being checked.
+        threshold (float): Relative slowdown above which a benchmark is
+            reported as a regression. Defaults to 0.1.
+
+    Returns:
+        list of tuple: (name, baseline median, current median, ratio, status)
+            for each benchmark in either run. Status is one of 'ok',
+            'regression', 'improvement', 'new' or 'missing'.
+    """
+    rows = []
+    old = baseline["benchmarks"]
+    new = current["benchmarks"]
+    for name in list(old) + [n for n in new if n not in old]:
+        if name not in new:
+            rows.append((name, old[name]["median"], None, None, "missing"))
+            continue
+        if name not in old:
+            rows.append((name, None, new[name]["median"], None, "new"))
+            continue
+        ratio = new[name]["median"] / old[name]["median"]
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append((name, old[name]["median"], new[name]["median"], ratio, status))
+    return rows
+
+
+def print_comparison(rows):
+    def fmt(value, spec):
+        return "n/a" if value is None else spec.format(value)
+
+    print(
+        "{0:<50} {1:>12} {2:>12} {3:>7}  {4}".format(
+            "benchmark", "baseline", "current", "ratio", "status"
+        )
+    )
+    for name, old, new, ratio, status in rows:
+        print(
+            "{0:<50} {1:>12} {2:>12} {3:>7}  {4}".format(
+                name,
+                fmt(old, "{0:.6f}"),
+                fmt(new, "{0:.6f}"),
+                fmt(ratio, "{0:.2f}"),
+                status.upper() if status == "regression" else status,
+            )
+        )
+
+
+def load_results(filename):
+    with open(filename) as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks of cymod's query parsing and generation."
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument(
+        "--rows",
+        nargs="+",
+        type=int,
+        default=DEFAULT_ROWS,
+        help="transition table sizes to benchmark",
+    )
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.1,
+        help="minimum seconds per repeat, quick functions are called repeatedly",
+    )
+    run_parser.add_argument(
+        "--filter", help="only run benchmarks matching this glob pattern"
+    )
+    run_parser.add_argument("--output", help="file to save the results to")
+    run_parser.add_argument("--baseline", help="results file to compare against")
+    run_parser.add_argument("--threshold", type=float, default=0.1)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="compare two results files"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown reported as a regression",
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        current = run_benchmarks(args)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(current, f, indent=2)
+        if not args.baseline:
+            return 0
+        baseline = load_results(args.baseline)
+    elif args.command == "compare":
+        baseline = load_results(args.baseline)
+        current = load_results(args.current)
+    else:
+        parser.print_help()
+        return 2
+
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows)
+    # A non-zero exit status lets CI fail on regressions
+    return 1 if any(row[4] == "regression" for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks.throughput
+~~~~~~~~~~~~~~~~~~~~~
+
+End-to-end benchmark of `ServerGraphLoader.commit` and its batched and
+parallel variants, run against a :obj:`LatencyDriver` which simulates the
+network and server. For each model size and commit variant it reports query
+and batch throughput, the median and 99th percentile time to commit a batch,
+the CPU time used locally and the process's peak resident memory. Comparing
+the CPU time with the wall time shows how much of a load is spent waiting on
+round trips.
+
+Each case runs in a fresh process so peak memory isn't inherited from earlier
+cases. Example::
+
+    python -m benchmarks.throughput --sizes small medium --round-trip 0.5 \\
+        --statement-cost 0.05 --jitter 0.2 --json results.json
+
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import random
+import shutil
+import tempfile
+import argparse
+import multiprocessing
+from collections import OrderedDict
+
+import pandas as pd
+
+from cymod.load import ServerGraphLoader
+from cymod.memgraph import MemoryDriver
+from cymod.metrics import timer
+from benchmarks.latency import LatencyDriver
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# Number of Cypher files, queries per file and transition table rows
+SIZES = OrderedDict(
+    [
+        ("small", dict(files=8, queries=25, rows=200)),
+        ("medium", dict(files=32, queries=100, rows=2000)),
+        ("large", dict(files=128, queries=250, rows=20000)),
+    ]
+)
+
+# Keyword arguments of `commit` for each variant benchmarked
+VARIANTS = OrderedDict(
+    [
+        ("query", dict(tx_scope="query")),
+        ("file", dict(tx_scope="file")),
+        ("priority", dict(tx_scope="priority")),
+        ("load", dict(tx_scope="load")),
+        ("prefetch", dict(tx_scope="file", prefetch_size=4)),
+        ("parallel", dict(tx_scope="file", workers=4)),
+    ]
+)
+
+if sys.version_info >= (3, 5):
+    from benchmarks.throughput_async import commit_async
+
+    VARIANTS["async"] = dict(tx_scope="file", workers=4)
+
+
+class TimedServerGraphLoader(ServerGraphLoader):
+    """Loader which records how long each batch takes to commit."""
+
+    def _commit_batch(self, session, batch, *args, **kwargs):
+        start = timer()
+        super(TimedServerGraphLoader, self)._commit_batch(
+            session, batch, *args, **kwargs
+        )
+        # list.append is atomic, so batches committed by workers can share it
+        self.batch_times.append(timer() - start)
+
+
+def write_model(directory, files, queries, rows, seed=0):
+    """Write Cypher files and build a transition table of the given size.
+
+    A quarter of the files, at priority 0, create nodes which the remaining
+    files, at priority 1, connect to new nodes.
+
+    Returns:
+        :obj:`pandas.DataFrame`: The transition table.
+    """
+    rng = random.Random(seed)
+    n_nodes_files = max(1, files // 4)
+    for i in range(files):
+        lines = []
+        if i < n_nodes_files:
+            lines.append('{"priority": 0}')
+            for j in range(queries):
+                lines.append(
+                    'MERGE (:Thing {{id: "f{0}_{1}", model_ID: $model_ID}});'.format(
+                        i, j
+                    )
+                )
+        else:
+            lines.append('{"priority": 1}')
+            for j in range(queries):
+                lines.append(
+                    'MATCH (a:Thing {{id: "f{0}_{1}", model_ID: $model_ID}}) '
+                    'MERGE (a)-[:LINKS]->(:Other {{id: "f{2}_{1}", '
+                    "model_ID: $model_ID}});".format(
+                        rng.randrange(n_nodes_files), j, i
+                    )
+                )
+        with open(os.path.join(directory, "file{0}.cql".format(i)), "w") as f:
+            f.write("\n".join(lines))
+
+    codes = ["s{0}".format(i) for i in range(max(2, rows // 20))]
+    return pd.DataFrame(
+        {
+            "start": [rng.choice(codes) for _ in range(rows)],
+            "end": [rng.choice(codes) for _ in range(rows)],
+            "soil": [rng.choice(["sand", "clay", "loam"]) for _ in range(rows)],
+            "rain": [rng.randrange(5) for _ in range(rows)],
+        }
+    )
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers, or None if it's empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(round(q / 100.0 * (len(ordered) - 1)))
+    return ordered[rank]
+
+
+def peak_rss_mb():
+    """Peak resident memory of the current process in MB, if known."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and kilobytes elsewhere
+    return peak / (1024.0 ** 2 if sys.platform == "darwin" else 1024.0)
+
+
+def cpu_seconds():
+    t = os.times()
+    return t[0] + t[1]
+
+
+def run_case(size, variant, round_trip, statement_cost, jitter, memory, seed):
+    """Build a model, load it with one commit variant and measure the load.
+
+    Args:
+        size (str): Key of `SIZES`.
+        variant (str): Key of `VARIANTS`.
+        round_trip (float): Seconds per simulated round trip.
+        statement_cost (float): Seconds per simulated query execution.
+        jitter (float): Relative variation in simulated waits.
+        memory (bool): If True, queries are also run against a
+            :obj:`MemoryDriver`, adding the cost of executing them locally.
+        seed (int): Seed for model generation and jitter.
+
+    Returns:
+        dict: Measurements of the load.
+    """
+    model_dir = tempfile.mkdtemp()
+    try:
+        table = write_model(model_dir, seed=seed, **SIZES[size])
+        driver = LatencyDriver(
+            round_trip,
+            statement_cost,
+            jitter,
+            inner=MemoryDriver() if memory else None,
+            seed=seed,
+        )
+        commit_kwargs = VARIANTS[variant]
+
+        cpu_start = cpu_seconds()
+        start = timer()
+        if variant == "async":
+            loader = commit_async(driver, table, model_dir, commit_kwargs)
+        else:
+            loader = TimedServerGraphLoader.from_driver(driver)
+            loader.batch_times = []
+            loader.load_cypher(model_dir, global_params={"model_ID": 1})
+            loader.load_tabular(table, "start", "end", global_params={"model_ID": 1})
+            loader.commit(**commit_kwargs)
+        elapsed = timer() - start
+        cpu = cpu_seconds() - cpu_start
+
+        queries = driver.round_trips - (
+            0 if commit_kwargs["tx_scope"] == "query" else len(loader.batch_times)
+        )
+        batches = loader.batch_times
+        return OrderedDict(
+            [
+                ("size", size),
+                ("variant", variant),
+                ("queries", queries),
+                ("batches", len(batches)),
+                ("seconds", elapsed),
+                ("queries_per_sec", queries / elapsed),
+                ("batches_per_sec", len(batches) / elapsed),
+                ("p50_commit_ms", 1000 * percentile(batches, 50)),
+                ("p99_commit_ms", 1000 * percentile(batches, 99)),
+                ("round_trips", driver.round_trips),
+                ("simulated_wait_s", driver.waited),
+                ("cpu_s", cpu),
+                ("peak_rss_mb", peak_rss_mb()),
+            ]
+        )
+    finally:
+        shutil.rmtree(model_dir)
+
+
+def run_isolated(*args):
+    """Run a case in a new process, so its peak memory is measured alone."""
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(run_case, args)
+    finally:
+        pool.close()
+        pool.join()
+
+
+COLUMNS = [
+    ("size", "{0:<8}"),
+    ("variant", "{0:<9}"),
+    ("queries", "{0:>8}"),
+    ("queries_per_sec", "{0:>10.1f}"),
+    ("batches_per_sec", "{0:>10.1f}"),
+    ("p50_commit_ms", "{0:>9.2f}"),
+    ("p99_commit_ms", "{0:>9.2f}"),
+    ("seconds", "{0:>8.2f}"),
+    ("cpu_s", "{0:>7.2f}"),
+    ("peak_rss_mb", "{0:>8.1f}"),
+]
+
+
+def format_row(result):
+    cells = []
+    for name, fmt in COLUMNS:
+        value = result[name]
+        cells.append(fmt.format(value) if value is not None else "n/a")
+    return " ".join(cells)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure loader throughput against a simulated database."
+    )
+    parser.add_argument(
+        "--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"]
+    )
+    parser.add_argument(
+        "--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS)
+    )
+    parser.add_argument(
+        "--round-trip", type=float, default=1.0, help="milliseconds per round trip"
+    )
+    parser.add_argument(
+        "--statement-cost",
+        type=float,
+        default=0.0,
+        help="milliseconds the simulated server spends on each query",
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="relative variation in waits"
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="also execute queries in an in-memory graph",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="run every case in this process (peak memory is then cumulative)",
+    )
+    parser.add_argument("--json", help="file to write the results to")
+    args = parser.parse_args(argv)
+
+    run = run_case if args.in_process else run_isolated
+    print(" ".join(name for name, _ in COLUMNS))
+    results = []
+    for size in args.sizes:
+        for variant in args.variants:
+            result = run(
+                size,
+                variant,
+                args.round_trip / 1000.0,
+                args.statement_cost / 1000.0,
+                args.jitter,
+                args.memory,
+                args.seed,
+            )
+            print(format_row(result))
+            results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
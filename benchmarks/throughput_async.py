@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+benchmarks.throughput_async
+~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+The `async` variant of :mod:`benchmarks.throughput`, kept apart as coroutine
+syntax can't be compiled before Python 3.5.
+
+"""
+import asyncio
+
+from cymod.asyncload import AsyncServerGraphLoader, ThreadedAsyncDriver
+from cymod.metrics import timer
+
+
+def commit_async(driver, table, model_dir, commit_kwargs):
+    """Load with :obj:`AsyncServerGraphLoader`, timing each source.
+
+    Returns:
+        :obj:`AsyncServerGraphLoader`: The loader, with the seconds taken to
+            load each source in `batch_times`.
+    """
+    workers = commit_kwargs.get("workers", 1)
+    loader = AsyncServerGraphLoader.from_driver(
+        ThreadedAsyncDriver(driver, max_workers=workers), max_in_flight=workers
+    )
+    loader.batch_times = []
+    commit_source = loader._commit_source
+
+    async def timed_commit_source(source, tx_scope):
+        start = timer()
+        await commit_source(source, tx_scope)
+        loader.batch_times.append(timer() - start)
+
+    loader._commit_source = timed_commit_source
+    loader.load_cypher(model_dir, global_params={"model_ID": 1})
+    loader.load_tabular(table, "start", "end", global_params={"model_ID": 1})
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(loader.commit(tx_scope=commit_kwargs["tx_scope"]))
+        loop.run_until_complete(loader.close())
+    finally:
+        loop.close()
+    return loader
@@ -42,7 +42,12 @@ from __future__ import print_function
 
 __version__ = "0.0.5"
 
+import sys
+
 from cymod.load import ServerGraphLoader
 from cymod.load import EmbeddedGraphLoader
 from cymod.params import read_params_file
 from cymod.customise import NodeLabels
+
+if sys.version_info >= (3, 5):
+    from cymod.asyncload import AsyncServerGraphLoader
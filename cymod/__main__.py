@@ -9,6 +9,11 @@ import argparse
 from cymod import ServerGraphLoader
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["lint"]:
+        from cymod.lint import main
+
+        sys.exit(main(sys.argv[2:]))
+
     intro_string = (
         "Process cypher (graph database) query files and load "
         + "into specified neo4j database."
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.asyncload
+~~~~~~~~~~~~~~~
+
+Loads Cypher data into a running Neo4j database from within an asyncio event
+loop. Requires Python 3.5 or later.
+
+"""
+import asyncio
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from neo4j import GraphDatabase
+from neo4j.exceptions import CypherSyntaxError
+
+from cymod.cybase import CypherQuery
+from cymod.load import GraphLoader, is_schema_level
+from cymod.tabproc import TransTableProcessor
+
+try:
+    from neo4j import AsyncGraphDatabase
+except ImportError:
+    # Drivers older than 5.0 have no async API, use a thread pool instead
+    AsyncGraphDatabase = None
+
+# Number of queries taken from a source at a time while it's being loaded
+QUERY_FETCH_SIZE = 1000
+
+
+def _take(iterator, n):
+    """Get the next `n` items from an iterator as a list."""
+    return list(itertools.islice(iterator, n))
+
+
+def _run_to_completion(runner, statement, params):
+    """Run a query with a blocking session or transaction and wait for it."""
+    result = runner.run(statement, params)
+    if hasattr(result, "consume"):
+        result.consume()
+
+
+class _ThreadedTransaction(object):
+    """Awaitable wrapper around a blocking driver transaction."""
+
+    def __init__(self, tx, run_blocking):
+        self._tx = tx
+        self._run_blocking = run_blocking
+
+    async def run(self, statement, params=None):
+        await self._run_blocking(_run_to_completion, self._tx, statement, params)
+
+    async def commit(self):
+        return await self._run_blocking(self._tx.commit)
+
+    async def rollback(self):
+        return await self._run_blocking(self._tx.rollback)
+
+
+class _ThreadedSession(object):
+    """Awaitable wrapper around a blocking driver session."""
+
+    def __init__(self, session, run_blocking):
+        self._session = session
+        self._run_blocking = run_blocking
+
+    async def run(self, statement, params=None):
+        await self._run_blocking(_run_to_completion, self._session, statement, params)
+
+    async def begin_transaction(self):
+        tx = await self._run_blocking(self._session.begin_transaction)
+        return _ThreadedTransaction(tx, self._run_blocking)
+
+    async def close(self):
+        return await self._run_blocking(self._session.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class ThreadedAsyncDriver(object):
+    """Adapts a blocking driver to the subset of the async driver API we use.
+
+    Each blocking call is handed to a thread pool so the event loop is never
+    held up waiting for the database.
+
+    Args:
+        driver: A blocking driver, as returned by :obj:`GraphDatabase.driver`.
+        max_workers (int): Size of the thread pool blocking calls are run in.
+    """
+
+    def __init__(self, driver, max_workers=8):
+        self.driver = driver
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def _run_blocking(self, fn, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def session(self):
+        return _ThreadedSession(self.driver.session(), self._run_blocking)
+
+    async def close(self):
+        await self._run_blocking(self.driver.close)
+        self._executor.shutdown(wait=False)
+
+
+class AsyncServerGraphLoader(GraphLoader):
+    """Loads Cypher data into a running Neo4j database instance using asyncio.
+
+    Queries are drawn from the same stream as :obj:`ServerGraphLoader`, and
+    sent without blocking the event loop. Only sources sharing a priority
+    level are loaded concurrently: every source in a level is loaded before
+    the next level is prepared, so a level holding a single source (e.g. a
+    table which isn't split into chunks) is loaded one query at a time.
+
+    Args:
+        username (str): Neo4j user name.
+        password (str): Neo4j password.
+        uri (str): Address of the Neo4j server.
+        max_in_flight (int): Maximum number of sources being loaded
+            concurrently. Defaults to 8.
+    """
+
+    def __init__(
+        self, username, password, uri="bolt://localhost:7687", max_in_flight=8
+    ):
+        super(AsyncServerGraphLoader, self).__init__()
+        if AsyncGraphDatabase is not None:
+            self.driver = AsyncGraphDatabase.driver(uri, auth=(username, password))
+        else:
+            self.driver = ThreadedAsyncDriver(
+                GraphDatabase.driver(uri, auth=(username, password)),
+                max_workers=max_in_flight,
+            )
+        self.max_in_flight = max_in_flight
+
+    @classmethod
+    def from_driver(cls, driver, max_in_flight=8):
+        """Create a loader which uses an existing async driver object.
+
+        Args:
+            driver: Object providing the same interface as
+                :obj:`AsyncGraphDatabase.driver`. Blocking drivers can be
+                wrapped in a :obj:`ThreadedAsyncDriver` first.
+            max_in_flight (int): Maximum number of sources being loaded
+                concurrently. Defaults to 8.
+
+        Returns:
+            :obj:`AsyncServerGraphLoader`
+        """
+        loader = cls.__new__(cls)
+        GraphLoader.__init__(loader)
+        loader.driver = driver
+        loader.max_in_flight = max_in_flight
+        return loader
+
+    async def commit(self, tx_scope="query", chunk_size=None):
+        """Load all queries loaded into :obj:`GraphLoader` into the graph.
+
+        Sources sharing a priority level are loaded concurrently, with at most
+        `max_in_flight` in progress at once. Every source in a level is loaded
+        before any source in the next level is started. Cypher files are read
+        and parsed, and table rows turned into queries, in a thread pool so
+        the event loop isn't held up.
+
+        Args:
+            tx_scope (str): Either 'query' (each query is committed on its own)
+                or 'file' (each Cypher file or table chunk is committed in a 
+                single transaction). Defaults to 'query'.
+            chunk_size (int, optional): If given, tables are split into chunks
+                of at most this many rows, which are loaded concurrently. 
+                Without uniqueness constraints on the properties the tables'
+                queries MERGE on, concurrent chunks may create duplicate 
+                nodes. Can't be used with tables loaded with fresh_load=True,
+                whose rows depend on entities created by earlier rows.
+        """
+        if tx_scope not in ["query", "file"]:
+            raise ValueError(
+                "AsyncServerGraphLoader supports the 'query' and 'file' "
+                + "transaction scopes, not '{0}'".format(tx_scope)
+            )
+        if chunk_size and any(
+            isinstance(job, TransTableProcessor) and job.fresh_load
+            for job in self._load_job_queue
+        ):
+            raise ValueError(
+                "Tables loaded with fresh_load=True can't be split into chunks "
+                + "loaded concurrently"
+            )
+
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def bounded(source):
+            async with semaphore:
+                await self._commit_source(source, tx_scope)
+
+        loop = asyncio.get_event_loop()
+        levels = self._iterlevels(chunk_size)
+        awaiting_indexes = False
+        while True:
+            sources = await loop.run_in_executor(None, next, levels, None)
+            if sources is None:
+                break
+            if is_schema_level(sources[0][0]):
+                awaiting_indexes = True
+            elif awaiting_indexes:
+                # Indexes created by schema statements must be online before
+                # data statements are run
+                async with self.driver.session() as session:
+                    await self._run_query(
+                        session,
+                        CypherQuery("CALL db.awaitIndexes($timeout)", {"timeout": 300}),
+                    )
+                awaiting_indexes = False
+            await asyncio.gather(*[bounded(source) for source in sources])
+
+    async def _commit_source(self, source, tx_scope):
+        """Load the queries from a single source using a new session.
+
+        Args:
+            source (tuple): A (level, queries) pair yielded by `_itersources`.
+            tx_scope (str): Either 'query' or 'file'.
+        """
+        _, queries = source
+        async with self.driver.session() as session:
+            if tx_scope == "query":
+                await self._run_queries(session, queries)
+            else:
+                tx = await session.begin_transaction()
+                try:
+                    await self._run_queries(tx, queries)
+                except Exception:
+                    await tx.rollback()
+                    raise
+                await tx.commit()
+
+    async def _run_queries(self, runner, queries):
+        """Run a source's queries in order.
+
+        Queries are taken from the source in a thread pool, as whole tables
+        are only turned into queries as they're needed.
+
+        Args:
+            runner: An async database session or transaction.
+            queries (iterable of :obj:`CypherQuery`)
+        """
+        loop = asyncio.get_event_loop()
+        queries = iter(queries)
+        while True:
+            chunk = await loop.run_in_executor(None, _take, queries, QUERY_FETCH_SIZE)
+            if not chunk:
+                return
+            for cypher_query in chunk:
+                await self._run_query(runner, cypher_query)
+
+    async def _run_query(self, runner, cypher_query):
+        """Run a single query, reporting it if it contains a syntax error.
+
+        Args:
+            runner: An async database session or transaction.
+            cypher_query (:obj:`CypherQuery`)
+        """
+        try:
+            result = await runner.run(cypher_query.statement, cypher_query.params)
+            # Wait for the server to finish with the query so errors are
+            # reported against the query which caused them
+            if hasattr(result, "consume"):
+                result = result.consume()
+                if asyncio.iscoroutine(result):
+                    await result
+        except CypherSyntaxError:
+            print("Offending cypher query:\n" + repr(cypher_query))
+            raise
+
+    async def close(self):
+        """Close the underlying driver."""
+        await self.driver.close()
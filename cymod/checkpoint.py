@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.checkpoint
+~~~~~~~~~~~~~~~~
+
+This module contains a durable record of the batches of queries which have
+been committed to a database, allowing interrupted loads to be resumed.
+"""
+import os
+import json
+import threading
+
+
+class CheckpointLog(object):
+    """Append-only log of committed :obj:`CypherQueryBatch` objects.
+
+    Each line of the log file is a JSON object recording a batch's identity
+    and a hash of its content, so a batch is only treated as committed if
+    neither its position in the load nor its queries have changed.
+
+    Every record is flushed to the operating system, so survives the process
+    being killed, but is only synced to disk once `sync_every` batches have
+    been recorded since the last sync, and when the log is closed. If the
+    operating system crashes, up to `sync_every` - 1 committed batches may be
+    missing from the log, and are committed again when the load is resumed.
+
+    Args:
+        filename (str): Path of the log file.
+        resume (bool): If True, batches recorded in an existing log file are
+            treated as already committed. Otherwise any existing log file is
+            truncated. Defaults to False.
+        sync_every (int): Number of batches recorded between syncs. Defaults
+            to 1, syncing every record.
+    """
+
+    def __init__(self, filename, resume=False, sync_every=1):
+        self.filename = filename
+        self.sync_every = sync_every
+        self._lock = threading.Lock()
+        self._committed = set()
+        # Number of records written since the file was last synced
+        self._unsynced = 0
+        if resume and os.path.exists(filename):
+            self._committed = self._read()
+            mode = "a"
+        else:
+            mode = "w"
+        self._file = open(filename, mode)
+        if mode == "a" and self._file.tell() > 0:
+            # Start on a fresh line in case the last one was left incomplete
+            self._file.write("\n")
+
+    def _read(self):
+        """Read the identities of the batches recorded in the log file.
+
+        A partially written final line, left behind if the process was killed
+        while recording a batch, is ignored.
+
+        Returns:
+            set of tuple: (ident, digest) pairs.
+        """
+        committed = set()
+        with open(self.filename, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                committed.add((entry["ident"], entry["digest"]))
+        return committed
+
+    def __contains__(self, batch):
+        return (batch.ident, batch.digest()) in self._committed
+
+    def record(self, batch):
+        """Record that a batch has been committed.
+
+        Args:
+            batch (:obj:`CypherQueryBatch`)
+        """
+        entry = {"ident": batch.ident, "digest": batch.digest(), "size": len(batch)}
+        with self._lock:
+            self._file.write(json.dumps(entry, sort_keys=True) + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                self._sync()
+            self._committed.add((entry["ident"], entry["digest"]))
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def sync(self):
+        """Sync any records written since the last sync to disk."""
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -6,11 +6,160 @@ cymod.cybase
 This module contains basic classes used to hold and manipulate data about 
 cypher queries.
 """
+import re
 import json
+import numbers
+import hashlib
 
 import six
 
 
+# Statements which create or drop indexes and constraints. These can't share a
+# transaction with statements which read or write data.
+SCHEMA_STATEMENT_RE = re.compile(
+    r"^\s*(CREATE|DROP)\s+(OR\s+REPLACE\s+)?"
+    r"((UNIQUE|BTREE|RANGE|TEXT|POINT|FULLTEXT|LOOKUP|VECTOR|NODE|RELATIONSHIP)"
+    r"\s+)*(INDEX|CONSTRAINT)\b",
+    re.IGNORECASE,
+)
+
+# Statements which manage their own transactions, so must be run on their own
+# in an auto-commit transaction rather than in an explicit one.
+AUTO_COMMIT_STATEMENT_RE = re.compile(
+    r"\bIN\s+TRANSACTIONS\b|^\s*USING\s+PERIODIC\s+COMMIT\b", re.IGNORECASE
+)
+
+
+def properties_predicate(var, properties):
+    """Build a WHERE clause body matching property values passed as parameters.
+
+    Args:
+        var (str): Name of the variable whose properties are matched.
+        properties (dict): Property name/ value pairs.
+
+    Returns:
+        tuple of str and dict: The predicate, e.g. "n.`model_ID` = $p0", and
+            the parameters it uses, named p0, p1, ... in order of the sorted
+            property names.
+    """
+    conditions = []
+    params = {}
+    for i, k in enumerate(sorted(properties.keys())):
+        conditions.append(var + ".`" + k + "` = $p" + str(i))
+        params["p" + str(i)] = properties[k]
+    return " AND ".join(conditions), params
+
+
+def properties_map(properties):
+    """Build a map of property values passed as parameters, for patterns.
+
+    Args:
+        properties (dict): Property name/ value pairs.
+
+    Returns:
+        tuple of str and dict: The map, e.g. "{`model_ID`: $p0}", and the 
+            parameters it uses, named as by `properties_predicate`.
+    """
+    entries = []
+    params = {}
+    for i, k in enumerate(sorted(properties.keys())):
+        entries.append("`" + k + "`: $p" + str(i))
+        params["p" + str(i)] = properties[k]
+    return "{" + ", ".join(entries) + "}", params
+
+
+# Either a quoted string or name, in which '$' doesn't start a parameter, or a
+# parameter reference
+STATEMENT_TOKEN_RE = re.compile(
+    r"(\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'|`[^`]*`)"
+    r"|\$([a-zA-Z_][a-zA-Z0-9_]*)"
+)
+
+
+def cypher_literal(value):
+    """Render a Python value as a Cypher literal.
+
+    Args:
+        value: None, a bool, number, string, or a list or dict of these.
+
+    Returns:
+        str
+
+    Examples:
+        >>> cypher_literal({"name": "a", "n": [1, True]})
+        '{`n`: [1, true], `name`: "a"}'
+    """
+    if value is None:
+        return "null"
+    if isinstance(value, bool) or type(value).__name__ == "bool_":
+        return "true" if value else "false"
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    if isinstance(value, numbers.Real):
+        return repr(float(value))
+    if isinstance(value, six.string_types):
+        # JSON string escapes are also valid in Cypher string literals
+        return json.dumps(value)
+    if isinstance(value, dict):
+        return (
+            "{"
+            + ", ".join(
+                "`" + k + "`: " + cypher_literal(value[k]) for k in sorted(value)
+            )
+            + "}"
+        )
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(cypher_literal(v) for v in value) + "]"
+    raise TypeError("Can't express {0!r} as a Cypher literal".format(value))
+
+
+class StatementTemplate(object):
+    """A Cypher statement split into literal text and parameter slots.
+
+    Parsing a statement once allows it to be rendered with many sets of
+    parameters cheaply. Text inside quoted strings and names is never treated
+    as a parameter reference.
+
+    Args:
+        statement (str): Cypher statement, possibly with $parameters.
+    """
+
+    def __init__(self, statement):
+        # Alternating literal text and parameter names, starting and ending
+        # with literal text
+        self.parts = []
+        last = 0
+        for match in STATEMENT_TOKEN_RE.finditer(statement):
+            if match.group(2) is None:
+                continue
+            self.parts.append(statement[last : match.start()])
+            self.parts.append(match.group(2))
+            last = match.end()
+        self.parts.append(statement[last:])
+
+    @property
+    def param_names(self):
+        """list of str: Names of the parameters referenced, in order."""
+        return self.parts[1::2]
+
+    def render(self, params):
+        """Substitute parameter values into the statement.
+
+        Args:
+            params (dict): Parameter name/ value pairs.
+
+        Returns:
+            str: Concrete statement.
+
+        Raises:
+            KeyError: If a referenced parameter isn't in `params`.
+        """
+        rendered = list(self.parts)
+        for i in range(1, len(rendered), 2):
+            rendered[i] = cypher_literal(params[rendered[i]])
+        return "".join(rendered)
+
+
 class CypherQuerySource(object):
     """Container for information about a Cypher query's original source."""
 
@@ -62,6 +211,17 @@ class CypherQuery(object):
         self.params = params
         self.source = source
 
+    @property
+    def is_schema(self):
+        """bool: True if the statement creates or drops an index or constraint."""
+        return SCHEMA_STATEMENT_RE.match(self.statement) is not None
+
+    @property
+    def needs_auto_commit(self):
+        """bool: True if the statement can't run in an explicit transaction,
+        e.g. because it uses CALL { ... } IN TRANSACTIONS."""
+        return AUTO_COMMIT_STATEMENT_RE.search(self.statement) is not None
+
     def __repr__(self):
         return (
             "[statement: "
@@ -90,3 +250,84 @@ class CypherQuery(object):
             or self.params != other.params
             or self.source != other.source
         )
+
+
+class CypherQueryBatch(object):
+    """Container for Cypher queries which should be committed together.
+
+    Batches are the unit of atomicity used when committing queries to a
+    database: either every query in a batch is applied, or none of them are.
+    """
+
+    def __init__(self, queries, level=None):
+        """
+        Args:
+            queries (list of :obj:`CypherQuery`): Queries in the order in which
+                they should be run.
+            level (tuple, optional): Identifies the priority level the queries
+                were drawn from, used to decide which batches may be committed
+                independently of one another.
+        """
+        self.queries = queries
+        self.level = level
+
+    @property
+    def ident(self):
+        """str: Identifies the batch by the position of its queries.
+
+        Takes the form '<job>:<first source>#<index>..<last source>#<index>',
+        where tables are referred to as 'tabular'.
+        """
+
+        def source_str(query):
+            source = query.source
+            if source is None:
+                return "?"
+            if source.ref_type == "tabular":
+                return "tabular#" + str(source.index)
+            return str(source.ref) + "#" + str(source.index)
+
+        if not self.queries:
+            return ""
+        job = "*" if self.level is None else str(self.level[0])
+        return (
+            job
+            + ":"
+            + source_str(self.queries[0])
+            + ".."
+            + source_str(self.queries[-1])
+        )
+
+    def digest(self):
+        """Calculate a hash of the batch's statements and parameters.
+
+        Returns:
+            str: Hexadecimal SHA-1 digest.
+        """
+        h = hashlib.sha1()
+        for query in self.queries:
+            h.update(query.statement.encode("utf-8"))
+            h.update(
+                json.dumps(query.params, sort_keys=True, default=str).encode("utf-8")
+            )
+        return h.hexdigest()
+
+    @property
+    def is_schema(self):
+        """bool: True if the batch consists only of schema statements."""
+        return bool(self.queries) and all(q.is_schema for q in self.queries)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def __iter__(self):
+        return iter(self.queries)
+
+    def __repr__(self):
+        return (
+            "[level: "
+            + str(self.level)
+            + "\n queries: [\n"
+            + "\n".join(repr(q) for q in self.queries)
+            + "]\n]"
+        )
@@ -15,7 +15,33 @@ import warnings
 
 import six
 
-from cymod.cybase import CypherQuery, CypherQuerySource
+from cymod.cybase import CypherQuery, CypherQuerySource, SCHEMA_STATEMENT_RE
+from cymod.metrics import timer
+
+# Matches quoted strings and names, so semicolons inside them are skipped, or
+# a semicolon separating queries
+QUERY_SEPARATOR_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|;")
+
+
+def split_queries(text):
+    """Split text at the semicolons separating queries.
+
+    Semicolons inside strings and quoted names don't separate queries.
+
+    Args:
+        text (str): Queries, e.g. 'MERGE (:A {name: "a;b"}); MERGE (:B)'.
+
+    Returns:
+        list of str: The text between separators, without the semicolons.
+    """
+    parts = []
+    start = 0
+    for match in QUERY_SEPARATOR_RE.finditer(text):
+        if match.group() == ";":
+            parts.append(text[start : match.start()])
+            start = match.end()
+    parts.append(text[start:])
+    return parts
 
 
 class CypherFile(object):
@@ -24,9 +50,16 @@ class CypherFile(object):
     Multiple queries can be contained in a single file, separated by a
     semicolon.
 
+    The file is scanned when the object is created, reading its priority and
+    noting whether it contains schema statements, but its queries are only
+    parsed when `queries` is first used. The text read by the scan is kept
+    until then, so the file is only read once.
+
     Args:
         filename (str): Qualified filesystem path to the Cypher file underlying
             a CypherFile object which has been instantiated from this class.
+        metrics (:obj:`Metrics`, optional): If given, the time taken to parse
+            the file, and its size, are recorded.
 
     Attributes:
         query_start_clauses (:obj:`list` of :obj:`str`): Clauses which can
@@ -35,26 +68,68 @@ class CypherFile(object):
             beginning of the first Cypher query.
         _cached_data (tuple of :obj:`CypherQuery`): Data cache used to avoid 
             the need to re-read each time we use a CypherFile object to access 
-            data. 
+            data. None until the file is parsed.
         priority (int): Priority with which the file's queries should be loaded
             with respect to other files. Priority 0 files will be loaded first.
+        has_schema_statements (bool): True if any of the file's statements
+            create or drop an index or constraint.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, metrics=None):
         # Matches either things in quotes or //...\n. Form a group on latter
         self._comment_pattern = re.compile(
             r"\"[^\"\r\n]*\"|\"[^\"\r\n]*$|(\/\/.*(?:$|\n))"
         )
         self.filename = filename
         self.priority = 0
-        self.query_start_clauses = ["START", "MATCH", "MERGE", "CREATE"]
-        self._cached_data = self._parse_queries()
+        self.query_start_clauses = [
+            "START",
+            "MATCH",
+            "OPTIONAL",
+            "MERGE",
+            "CREATE",
+            "DROP",
+            "UNWIND",
+            "WITH",
+            "CALL",
+            "LOAD",
+            "USING",
+            "FOREACH",
+        ]
+        self.metrics = metrics
+        self._cached_data = None
+        # Parameters and query text read by `_scan`, kept until the file is
+        # parsed so it isn't read twice
+        self._scanned = None
+        self._scan()
+
+    def _scan(self):
+        """Read the file's priority and check it contains queries, without
+        parsing them."""
+        self._scanned = self._extract_parameters()
+        statements = split_queries(self._scanned[1])
+        self.has_schema_statements = any(
+            SCHEMA_STATEMENT_RE.match(s) is not None for s in statements
+        )
+        if not any(s.replace(" ", "") for s in statements):
+            warnings.warn("No queries found in " + self.filename, UserWarning)
 
     @property
     def queries(self):
         """tuple of :obj:`CypherQuery`: Cypher queries identified in file."""
-        if not (self._cached_data):
-            self._cached_data = self._parse_queries()
+        if self._cached_data is None:
+            if self.metrics is None:
+                self._cached_data = self._parse_queries()
+            else:
+                with self.metrics.time("cypher_parse_seconds"):
+                    self._cached_data = self._parse_queries()
+                self.metrics.inc("cypher_files_parsed_total")
+                self.metrics.inc(
+                    "cypher_bytes_parsed_total", os.path.getsize(self.filename)
+                )
+                self.metrics.inc(
+                    "cypher_queries_parsed_total", len(self._cached_data)
+                )
 
         return tuple(self._cached_data)
 
@@ -107,23 +182,25 @@ class CypherFile(object):
                 tuple will be None.
         """
         dat = self._remove_comments_and_newlines()
-        re_prefix = r"\s*\{[\s*\S*]*\}\s*"
-        patterns = [
-            re.compile(re_prefix + clause) for clause in self.query_start_clauses
-        ]
+        if not dat.lstrip().startswith("{"):
+            return {}, dat
 
-        for i, p in enumerate(patterns):
-            match = p.match(dat)
-            if match:
-                first_clause = self.query_start_clauses[i]
-                clause_len = len(first_clause)
-                match_len = match.end(0) - match.start(0)
-                params_end = match_len - clause_len
-                params = dat[:params_end]
-                queries = dat[params_end:]
+        # The parameters end at the first closing brace which is followed by
+        # a clause starting a query and which completes a valid JSON object.
+        header_end_re = re.compile(
+            r"\}\s*(?=(" + "|".join(self.query_start_clauses) + r")\b)",
+            re.IGNORECASE,
+        )
+        json_error = None
+        for match in header_end_re.finditer(dat):
+            params = dat[: match.start() + 1]
+            queries = dat[match.end() :]
+            try:
+                param_dict = json.loads(params)
+            except ValueError as e:
+                json_error = e
+                continue
 
-        try:
-            param_dict = json.loads(params)
             try:
                 # set priority attributre if given in file. o/w is 0.
                 self.priority = param_dict["priority"]
@@ -133,8 +210,10 @@ class CypherFile(object):
                 pass
 
             return param_dict, queries
-        except UnboundLocalError:
-            return {}, dat
+
+        if json_error is not None:
+            raise json_error
+        return {}, dat
 
     def _match_params_to_statement(self, statement, all_params):
         """Return a dict of parameter_name: parameter value pairs.
@@ -178,12 +257,15 @@ class CypherFile(object):
             dict: Parsed file contents in the form of a dictionary with a
                 structure of {params:<dict>, queries:<list of str>}
         """
-        dat = self._extract_parameters()
+        if self._scanned is None:
+            self._scanned = self._extract_parameters()
+        dat = self._scanned
+        self._scanned = None
         queries = dat[1]
         # only include non-empty strings in results (prevents whitespace at
         # end of file getting an element on its own).
         query_string_list = [
-            q.lstrip() + ";" for q in queries.split(";") if q.replace(" ", "")
+            q.lstrip() + ";" for q in split_queries(queries) if q.replace(" ", "")
         ]
 
         query_list = []
@@ -196,9 +278,6 @@ class CypherFile(object):
                 )
             )
 
-        if len(query_list) == 0:
-            warnings.warn("No queries found in " + self.filename, UserWarning)
-
         return query_list
 
     def __repr__(self):
@@ -228,14 +307,22 @@ class CypherFileFinder(object):
                 loaded into the database. E.g. if files ending '_w.cql' 
                 should be loaded, use cypher_file_suffix='_w'. Defaults to 
                 None. 
+        metrics (:obj:`Metrics`, optional): If given, the time taken to find
+            files and the number found are recorded, and passed on to each
+            :obj:`CypherFile`.
     """
 
     def __init__(
-        self, root_dir, cypher_exts=[".cypher", ".cql", ".cyp"], cypher_file_suffix=None
+        self,
+        root_dir,
+        cypher_exts=[".cypher", ".cql", ".cyp"],
+        cypher_file_suffix=None,
+        metrics=None,
     ):
         self.root_dir = root_dir
         self.cypher_exts = cypher_exts
         self.cypher_file_suffix = cypher_file_suffix
+        self.metrics = metrics
 
     def _get_cypher_files(self):
         """Get all applicable Cypher files in directory hierarchy.
@@ -245,6 +332,7 @@ class CypherFileFinder(object):
                 ready for subsequent processing.
 
         """
+        start = timer()
         fnames = []
         for dirpath, subdirs, files in os.walk(self.root_dir):
             for f in files:
@@ -257,7 +345,11 @@ class CypherFileFinder(object):
                         # if no fname_suffix specified, all all cypher files
                         fnames.append(os.path.join(dirpath, f))
 
-        return [CypherFile(f) for f in fnames]
+        if self.metrics is not None:
+            self.metrics.observe("discovery_seconds", timer() - start)
+            self.metrics.inc("files_discovered_total", len(fnames))
+
+        return [CypherFile(f, metrics=self.metrics) for f in fnames]
 
     def iterfiles(self, priority_sorted=False):
         """Yields CypherFile objects representing discovered files."""
@@ -0,0 +1,576 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.delta
+~~~~~~~~~~~
+
+This module contains classes and functions used to update a model which is
+already in the database by re-applying only the sources (Cypher files or
+chunks of tables) which have changed since it was last loaded.
+
+Each source's statements are rewritten so that every node they create or
+merge carries a label identifying the source, and every relationship a
+property identifying it. A node merged by several sources carries each of
+their labels, and is only deleted once none of them are loaded. Nodes which a
+source matches, or changes with SET or REMOVE, are recorded as links between
+sources in the manifest, so the sources depending on a changed source can be
+found without searching the database.
+"""
+import os
+import re
+import json
+import hashlib
+
+from cymod.cybase import CypherQuery, CypherQueryBatch
+from cymod.lint import (
+    mask_statement,
+    clause_spans,
+    pattern_element_spans,
+    split_top_level,
+)
+
+# Prefixes of the label and relationship property attributing data to a source
+SOURCE_LABEL_PREFIX = "CymodSource_"
+SOURCE_PROPERTY_PREFIX = "cymod_source_"
+
+# Labels briefly given to nodes a source matches or modifies, so the sources
+# they belong to can be recorded before the source's transaction commits
+TOUCHED_LABEL = "CymodTouched"
+MODIFIED_LABEL = "CymodModified"
+
+# Clauses whose effects on the graph can be attributed to a source. Others,
+# such as DELETE, CALL and FOREACH, may change data belonging to any source
+ATTRIBUTABLE_CLAUSES = frozenset(
+    [
+        "MATCH",
+        "OPTIONAL",
+        "MERGE",
+        "CREATE",
+        "SET",
+        "REMOVE",
+        "ON",
+        "WITH",
+        "UNWIND",
+        "WHERE",
+        "RETURN",
+        "ORDER",
+        "SKIP",
+        "LIMIT",
+    ]
+)
+WRITE_WORDS = frozenset(["CREATE", "MERGE", "SET", "REMOVE", "DELETE", "DETACH"])
+
+# Clauses after which the attributing SET clause can't be placed, because
+# Cypher needs a WITH between an updating clause and a following MATCH
+READING_CLAUSES = frozenset(["MATCH", "OPTIONAL", "UNWIND"])
+
+WORD_RE = re.compile(r"[A-Za-z_]\w*|[()\[\]{}]")
+VARIABLE_RE = re.compile(r"\s*(\w*)")
+ALIAS_RE = re.compile(r"\bAS\s+(\w+)", re.IGNORECASE)
+
+
+class SourceManifest(object):
+    """Record of the sources loaded for each model.
+
+    The manifest is stored as a JSON file mapping a key identifying each
+    model, derived from its global parameters, to the content digests of the
+    sources loaded for the model and the links between them (see
+    `dirty_sources`).
+
+    Args:
+        filename (str): Path of the manifest file. It needn't exist yet.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        if os.path.exists(filename):
+            with open(filename, "r") as f:
+                self._models = json.load(f)
+        else:
+            self._models = {}
+
+    def _entry(self, model_params):
+        return self._models.get(model_key(model_params), {})
+
+    def digests(self, model_params):
+        """Get the digests of the sources loaded for a model.
+
+        Args:
+            model_params (dict): Global parameters identifying the model.
+
+        Returns:
+            dict: Source id/ digest pairs. Empty if the model hasn't been
+                loaded.
+        """
+        return dict(self._entry(model_params).get("digests", {}))
+
+    def links(self, model_params):
+        """Get the links between the sources loaded for a model.
+
+        Args:
+            model_params (dict): Global parameters identifying the model.
+
+        Returns:
+            dict: Maps source ids to dicts whose 'touches' and 'modifies'
+                entries list the ids of the sources whose nodes the source
+                matched or modified.
+        """
+        return dict(self._entry(model_params).get("links", {}))
+
+    def update(self, model_params, digests, links):
+        """Replace the sources recorded for a model and save the manifest.
+
+        The file is replaced atomically, so an interrupted save leaves the
+        previous manifest intact.
+
+        Args:
+            model_params (dict): Global parameters identifying the model.
+            digests (dict): Source id/ digest pairs.
+            links (dict): Links between the sources, as returned by `links`.
+        """
+        self._models[model_key(model_params)] = {"digests": digests, "links": links}
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(self._models, f, sort_keys=True, indent=1)
+        try:
+            os.replace(tmp_filename, self.filename)
+        except AttributeError:
+            # Python 2 has no os.replace, and os.rename won't overwrite on
+            # Windows. This fallback isn't atomic: an interruption between
+            # the two calls leaves only the .tmp file
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tmp_filename, self.filename)
+
+
+def model_key(model_params):
+    """Build a string uniquely identifying a model from its parameters."""
+    return json.dumps(model_params, sort_keys=True, default=str)
+
+
+def _source_token(model_params, sid):
+    key = model_key(model_params) + "\n" + sid
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def source_label(model_params, sid):
+    """Build the label given to the nodes of a model's source."""
+    return SOURCE_LABEL_PREFIX + _source_token(model_params, sid)
+
+
+def source_property(model_params, sid):
+    """Build the property given to the relationships of a model's source."""
+    return SOURCE_PROPERTY_PREFIX + _source_token(model_params, sid)
+
+
+def source_id(batch):
+    """Build a string identifying the Cypher file a batch of queries is from.
+
+    Cypher files are identified by their file name, so adding a query to a
+    file doesn't change its identity.
+
+    Args:
+        batch (:obj:`CypherQueryBatch`): Queries from a single Cypher file.
+
+    Returns:
+        str
+    """
+    suffix = ":schema" if batch.is_schema else ""
+    return str(batch.queries[0].source.ref) + suffix
+
+
+def _query_digest(query):
+    return CypherQueryBatch([query]).digest()
+
+
+def identified_batches(sources, chunk_size):
+    """Split sources into batches identified by their content.
+
+    Each Cypher file is a single batch. Tables are split into chunks whose
+    boundaries are chosen by the content of their rows: a chunk ends after a
+    row whose digest is divisible by `chunk_size`, or once it reaches four
+    times `chunk_size` rows. Inserting or deleting a row therefore changes
+    only the chunk containing it, rather than shifting every later chunk.
+
+    Args:
+        sources (iterable of tuple): (level, queries) pairs, as yielded by
+            `GraphLoader._itersources` with tables unsplit.
+        chunk_size (int): Average number of table rows in each chunk.
+
+    Yields:
+        tuple of str and :obj:`CypherQueryBatch`: Source id/ batch pairs.
+            Table chunks are identified by the job they belong to and the
+            digest of their first row.
+    """
+    seen = {}
+
+    def table_batch(level, chunk, first_digest):
+        sid = "{0}:tabular@{1}".format(level[0], first_digest[:12])
+        # Chunks starting with the same row are told apart by their order
+        seen[sid] = seen.get(sid, 0) + 1
+        if seen[sid] > 1:
+            sid += "#" + str(seen[sid] - 1)
+        return sid, CypherQueryBatch(chunk, level)
+
+    for level, queries in sources:
+        chunk = []
+        first_digest = None
+        for query in queries:
+            if query.source is None or query.source.ref_type != "tabular":
+                chunk.append(query)
+                continue
+            digest = _query_digest(query)
+            if not chunk:
+                first_digest = digest
+            chunk.append(query)
+            if int(digest, 16) % chunk_size == 0 or len(chunk) >= 4 * chunk_size:
+                yield table_batch(level, chunk, first_digest)
+                chunk = []
+        if not chunk:
+            continue
+        if first_digest is None:
+            batch = CypherQueryBatch(chunk, level)
+            yield source_id(batch), batch
+        else:
+            yield table_batch(level, chunk, first_digest)
+
+
+def plan_delta(previous, current):
+    """Compare the sources previously loaded for a model with current ones.
+
+    Args:
+        previous (dict): Source id/ digest pairs recorded when the model was
+            last loaded.
+        current (dict): Source id/ digest pairs for the sources to load now.
+
+    Returns:
+        tuple of set: The ids of sources which are new or have changed, and
+            the ids of sources which are no longer loaded.
+    """
+    changed = set(k for k, v in current.items() if previous.get(k) != v)
+    removed = set(previous) - set(current)
+    return changed, removed
+
+
+def dirty_sources(initial, links):
+    """Find the sources whose data must be deleted along with given sources.
+
+    A source depends on another if it matched one of the other's nodes, so
+    may have connected relationships to it or copied its properties. It must
+    be deleted and re-applied along with the other. A source which modified
+    another's nodes makes the other dirty in turn, so the modified nodes are
+    recreated without its changes.
+
+    Args:
+        initial (set of str): Ids of sources which have changed or been
+            removed.
+        links (dict): Links between the loaded sources, as returned by
+            :obj:`SourceManifest.links`.
+
+    Returns:
+        set of str: Ids of `initial` sources and the sources depending on
+            them.
+    """
+    touched_by = {}
+    for sid, link in links.items():
+        for other in link["touches"]:
+            touched_by.setdefault(other, set()).add(sid)
+
+    dirty = set(initial)
+    frontier = set(initial)
+    while frontier:
+        found = set()
+        for sid in frontier:
+            found |= touched_by.get(sid, set())
+            found.update(links.get(sid, {}).get("modifies", ()))
+        frontier = found - dirty
+        dirty |= frontier
+    return dirty
+
+
+def _nested_write(masked):
+    """Check whether a masked statement writes inside brackets, e.g. in a
+    FOREACH or CALL subquery."""
+    depth = 0
+    for match in WORD_RE.finditer(masked):
+        token = match.group()
+        if token in ("(", "[", "{"):
+            depth += 1
+        elif token in (")", "]", "}"):
+            depth -= 1
+        elif (
+            depth > 0
+            and token.upper() in WRITE_WORDS
+            and masked[: match.start()].rstrip()[-1:] != "."
+        ):
+            return True
+    return False
+
+
+def _clause_groups(spans):
+    """Group clauses with the WHERE, ON and similar clauses qualifying them."""
+    groups = []
+    for span in spans:
+        keyword = span[0]
+        qualifies = keyword in ("WHERE", "ON", "ORDER", "SKIP", "LIMIT") or (
+            keyword == "SET" and groups and groups[-1][-1][0] == "ON"
+        )
+        if qualifies and groups:
+            groups[-1].append(span)
+        else:
+            groups.append([span])
+    return groups
+
+
+def provenance_statement(statement, label, prop):
+    """Rewrite a statement so the data it writes is attributed to a source.
+
+    SET clauses are added giving the nodes which the statement creates or
+    merges `label`, and the relationships `prop`. Nodes which it matches are
+    given `label` and :obj:`TOUCHED_LABEL`, and those it changes with SET or
+    REMOVE :obj:`MODIFIED_LABEL`. Anonymous nodes and relationships are named
+    so they can be referred to.
+
+    Changes to the properties of relationships created by other sources
+    aren't recorded.
+
+    Args:
+        statement (str): Cypher statement.
+        label (str): Label identifying the source.
+        prop (str): Relationship property identifying the source.
+
+    Returns:
+        str: The rewritten statement, or None if the statement's effects
+            can't be attributed, e.g. because it deletes data, calls a
+            procedure or writes inside a subquery or FOREACH.
+    """
+    masked = mask_statement(statement)
+    spans = clause_spans(masked)
+    if any(span[0] not in ATTRIBUTABLE_CLAUSES for span in spans):
+        return None
+    if _nested_write(masked):
+        return None
+
+    kinds = {}
+    aliases = set()
+    names = []
+    inserts = []
+    pending = []
+    owner = ":`" + label + "`"
+    touched = owner + ":`" + TOUCHED_LABEL + "`"
+    modified = ":`" + MODIFIED_LABEL + "`"
+    flag = ".`" + prop + "` = true"
+
+    def element_variable(open_index, close_index, name_anonymous=True):
+        match = VARIABLE_RE.match(masked, open_index + 1, close_index)
+        if match.group(1):
+            return statement[match.start(1) : match.end(1)]
+        if not name_anonymous:
+            return None
+        name = "cymod_e" + str(len(names))
+        names.append((open_index + 1, name))
+        return name
+
+    def flush(index, last):
+        if pending:
+            items = "SET " + ", ".join(pending)
+            inserts.append((index, " " + items if last else items + " "))
+            del pending[:]
+
+    def modified_targets(body_start, end):
+        """Mark the nodes changed by SET or REMOVE items as modified."""
+        offset = body_start
+        for item in split_top_level(masked[body_start:end]):
+            match = VARIABLE_RE.match(masked, offset)
+            offset += len(item) + 1
+            var = statement[match.start(1) : match.end(1)]
+            if kinds.get(var) == "node":
+                pending.append(var + modified)
+            elif kinds.get(var) != "relationship":
+                return False
+        return True
+
+    groups = _clause_groups(spans)
+    for group_index, group in enumerate(groups):
+        keyword, start, body_start, end = group[0]
+        body = masked[body_start:end]
+        if keyword not in READING_CLAUSES:
+            flush(start, False)
+
+        if keyword in ("MATCH", "OPTIONAL", "MERGE", "CREATE"):
+            reading = keyword in ("MATCH", "OPTIONAL")
+            for kind, open_index, close_index in pattern_element_spans(
+                masked, body_start, end
+            ):
+                is_node = kind == "node"
+                var = element_variable(
+                    open_index, close_index, name_anonymous=is_node or not reading
+                )
+                if var is None or var in kinds:
+                    continue
+                if var in aliases:
+                    # Bound by WITH or UNWIND, so what it refers to is unknown
+                    return None
+                kinds[var] = kind
+                if reading:
+                    if is_node:
+                        pending.append(var + touched)
+                elif is_node:
+                    pending.append(var + owner)
+                else:
+                    pending.append(var + flag)
+
+        if keyword in ("SET", "REMOVE"):
+            if not modified_targets(body_start, end):
+                return None
+
+        if keyword in ("WITH", "UNWIND"):
+            for alias in ALIAS_RE.findall(body):
+                aliases.add(alias)
+                kinds.pop(alias, None)
+
+        on_match = False
+        for qualifier, _, qualifier_body_start, qualifier_end in group[1:]:
+            if qualifier == "ON":
+                qualifier_body = masked[qualifier_body_start:qualifier_end]
+                on_match = qualifier_body.strip().upper() == "MATCH"
+            elif qualifier == "SET" and on_match:
+                if not modified_targets(qualifier_body_start, qualifier_end):
+                    return None
+
+    flush(spans[-1][3] if spans else len(statement), True)
+
+    for index, text in sorted(names + inserts, reverse=True):
+        statement = statement[:index] + text + statement[index:]
+    return statement
+
+
+def attributed_queries(queries, model_params, sid):
+    """Rewrite a source's queries so the data they write is attributed to it.
+
+    Args:
+        queries (iterable of :obj:`CypherQuery`)
+        model_params (dict): Global parameters identifying the model.
+        sid (str): Id of the source.
+
+    Returns:
+        list of :obj:`CypherQuery`
+
+    Raises:
+        ValueError: If a query's effects can't be attributed to the source.
+    """
+    label = source_label(model_params, sid)
+    prop = source_property(model_params, sid)
+    attributed = []
+    for query in queries:
+        statement = provenance_statement(query.statement, label, prop)
+        if statement is None:
+            raise ValueError(
+                "Statements which delete data, call procedures or write inside "
+                "subqueries can't be used in delta loads:\n" + query.statement
+            )
+        attributed.append(CypherQuery(statement, query.params, query.source))
+    return attributed
+
+
+def linked_labels_query(link_label):
+    """Build a query finding the source labels of nodes given a link label.
+
+    The link label is removed from the nodes. The query returns each source
+    label as `label`.
+
+    Args:
+        link_label (str): :obj:`TOUCHED_LABEL` or :obj:`MODIFIED_LABEL`.
+
+    Returns:
+        :obj:`CypherQuery`
+    """
+    return CypherQuery(
+        "MATCH (n:`{0}`) REMOVE n:`{0}` "
+        "WITH n UNWIND labels(n) AS label RETURN DISTINCT label".format(link_label),
+        params={},
+    )
+
+
+def release_relationships_query(model_params, sid, batch_size=10000):
+    """Build a query detaching a batch of relationships from a source.
+
+    The query returns the id and remaining property keys of each
+    relationship as `id` and `keys`, so those no longer belonging to any
+    source can be deleted with `delete_by_id_query`.
+
+    Args:
+        model_params (dict): Global parameters identifying the model.
+        sid (str): Id of the source.
+        batch_size (int): Maximum number of relationships to detach.
+
+    Returns:
+        :obj:`CypherQuery`
+    """
+    return CypherQuery(
+        "MATCH (n:`{0}`)-[r]-() WHERE r.`{1}` IS NOT NULL "
+        "WITH DISTINCT r LIMIT $batch_size REMOVE r.`{1}` "
+        "RETURN id(r) AS id, keys(r) AS keys".format(
+            source_label(model_params, sid), source_property(model_params, sid)
+        ),
+        params={"batch_size": batch_size},
+    )
+
+
+def release_nodes_query(model_params, sid, batch_size=10000):
+    """Build a query detaching a batch of nodes from a source.
+
+    The query returns the id and remaining labels of each node as `id` and
+    `keys`, so those no longer belonging to any source can be deleted with
+    `delete_by_id_query`.
+
+    Args:
+        model_params (dict): Global parameters identifying the model.
+        sid (str): Id of the source.
+        batch_size (int): Maximum number of nodes to detach.
+
+    Returns:
+        :obj:`CypherQuery`
+    """
+    return CypherQuery(
+        "MATCH (n:`{0}`) WITH n LIMIT $batch_size REMOVE n:`{0}` "
+        "RETURN id(n) AS id, labels(n) AS keys".format(
+            source_label(model_params, sid)
+        ),
+        params={"batch_size": batch_size},
+    )
+
+
+def orphans(records, prefix):
+    """Find the ids of released items which no longer belong to any source.
+
+    Args:
+        records (iterable): Records returned by `release_nodes_query` or
+            `release_relationships_query`.
+        prefix (str): :obj:`SOURCE_LABEL_PREFIX` for nodes or
+            :obj:`SOURCE_PROPERTY_PREFIX` for relationships.
+
+    Returns:
+        list of int
+    """
+    return [
+        record["id"]
+        for record in records
+        if not any(key.startswith(prefix) for key in record["keys"])
+    ]
+
+
+def delete_by_id_query(ids, relationships=False):
+    """Build a query deleting nodes or relationships by their ids.
+
+    Args:
+        ids (list of int)
+        relationships (bool): If True, delete relationships rather than nodes.
+
+    Returns:
+        :obj:`CypherQuery`
+    """
+    if relationships:
+        statement = "MATCH ()-[r]->() WHERE id(r) IN $ids DELETE r"
+    else:
+        statement = "MATCH (n) WHERE id(n) IN $ids DETACH DELETE n"
+    return CypherQuery(statement, params={"ids": ids})
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.export
+~~~~~~~~~~~~
+
+This module contains classes and functions used to write model data to files
+which can be loaded into Neo4j without cymod, for example by the offline
+`neo4j-admin database import` tool.
+"""
+from __future__ import print_function
+
+import os
+import csv
+import json
+import numbers
+import hashlib
+import warnings
+
+import six
+
+from cymod.cybase import cypher_literal
+from cymod.tabproc import TransTableProcessor
+
+
+def _property_type(value):
+    """Name the neo4j-admin import type of a property value.
+
+    Returns:
+        str: Type suffix for a CSV header field, empty for strings.
+    """
+    if isinstance(value, bool) or type(value).__name__ == "bool_":
+        return ":boolean"
+    if isinstance(value, numbers.Integral):
+        return ":int"
+    if isinstance(value, numbers.Real):
+        return ":float"
+    return ""
+
+
+def _csv_value(value):
+    if isinstance(value, bool) or type(value).__name__ == "bool_":
+        return "true" if value else "false"
+    return six.text_type(value)
+
+
+def _params_conflict(query, block_params):
+    """Check whether a query needs a different value for a parameter than
+    earlier queries in its block."""
+    for name, value in (query.params or {}).items():
+        if name in block_params and block_params[name] != value:
+            return True
+    return False
+
+
+def iter_transaction_blocks(queries, tx_size=1000, split_params=False):
+    """Group queries into the transactions a script should run them in.
+
+    Schema statements can't share a transaction with data statements, so a
+    new block is started whenever a query's kind differs from the last one.
+    Statements which need an auto-commit transaction (see
+    :obj:`CypherQuery.needs_auto_commit`) are put in blocks of their own.
+
+    Args:
+        queries (iterable of :obj:`CypherQuery`)
+        tx_size (int): Maximum number of queries in each block.
+        split_params (bool): If True, a new block is also started whenever a
+            query needs a different value for a parameter than an earlier
+            query in the block, so each block's parameters can be set before
+            it starts. Defaults to False.
+
+    Yields:
+        list of :obj:`CypherQuery`
+    """
+    block = []
+    block_kind = None
+    block_params = {}
+    for query in queries:
+        auto_commit = query.needs_auto_commit
+        kind = (query.is_schema, auto_commit)
+        if block and (
+            len(block) >= tx_size
+            or kind != block_kind
+            or auto_commit
+            or (split_params and _params_conflict(query, block_params))
+        ):
+            yield block
+            block = []
+            block_params = {}
+        block.append(query)
+        block_kind = kind
+        if split_params:
+            block_params.update(query.params or {})
+    if block:
+        yield block
+
+
+def write_transaction_block(f, statements, explicit=True):
+    """Write statements to a script file as a single explicit transaction.
+
+    The transaction is delimited by ':begin' and ':commit' lines, as
+    understood by cypher-shell, and each statement is terminated by a
+    semicolon and a new line.
+
+    Args:
+        f (file): File open for writing.
+        statements (iterable of str)
+        explicit (bool): If False, the ':begin' and ':commit' lines are left
+            out, so cypher-shell runs each statement in an auto-commit
+            transaction. Defaults to True.
+    """
+    if explicit:
+        f.write(":begin\n")
+    for statement in statements:
+        statement = statement.strip()
+        if not statement.endswith(";"):
+            statement += ";"
+        f.write(statement + "\n")
+    if explicit:
+        f.write(":commit\n")
+
+
+def export_cypher_shell_script(loader, filename, tx_size=1000, buffer_size=65536):
+    """Write a loader's queries to a script which can be run by cypher-shell.
+
+    Queries keep their parameter placeholders, and are grouped into ':begin'/
+    ':commit' blocks of at most `tx_size` queries. Parameter values are set by
+    ':param' directives before each block, for values which differ from those
+    already set. A block only ends early when one of its queries needs a
+    different value for a parameter than an earlier query in the block.
+    Statements which manage their own transactions, such as LOAD CSV with
+    CALL { ... } IN TRANSACTIONS, are written outside any block so
+    cypher-shell auto-commits them. The script can be run with e.g.
+    `cypher-shell -f script.cypher`.
+
+    Args:
+        loader (:obj:`GraphLoader`): Loader whose queries are exported.
+        filename (str): Path of the script file to write.
+        tx_size (int): Maximum number of queries in each transaction.
+            Defaults to 1000.
+        buffer_size (int): Size in bytes of the file's write buffer.
+            Defaults to 65536.
+
+    Returns:
+        int: The number of queries written.
+    """
+    count = 0
+    current = {}
+    with open(filename, "w", buffer_size) as f:
+        blocks = iter_transaction_blocks(
+            loader.iterqueries(), tx_size, split_params=True
+        )
+        for block in blocks:
+            params = {}
+            for query in block:
+                params.update(query.params or {})
+            for name in sorted(params):
+                if name not in current or current[name] != params[name]:
+                    # The arrow syntax is understood by cypher-shell 4 and 5
+                    f.write(
+                        ":param {0} => {1}\n".format(
+                            name, cypher_literal(params[name])
+                        )
+                    )
+                    current[name] = params[name]
+            write_transaction_block(
+                f,
+                [q.statement for q in block],
+                explicit=not block[0].needs_auto_commit,
+            )
+            count += len(block)
+    return count
+
+
+class AdminImportWriter(object):
+    """Streams nodes and relationships to CSV files for neo4j-admin import.
+
+    Nodes with the same label and property names are written to the same
+    file, named e.g. 'nodes_State.csv', and relationships to a file per type,
+    e.g. 'relationships_CAUSES.csv'. Each node is given an ID derived from its
+    label and the properties identifying it, so the same model always produces
+    the same IDs. Entities which have already been written are skipped, so
+    only the set of IDs is held in memory.
+
+    Args:
+        directory (str): Directory to write the CSV files to. Created if it
+            doesn't exist.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._node_files = {}
+        self._rel_files = {}
+        self._node_ids = set()
+        self._rels = set()
+
+    def node_id(self, label, key):
+        """Build the stable import ID of a node.
+
+        Args:
+            label (str): Label of the node.
+            key: JSON serialisable value identifying the node among nodes with
+                the same label.
+
+        Returns:
+            str
+        """
+        digest = hashlib.sha1(
+            json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+        return label + ":" + digest[:20]
+
+    def _open(self, name, header):
+        """Create a CSV file and write its header.
+
+        Returns:
+            tuple: The file's path, file object and CSV writer.
+        """
+        filename = os.path.join(self.directory, name)
+        f = open(filename, "w")
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(header)
+        return filename, f, writer
+
+    def add_node(self, label, properties, key=None):
+        """Write a node, unless a node with the same ID has been written.
+
+        Args:
+            label (str): Label of the node.
+            properties (dict): Property name/ value pairs.
+            key (optional): JSON serialisable value identifying the node among
+                nodes with the same label. Defaults to `properties`.
+
+        Returns:
+            str: The node's import ID.
+        """
+        node_id = self.node_id(label, properties if key is None else key)
+        if node_id in self._node_ids:
+            return node_id
+        self._node_ids.add(node_id)
+
+        names = sorted(properties)
+        header = [":ID"] + [n + _property_type(properties[n]) for n in names]
+        header.append(":LABEL")
+        # Nodes sharing a label but with different properties need their own
+        # header, so go in a separate file
+        file_key = (label, tuple(header))
+        if file_key not in self._node_files:
+            same_label = [k for k in self._node_files if k[0] == label]
+            suffix = "_{0}".format(len(same_label)) if same_label else ""
+            self._node_files[file_key] = self._open(
+                "nodes_" + label + suffix + ".csv", header
+            )
+
+        writer = self._node_files[file_key][2]
+        writer.writerow(
+            [node_id] + [_csv_value(properties[n]) for n in names] + [label]
+        )
+        return node_id
+
+    def add_relationship(self, start_id, rel_type, end_id):
+        """Write a relationship, unless an identical one has been written.
+
+        Args:
+            start_id (str): Import ID of the start node.
+            rel_type (str): Type of the relationship.
+            end_id (str): Import ID of the end node.
+        """
+        rel = (start_id, rel_type, end_id)
+        if rel in self._rels:
+            return
+        self._rels.add(rel)
+        if rel_type not in self._rel_files:
+            self._rel_files[rel_type] = self._open(
+                "relationships_" + rel_type + ".csv",
+                [":START_ID", ":END_ID", ":TYPE"],
+            )
+        self._rel_files[rel_type][2].writerow([start_id, end_id, rel_type])
+
+    @property
+    def node_files(self):
+        """list of str: Paths of the node CSV files written."""
+        return sorted(entry[0] for entry in self._node_files.values())
+
+    @property
+    def relationship_files(self):
+        """list of str: Paths of the relationship CSV files written."""
+        return sorted(entry[0] for entry in self._rel_files.values())
+
+    def import_command(self, database="neo4j"):
+        """Build the neo4j-admin command which imports the written files.
+
+        Args:
+            database (str): Name of the database to create.
+
+        Returns:
+            str
+        """
+        args = ["neo4j-admin", "database", "import", "full"]
+        args += ["--nodes=" + f for f in self.node_files]
+        args += ["--relationships=" + f for f in self.relationship_files]
+        args.append(database)
+        return " ".join(args)
+
+    def close(self):
+        for files in [self._node_files, self._rel_files]:
+            for entry in files.values():
+                entry[1].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export_transition_table(writer, processor):
+    """Write the graph a :obj:`TransTableProcessor` describes for import.
+
+    Produces the same nodes and relationships as loading the processor's
+    queries into an empty database.
+
+    Args:
+        writer (:obj:`AdminImportWriter`)
+        processor (:obj:`TransTableProcessor`)
+    """
+    global_params = processor.global_params or {}
+    labels = processor.labels
+    state_cols = [processor.start_state_col, processor.end_state_col]
+    for _, row in processor.df.iterrows():
+        state_ids = []
+        for col in state_cols:
+            props = dict(global_params)
+            # States' codes are always strings in the generated queries
+            props["code"] = six.text_type(row[col])
+            state_ids.append(writer.add_node(labels.state, props))
+
+        trans_id = writer.add_node(
+            labels.transition, dict(global_params), key=state_ids
+        )
+        writer.add_relationship(trans_id, "SOURCE", state_ids[0])
+        writer.add_relationship(trans_id, "TARGET", state_ids[1])
+
+        cond_props = row.drop(state_cols).to_dict()
+        cond_props.update(global_params)
+        cond_id = writer.add_node(
+            labels.condition, cond_props, key=[cond_props, trans_id]
+        )
+        writer.add_relationship(cond_id, "CAUSES", trans_id)
+
+
+def export_environ_transitions(
+    writer, transition_set, model_params, state_label="LandCoverType"
+):
+    """Write the graph an :obj:`EnvironTransitionSet` describes for import.
+
+    The Cypher files written by the transition set expect state nodes to
+    exist already, so state nodes with just a code and the model parameters
+    are written too. Any other properties they need must be set after the
+    import.
+
+    Args:
+        writer (:obj:`AdminImportWriter`)
+        transition_set (:obj:`EnvironTransitionSet`)
+        model_params (dict): Global parameters, e.g. {'model_ID': 1}, given
+            to every node.
+        state_label (str): Label of the state nodes. Defaults to
+            'LandCoverType'.
+    """
+    for trans in transition_set.transitions:
+        state_ids = []
+        for code in [trans.start_state, trans.end_state]:
+            props = dict(model_params)
+            props["code"] = six.text_type(code)
+            state_ids.append(writer.add_node(state_label, props))
+
+        traj_id = writer.add_node(
+            "SuccessionTrajectory", dict(model_params), key=state_ids
+        )
+        writer.add_relationship(traj_id, "SOURCE", state_ids[0])
+        writer.add_relationship(traj_id, "TARGET", state_ids[1])
+
+        cond_props = dict(trans.env_conds)
+        cond_props["delta_t"] = trans.time
+        cond_props.update(model_params)
+        cond_id = writer.add_node("EnvironCondition", cond_props)
+        writer.add_relationship(cond_id, "CAUSES", traj_id)
+
+
+def export_admin_import(loader, directory, transition_sets=None):
+    """Write a loader's tabular data as neo4j-admin import CSV files.
+
+    Args:
+        loader (:obj:`GraphLoader`): Loader whose tabular jobs are exported.
+            Cypher file jobs can't be exported and are skipped with a warning.
+        directory (str): Directory to write the CSV files to.
+        transition_sets (list of tuple, optional): (transition set, model
+            parameters) pairs to export alongside the loader's jobs.
+
+    Returns:
+        :obj:`AdminImportWriter`: The closed writer, from which the written
+            files and import command can be obtained.
+    """
+    with AdminImportWriter(directory) as writer:
+        for load_job in loader._load_job_queue:
+            if isinstance(load_job, TransTableProcessor):
+                export_transition_table(writer, load_job)
+            else:
+                warnings.warn(
+                    "Cypher file jobs can't be exported for neo4j-admin import,"
+                    + " skipping {0}".format(load_job)
+                )
+        for transition_set, model_params in transition_sets or []:
+            export_environ_transitions(writer, transition_set, model_params)
+    return writer
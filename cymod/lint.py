@@ -0,0 +1,613 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.lint
+~~~~~~~~~~
+
+This module contains a linter which flags Cypher statements in model files
+likely to make loads slow, without needing a database::
+
+    python -m cymod lint path/to/model
+
+Statements are checked for:
+
+- cartesian-product: MATCH patterns which share no variables, so every
+  combination of their matches is produced. Patterns which look up a node by
+  its label and key properties are expected to match few nodes, so are only
+  flagged when at least two disconnected parts aren't looked up this way.
+- merge-without-key: MERGE on a node without a label or key properties, so no
+  index can be used to find an existing node.
+- unbounded-path: variable-length relationships without an upper bound.
+- literal-values: statements differing only in their literal values, which
+  are planned separately rather than sharing a cached plan, as they would if
+  the values were parameters.
+- repeated-statement: statements (with the same parameters) which appear more
+  than once in the model.
+
+Statements are analysed with regular expressions rather than a full Cypher
+parser, so unusual statements may be misjudged.
+"""
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import argparse
+from collections import namedtuple, OrderedDict
+
+from cymod.cyproc import CypherFileFinder
+from cymod.profiling import statement_template
+
+RULES = (
+    "cartesian-product",
+    "merge-without-key",
+    "unbounded-path",
+    "literal-values",
+    "repeated-statement",
+)
+
+LintIssue = namedtuple("LintIssue", ["source", "rule", "message"])
+
+# Keywords starting the clauses statements are split into
+CLAUSE_KEYWORDS = frozenset(
+    [
+        "MATCH",
+        "OPTIONAL",
+        "MERGE",
+        "CREATE",
+        "WITH",
+        "UNWIND",
+        "WHERE",
+        "RETURN",
+        "SET",
+        "DELETE",
+        "DETACH",
+        "REMOVE",
+        "ON",
+        "CALL",
+        "YIELD",
+        "FOREACH",
+        "LOAD",
+        "UNION",
+        "ORDER",
+        "SKIP",
+        "LIMIT",
+    ]
+)
+
+# Words which continue the clause started by the preceding word rather than
+# starting another, e.g. OPTIONAL MATCH, ON CREATE, ON MATCH and STARTS WITH
+CONTINUATIONS = {
+    "MATCH": ("OPTIONAL", "ON"),
+    "CREATE": ("ON",),
+    "DELETE": ("DETACH",),
+    "WITH": ("STARTS", "ENDS", "CSV"),
+}
+
+STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`")
+TOKEN_RE = re.compile(r"[A-Za-z_]\w*|[()\[\]{}]")
+NODE_RE = re.compile(r"\s*(\w*)\s*((?:[:|&!]\s*\w+\s*)*)(.*)$", re.DOTALL)
+LENGTH_RE = re.compile(r"\*\s*(\d*)\s*(\.\.\s*(\d*))?")
+PROPERTY_KEY_RE = re.compile(r"\w+\s*:")
+PARAMETER_RE = re.compile(r"\$\w+")
+LABEL_RE = re.compile(r"`([^`]*)`|(\w+)")
+REFERENCE_RE = re.compile(r"(?<![\w.$])([A-Za-z_]\w*)\b(?!\s*\()")
+AS_RE = re.compile(r"\bAS\s+(\w+)\s*$", re.IGNORECASE)
+VALUE_WORDS = frozenset(["true", "false", "null", "and", "or", "xor", "not", "in"])
+
+BRACKETS = {"(": ")", "[": "]", "{": "}"}
+
+
+def mask_statement(statement):
+    """Blank out strings and quoted names so their contents can't be mistaken
+    for Cypher syntax.
+
+    Every character keeps its position, so offsets found in the masked
+    statement can be used in the original.
+
+    Args:
+        statement (str): Cypher statement.
+
+    Returns:
+        str
+    """
+
+    def replace(match):
+        text = match.group()
+        if text.startswith("`"):
+            return "_" + re.sub(r"\W", "_", text[1:-1]) + "_"
+        return text[0] + " " * (len(text) - 2) + text[-1]
+
+    return STRING_RE.sub(replace, statement)
+
+
+def _closing(text, start):
+    """Find the index of the bracket closing the one at `start`."""
+    depth = 0
+    for i in range(start, len(text)):
+        c = text[i]
+        if c in BRACKETS:
+            depth += 1
+        elif c in ")]}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(text)
+
+
+def split_top_level(text, separator=","):
+    """Split text at separators which aren't inside brackets."""
+    parts = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(text):
+        if c in BRACKETS:
+            depth += 1
+        elif c in ")]}":
+            depth -= 1
+        elif c == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def clause_spans(masked):
+    """Find the clauses of a masked statement (see `mask_statement`).
+
+    Only clauses outside brackets are found, so not those inside e.g.
+    FOREACH or CALL subqueries.
+
+    Args:
+        masked (str): Masked Cypher statement.
+
+    Returns:
+        list of tuple: (keyword, start, body start, end) for each clause,
+            e.g. ('MATCH', 0, 5, 11) for 'MATCH (n:A)'. The keyword of
+            OPTIONAL MATCH is 'OPTIONAL'. The last clause ends before any
+            trailing semicolon.
+    """
+    spans = []
+    depth = 0
+    previous = None
+    keyword, start, body_start = None, 0, 0
+    for match in TOKEN_RE.finditer(masked):
+        token = match.group()
+        if token in BRACKETS:
+            depth += 1
+        elif token in ")]}":
+            depth -= 1
+        elif depth == 0:
+            word = token.upper()
+            if word in CLAUSE_KEYWORDS and previous not in CONTINUATIONS.get(
+                word, ()
+            ):
+                if keyword is not None:
+                    spans.append((keyword, start, body_start, match.start()))
+                keyword, start, body_start = word, match.start(), match.end()
+            previous = word
+    if keyword is not None:
+        end = len(masked.rstrip().rstrip(";"))
+        spans.append((keyword, start, body_start, end))
+    return spans
+
+
+def _clauses(statement):
+    """Split a masked statement into clauses.
+
+    Returns:
+        list of tuple: (keyword, body) pairs, e.g. ('MATCH', '(n:A)'). The
+            keyword of OPTIONAL MATCH is 'OPTIONAL'.
+    """
+    return [
+        (keyword, statement[body_start:end])
+        for keyword, _, body_start, end in clause_spans(statement)
+    ]
+
+
+def _references(text):
+    """Find the variables referred to by a property map or expression."""
+    text = PROPERTY_KEY_RE.sub(" ", PARAMETER_RE.sub(" ", text))
+    return set(
+        name for name in REFERENCE_RE.findall(text) if name.lower() not in VALUE_WORDS
+    )
+
+
+class _Node(object):
+    def __init__(self, text):
+        var, labels, rest = NODE_RE.match(text).groups()
+        self.var = var
+        self.labels = labels.strip()
+        rest = rest.strip()
+        self.has_key = rest.startswith("$") or (
+            rest.startswith("{") and bool(PROPERTY_KEY_RE.search(rest))
+        )
+        self.references = _references(rest) if rest.startswith("{") else set()
+        self.text = "(" + text.strip() + ")"
+
+
+class _Relationship(object):
+    def __init__(self, text):
+        var, _, rest = NODE_RE.match(text).groups()
+        self.var = var
+        self.unbounded = False
+        length = LENGTH_RE.search(rest.split("{")[0])
+        if length:
+            lower, has_range, upper = length.groups()
+            self.unbounded = not upper if has_range else not lower
+        self.references = _references(rest[rest.find("{") :]) if "{" in rest else set()
+        self.text = "[" + text.strip() + "]"
+
+
+def pattern_element_spans(masked, start=0, end=None):
+    """Find the node and relationship patterns in part of a masked statement.
+
+    Args:
+        masked (str): Masked Cypher statement, see `mask_statement`.
+        start (int): Index the patterns start at. Defaults to 0.
+        end (int, optional): Index the patterns end at. Defaults to the end
+            of the statement.
+
+    Returns:
+        list of tuple: (kind, open, close) for each element, where kind is
+            'node' or 'relationship' and open and close are the indexes of
+            its brackets.
+    """
+    end = len(masked) if end is None else end
+    spans = []
+    # Last character other than whitespace, which tells node patterns from
+    # function calls and relationship patterns from list indexes
+    before = ""
+    i = start
+    while i < end:
+        c = masked[i]
+        if c == "(" and not (before.isalnum() or before == "_"):
+            close = _closing(masked, i)
+            spans.append(("node", i, close))
+            i = close
+        elif c == "[" and before == "-":
+            close = _closing(masked, i)
+            spans.append(("relationship", i, close))
+            i = close
+        elif c == "{":
+            i = _closing(masked, i)
+        if i < len(masked) and not masked[i].isspace():
+            before = masked[i]
+        i += 1
+    return spans
+
+
+def _pattern_elements(pattern):
+    """Find the node and relationship patterns in a pattern.
+
+    Returns:
+        tuple of list: :obj:`_Node` and :obj:`_Relationship` objects.
+    """
+    nodes, rels = [], []
+    for kind, open_index, close_index in pattern_element_spans(pattern):
+        text = pattern[open_index + 1 : close_index]
+        if kind == "node":
+            nodes.append(_Node(text))
+        else:
+            rels.append(_Relationship(text))
+    return nodes, rels
+
+
+def written_labels(statement):
+    """Find the labels of nodes a statement may create.
+
+    Only the node patterns of CREATE and MERGE clauses outside brackets are
+    considered, so not those inside e.g. FOREACH or CALL subqueries.
+
+    Args:
+        statement (str): Cypher statement.
+
+    Returns:
+        set of str: e.g. set(['A', 'B']) for 'MATCH (c:C) MERGE (:A:B)-[:R]->(c)'.
+    """
+    masked = mask_statement(statement)
+    labels = set()
+    for keyword, _, body_start, end in clause_spans(masked):
+        if keyword not in ("CREATE", "MERGE"):
+            continue
+        for kind, open_index, close_index in pattern_element_spans(
+            masked, body_start, end
+        ):
+            if kind != "node":
+                continue
+            # Labels are read from the statement itself, where quoted names
+            # haven't been masked
+            match = NODE_RE.match(masked, open_index + 1, close_index)
+            text = statement[match.start(2) : match.end(2)]
+            labels.update(a or b for a, b in LABEL_RE.findall(text))
+    return labels
+
+
+class _StatementChecker(object):
+    """Checks a single statement, clause by clause."""
+
+    def __init__(self, statement):
+        self.clauses = _clauses(mask_statement(statement))
+        self.problems = []
+        # Variables in scope, and those bound before the MATCH clauses of the
+        # current query part (by earlier parts, UNWIND, LOAD CSV or YIELD)
+        self.scope = set()
+        self.anchor = set()
+        # (variables, looked up by key) pairs for the patterns matched in the
+        # current query part
+        self.matched = []
+        self.anonymous = 0
+
+    def check(self):
+        for keyword, body in self.clauses:
+            handler = getattr(self, "_" + keyword.lower(), None)
+            if handler is not None:
+                handler(body)
+        self._end_part()
+        return self.problems
+
+    def _elements(self, body):
+        """Parse a clause's patterns, checking their relationships' lengths.
+
+        Yields:
+            tuple: (nodes, relationships, variables) for each pattern.
+        """
+        for pattern in split_top_level(body):
+            pattern = re.sub(r"^\s*\w+\s*=", "", pattern)
+            nodes, rels = _pattern_elements(pattern)
+            variables = set()
+            for element in nodes + rels:
+                if not element.var:
+                    self.anonymous += 1
+                    element.var = " anonymous{0}".format(self.anonymous)
+                variables.add(element.var)
+                variables |= element.references
+            for rel in rels:
+                if rel.unbounded:
+                    self.problems.append(
+                        (
+                            "unbounded-path",
+                            "Variable-length relationship {0} has no upper "
+                            "bound".format(rel.text),
+                        )
+                    )
+            yield nodes, rels, variables
+
+    def _match(self, body):
+        for nodes, _, variables in self._elements(body):
+            keyed = any(node.labels and node.has_key for node in nodes)
+            self.matched.append((variables, keyed))
+            self.scope |= variables
+
+    def _optional(self, body):
+        for _, _, variables in self._elements(body):
+            self.scope |= variables
+
+    def _merge(self, body):
+        for nodes, rels, variables in self._elements(body):
+            # The rest of a pattern with a node bound by an earlier clause is
+            # found by expanding from that node, so needs no index
+            anchored = rels and any(node.var in self.scope for node in nodes)
+            for node in nodes:
+                if node.var in self.scope or anchored:
+                    self.scope.add(node.var)
+                    continue
+                if not node.labels:
+                    problem = "has no label, so no index can be used"
+                elif not node.has_key:
+                    problem = "has no key properties, so can't use an index"
+                else:
+                    problem = None
+                if problem:
+                    message = "MERGE on {0} {1}".format(node.text, problem)
+                    self.problems.append(("merge-without-key", message))
+                self.scope.add(node.var)
+            self.scope |= variables
+
+    def _create(self, body):
+        for _, _, variables in self._elements(body):
+            self.scope |= variables
+
+    def _bind_alias(self, body):
+        match = AS_RE.search(body)
+        if match:
+            self.scope.add(match.group(1))
+            self.anchor.add(match.group(1))
+
+    _unwind = _load = _bind_alias
+
+    def _yield(self, body):
+        for item in split_top_level(body):
+            match = AS_RE.search(item) or re.match(r"\s*(\w+)\s*$", item)
+            if match:
+                self.scope.add(match.group(1))
+                self.anchor.add(match.group(1))
+
+    def _with(self, body):
+        self._end_part()
+        projected = set()
+        for item in split_top_level(re.sub(r"^\s*DISTINCT\b", "", body, flags=re.I)):
+            if item.strip() == "*":
+                projected |= self.scope
+                continue
+            match = AS_RE.search(item) or re.match(r"\s*(\w+)\s*$", item)
+            if match:
+                projected.add(match.group(1))
+        self.scope = set(projected)
+        self.anchor = set(projected)
+
+    def _return(self, body):
+        self._end_part()
+
+    def _union(self, body):
+        self._end_part()
+        self.scope = set()
+        self.anchor = set()
+
+    def _end_part(self):
+        """Check the patterns matched in a query part are connected."""
+        if not self.matched:
+            return
+        # Rows carried from earlier clauses are joined like another pattern
+        patterns = self.matched + ([(self.anchor, False)] if self.anchor else [])
+        groups = []
+        for variables, keyed in patterns:
+            for group in [g for g in groups if g[0] & variables]:
+                groups.remove(group)
+                variables = variables | group[0]
+                keyed = keyed or group[1]
+            groups.append((variables, keyed))
+        unkeyed = len([g for g in groups if not g[1]])
+        if len(groups) > 1 and unkeyed > 1:
+            self.problems.append(
+                (
+                    "cartesian-product",
+                    "MATCH patterns form {0} disconnected parts, so every "
+                    "combination of their matches is produced".format(len(groups)),
+                )
+            )
+        self.matched = []
+
+
+def lint_statement(statement):
+    """Check a single statement for performance hazards.
+
+    Args:
+        statement (str): Cypher statement.
+
+    Returns:
+        list of tuple: (rule, message) pairs.
+    """
+    return _StatementChecker(statement).check()
+
+
+def describe_source(source):
+    """Describe where a query came from, e.g. 'model/a.cql:3'."""
+    if source is None:
+        return "<unknown>"
+    if source.ref_type == "cypher":
+        return "{0}:{1}".format(source.ref, source.index)
+    return "<table>:{0}".format(source.index)
+
+
+def lint_queries(queries, rules=RULES):
+    """Check queries for performance hazards.
+
+    Args:
+        queries (iterable of :obj:`CypherQuery`): Schema statements are
+            skipped.
+        rules (iterable of str): Rules to check, from `RULES`. Defaults to
+            all of them.
+
+    Returns:
+        list of :obj:`LintIssue`: In the order of the queries, followed by
+            any literal-values issues.
+    """
+    rules = set(rules)
+    issues = []
+    # Normalised statement and parameters/ source of first use
+    first_use = {}
+    # Template/ (normalised statement/ source of first use) dicts
+    templates = OrderedDict()
+    for query in queries:
+        if query.is_schema:
+            continue
+        for rule, message in lint_statement(query.statement):
+            if rule in rules:
+                issues.append(LintIssue(query.source, rule, message))
+
+        statement = " ".join(query.statement.split())
+        key = (statement, json.dumps(query.params, sort_keys=True, default=str))
+        if key in first_use:
+            if "repeated-statement" in rules:
+                issues.append(
+                    LintIssue(
+                        query.source,
+                        "repeated-statement",
+                        "Statement repeats {0}".format(
+                            describe_source(first_use[key])
+                        ),
+                    )
+                )
+            continue
+        first_use[key] = query.source
+        statements = templates.setdefault(
+            statement_template(statement), OrderedDict()
+        )
+        statements.setdefault(statement, query.source)
+
+    if "literal-values" in rules:
+        for statements in templates.values():
+            if len(statements) > 1:
+                sources = list(statements.values())
+                issues.append(
+                    LintIssue(
+                        sources[0],
+                        "literal-values",
+                        "{0} statements, e.g. {1}, differ only in literal values; "
+                        "pass them as parameters so a single plan is cached".format(
+                            len(sources), describe_source(sources[1])
+                        ),
+                    )
+                )
+    return issues
+
+
+def lint_directory(root_dir, cypher_file_suffix=None, rules=RULES):
+    """Check the queries in every Cypher file found in a directory tree.
+
+    Args:
+        root_dir (str): Directory searched by :obj:`CypherFileFinder`.
+        cypher_file_suffix (str, optional): See :obj:`CypherFileFinder`.
+        rules (iterable of str): Rules to check. Defaults to all of them.
+
+    Returns:
+        list of :obj:`LintIssue`
+    """
+    finder = CypherFileFinder(root_dir, cypher_file_suffix=cypher_file_suffix)
+    queries = (q for f in finder.iterfiles(priority_sorted=True) for q in f.queries)
+    return lint_queries(queries, rules)
+
+
+def format_issue(issue):
+    return "{0}: [{1}] {2}".format(
+        describe_source(issue.source), issue.rule, issue.message
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="cymod lint",
+        description="Flag Cypher statements likely to make loads slow.",
+    )
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default=os.getcwd(),
+        help="root of directories to search",
+    )
+    parser.add_argument(
+        "-s",
+        "--suffix",
+        help="Identifier at end of file name (before file exension) "
+        "indicating cypher file should be loaded",
+    )
+    parser.add_argument(
+        "--disable",
+        action="append",
+        default=[],
+        choices=RULES,
+        help="rule not to check, may be repeated",
+    )
+    args = parser.parse_args(argv)
+
+    rules = [rule for rule in RULES if rule not in args.disable]
+    issues = lint_directory(args.directory, args.suffix, rules)
+    for issue in issues:
+        print(format_issue(issue))
+    print("{0} issues found".format(len(issues)), file=sys.stderr)
+    return 1 if issues else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
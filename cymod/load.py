@@ -10,17 +10,168 @@ construct and execute database transactions.
 from __future__ import print_function
 
 import sys
-import os
-import json
-import re
+import time
+import itertools
+import threading
+import uuid
+from contextlib import contextmanager, closing
+from functools import partial
+from multiprocessing.pool import ThreadPool
 
-from six import iteritems, iterkeys
+import six
+from six.moves import queue
 
 from neo4j import GraphDatabase
-from neo4j.exceptions import CypherSyntaxError
 
+try:
+    from neo4j import Query
+except ImportError:  # neo4j-driver < 4.0
+    Query = None
+from neo4j.exceptions import (
+    CypherSyntaxError,
+    ServiceUnavailable,
+    SessionExpired,
+    TransientError,
+)
+
+from cymod.cybase import (
+    CypherQuery,
+    CypherQueryBatch,
+    StatementTemplate,
+    properties_predicate,
+    properties_map,
+)
+from cymod.checkpoint import CheckpointLog
+from cymod.metrics import Metrics, timer
+from cymod.profiling import profile_queries
+from cymod.tracing import SpanSwitch, source_attributes
+from cymod.export import iter_transaction_blocks, write_transaction_block
 from cymod.cyproc import CypherFileFinder
-from cymod.tabproc import TransTableProcessor
+from cymod.tabproc import TransTableProcessor, CsvTransTableProcessor
+from cymod.schema import lookup_specs_from_statement, unique_specs
+from cymod.lint import written_labels
+from cymod.delta import (
+    SOURCE_LABEL_PREFIX,
+    SOURCE_PROPERTY_PREFIX,
+    TOUCHED_LABEL,
+    MODIFIED_LABEL,
+    SourceManifest,
+    source_label,
+    identified_batches,
+    plan_delta,
+    dirty_sources,
+    attributed_queries,
+    linked_labels_query,
+    release_relationships_query,
+    release_nodes_query,
+    orphans,
+    delete_by_id_query,
+)
+
+# Units of atomicity which may be used when committing queries to a database
+TX_SCOPES = ("query", "file", "priority", "load")
+
+# Label of the nodes recording which version of each model readers should use
+ACTIVE_MODEL_LABEL = "CymodActiveModel"
+
+# Errors after which retrying the failed batch may succeed
+TRANSIENT_ERRORS = (TransientError, ServiceUnavailable, SessionExpired)
+
+# Number of batches recorded in a checkpoint log between syncs to disk, with
+# the 'query' transaction scope
+CHECKPOINT_SYNC_QUERIES = 100
+
+
+def delete_matching_query(params, label=None, batch_size=10000):
+    """Build a query deleting a batch of nodes with matching properties.
+
+    The query returns the number of nodes deleted as `deleted`.
+
+    Args:
+        params (dict): Property name/ value pairs nodes must match.
+        label (str, optional): Label nodes must have.
+        batch_size (int): Maximum number of nodes to delete.
+
+    Returns:
+        :obj:`CypherQuery`
+    """
+    node = "(n:`" + label + "`)" if label else "(n)"
+    where, query_params = properties_predicate("n", params)
+    query_params["batch_size"] = batch_size
+    statement = (
+        "MATCH "
+        + node
+        + " WHERE "
+        + where
+        + " WITH n LIMIT $batch_size DETACH DELETE n RETURN count(*) AS deleted"
+    )
+    return CypherQuery(statement, params=query_params)
+
+
+def is_schema_level(level):
+    """Check whether a level yielded by `_itersources` holds schema statements."""
+    return level is not None and level[-1] == "schema"
+
+
+def prefetch(iterable, maxsize):
+    """Iterate over `iterable` in a background thread, buffering results.
+
+    Lets the work needed to generate items (e.g. parsing files or rendering
+    table rows) overlap with the work done by the consumer (e.g. waiting for
+    the database). The producer blocks once `maxsize` items are waiting, so
+    memory use stays bounded.
+
+    Args:
+        iterable: Any iterable.
+        maxsize (int): Maximum number of items waiting to be consumed.
+
+    Consumers which may stop early should close the generator, which stops
+    the producer and waits for its thread to finish.
+
+    Yields:
+        Items from `iterable`, in order. Exceptions raised by the producer are
+            re-raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize)
+    stopped = threading.Event()
+
+    def put(item):
+        # Time out periodically so the producer can give up if the consumer
+        # has gone away.
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(("item", item)):
+                    return
+        except Exception:
+            put(("error", sys.exc_info()))
+            return
+        put(("end", None))
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            kind, value = buffer.get()
+            if kind == "item":
+                yield value
+            elif kind == "error":
+                six.reraise(*value)
+            else:
+                return
+    finally:
+        stopped.set()
+        # The producer gives up within one item once stopped
+        producer.join()
 
 
 class GraphLoader(object):
@@ -28,26 +179,35 @@ class GraphLoader(object):
 
     Attributes:
         _load_job_queue (list of :obj:`CypherFileFinder`): A queue containing
-            objects which should be handled in order to generate cypher 
-            queries.             
+            objects which should be handled in order to generate cypher
+            queries.
+        metrics (:obj:`Metrics`): Timings and counts recorded while finding,
+            parsing, generating and committing queries. Set to None before
+            loading anything to disable instrumentation.
+        tracer (:obj:`Tracer`, optional): If set, spans are recorded for each
+            load, job, file, batch and query committed. Defaults to None.
     """
 
     def __init__(self):
         self._load_job_queue = []
+        self.metrics = Metrics()
+        self.tracer = None
 
     def load_cypher(self, root_dir, cypher_file_suffix=None, global_params=None):
         """Add Cypher files to the list of jobs to be loaded.
-        
+
         Args:
-            root_dir (str): File system path to root directory to search for 
+            root_dir (str): File system path to root directory to search for
                 Cypher files.
-            cypher_file_suffix (str): Suffix at the end of file names 
-                (excluding file extension) which indicates file should be 
-                loaded into the database. E.g. if files ending '_w.cql' 
-                should be loaded, use cypher_file_suffix='_w'. Defaults to 
-                None.        
+            cypher_file_suffix (str): Suffix at the end of file names
+                (excluding file extension) which indicates file should be
+                loaded into the database. E.g. if files ending '_w.cql'
+                should be loaded, use cypher_file_suffix='_w'. Defaults to
+                None.
         """
-        cff = CypherFileFinder(root_dir, cypher_file_suffix=cypher_file_suffix)
+        cff = CypherFileFinder(
+            root_dir, cypher_file_suffix=cypher_file_suffix, metrics=self.metrics
+        )
         if global_params:
             self._load_job_queue.append(
                 {"file_finder": cff, "global_params": global_params}
@@ -63,21 +223,55 @@ class GraphLoader(object):
         labels=None,
         global_params=None,
         state_alias_translator=None,
+        fresh_load=False,
+        import_dir=None,
+        csv_batch_size=10000,
     ):
         """Generate Cypher queries based data in a :obj:`pandas.DataFrame`.
-        
+
         Args:
             df (:obj:`pandas.DataFrame`): Table whose rows specify transition
                 rules which will be coverted into Cypher.
-            start_state_col (str): Name of the column specifying the start 
+            start_state_col (str): Name of the column specifying the start
                 state of the transition described by each row.
             end_state_col (str): Name of the column specifying the end state of
                 the transition described by each row.
-            global_params (dict, optional): property name/ value pairs which 
-                will be added as parameters to every query.     
-            state_alias_translator (:obj:`EnvrStateAliasTranslator`): Container 
-                for translations from codes to human readable values.       
+            global_params (dict, optional): property name/ value pairs which
+                will be added as parameters to every query.
+            state_alias_translator (:obj:`EnvrStateAliasTranslator`): Container
+                for translations from codes to human readable values.
+            fresh_load (bool): If True, generate CREATE rather than MERGE
+                clauses for entities not described earlier in the load. Only
+                use this when loading into a database without the model's
+                nodes, e.g. after `refresh_graph`. Nodes created by Cypher
+                files aren't taken into account, so the load raises a
+                ValueError if a Cypher file in it creates or merges nodes with
+                the table's labels. Defaults to False.
+            import_dir (str, optional): If given, rather than generating a
+                query for each row, the table is written to a CSV file in this
+                directory, which should be the database's import directory,
+                and loaded by a single LOAD CSV query. The query must be
+                committed with the 'query' transaction scope.
+            csv_batch_size (int): Number of rows committed per transaction by
+                the LOAD CSV query. Defaults to 10000.
         """
+        if import_dir is not None:
+            if fresh_load:
+                raise ValueError("fresh_load can't be used with import_dir")
+            tabular_src = CsvTransTableProcessor(
+                df,
+                start_state_col,
+                end_state_col,
+                import_dir,
+                batch_size=csv_batch_size,
+                labels=labels,
+                global_params=global_params,
+                state_alias_translator=state_alias_translator,
+                metrics=self.metrics,
+            )
+            self._load_job_queue.append(tabular_src)
+            return
+
         tabular_src = TransTableProcessor(
             df,
             start_state_col,
@@ -85,85 +279,201 @@ class GraphLoader(object):
             labels=labels,
             global_params=global_params,
             state_alias_translator=state_alias_translator,
+            fresh_load=fresh_load,
+            metrics=self.metrics,
         )
         self._load_job_queue.append(tabular_src)
 
-    def iterqueries(self):
-        """Provide an iterable over Cypher queries from all loaded sources.
+    def index_specs(self, unique=False):
+        """Describe the indexes which speed up lookups made by loaded queries.
+
+        Lookups are inferred from the labels and global parameters used by
+        tabular data sources, and from MATCH and MERGE clauses in Cypher files
+        loaded with global parameters whose node patterns refer to those
+        parameters.
+
+        Args:
+            unique (bool): If True, State nodes generated from tabular data
+                are specified as unique. Defaults to False.
+
+        Returns:
+            list of :obj:`IndexSpec`: Specifications without duplicates.
+        """
+        specs = []
+        for load_job in self._load_job_queue:
+            if isinstance(load_job, TransTableProcessor):
+                specs.extend(load_job.index_specs(unique=unique))
+            elif isinstance(load_job, dict):
+                param_names = list(load_job["global_params"].keys())
+                for cypher_file in load_job["file_finder"].iterfiles():
+                    for query in cypher_file.queries:
+                        specs.extend(
+                            lookup_specs_from_statement(query.statement, param_names)
+                        )
+        return unique_specs(specs)
+
+    @contextmanager
+    def _overridden_global_params(self, overrides):
+        """Temporarily replace the values of global parameters in every job.
+
+        Args:
+            overrides (dict): Parameter name/ value pairs. Every load job must
+                have been given global parameters including these names.
+        """
+        originals = []
+        for load_job in self._load_job_queue:
+            if isinstance(load_job, dict):
+                holder, key = load_job, "global_params"
+                params = load_job["global_params"]
+            elif isinstance(load_job, TransTableProcessor):
+                holder, key = load_job.__dict__, "global_params"
+                params = load_job.global_params
+            else:
+                params = None
+
+            if not params or not set(overrides).issubset(params):
+                raise ValueError(
+                    "Every load job must have global parameters including "
+                    + str(sorted(overrides.keys()))
+                )
+            originals.append((holder, key, params))
+            overridden = dict(params)
+            overridden.update(overrides)
+            holder[key] = overridden
+
+        try:
+            yield
+        finally:
+            for holder, key, params in originals:
+                holder[key] = params
+
+    def _itersources(self, chunk_size=None):
+        """Provide an iterable over the queries from each loaded source.
+
+        A source is a single Cypher file or a single table of transitions, or
+        a chunk of a table if `chunk_size` is given.
+
+        Schema statements (see :obj:`CypherQuery.is_schema`) found in Cypher
+        files are separated from the files' other queries and yielded first,
+        as sources of their own. Only files containing schema statements are
+        parsed ahead of time. Other files are parsed as they're reached, and
+        released once their queries have been yielded.
+
+        Args:
+            chunk_size (int, optional): If given, tables are split into
+                sources of at most this many rows.
 
         Yields:
-            :obj:`CypherQuery`: Cypher queries in an order which respects the
-                order in which they were loaded into the :obj:`GraphLoader` 
-                instance.        
+            tuple of tuple and iterable of :obj:`CypherQuery`: The first
+                element identifies the priority level the source belongs to
+                as a (job index, priority) pair, or a (job index, priority,
+                'schema') triple for schema statements. The second contains
+                the source's queries in the order they should be run.
         """
 
+        def fill_global_params(query, global_params):
+            """Replace unspecified query parameters with global values.
+
+            Args:
+                query (:obj:`CypherQuery`)
+                global_params (dict): Extra parameters to be added to the
+                    query, as appropriate.
+
+            Returns:
+                :obj:`CypherQuery`
+            """
+            # Get list of parameters in query with None value and
+            # attempt to replace None with value from global_params
+            unspecified_native_params = [
+                k for k in query.params.keys() if not query.params[k]
+            ]
+            for unspecified_param in unspecified_native_params:
+                try:
+                    query.params[unspecified_param] = global_params[unspecified_param]
+                except KeyError:
+                    # Raise an exception if a query has a required
+                    # None parameter at this stage
+                    raise KeyError(
+                        "The following query requires  a "
+                        + "parameter not given in its originating "
+                        + "Cypher file, nor in the provided global "
+                        + "parameters:\n"
+                        + str(query)
+                    )
+            return query
+
         def handle_cypher_files_no_global_params(file_finder):
-            """Yield queries from :obj:`CypherFileFinder` without extra params.
-            
+            """Find the files of a :obj:`CypherFileFinder` without extra params.
+
             Args:
                 file_finder (:obj:`CypherFileFinder`)
-                
-            Yields:
-                :obj:`CypherQuery`
+
+            Returns:
+                tuple of list and None: The :obj:`CypherFile` objects found,
+                    in priority order, and no global parameters.
             """
-            for cypher_file in file_finder.iterfiles(priority_sorted=True):
-                for query in cypher_file.queries:
-                    yield query
+            return list(file_finder.iterfiles(priority_sorted=True)), None
 
         def handle_cypher_files_wi_global_params(file_finder_dict):
-            """Yield queries from :obj:`CypherFileFinder` with extra params.
-            
+            """Find the files of a :obj:`CypherFileFinder` with extra params.
+
             Extra parameters are passed along with the file finder inside a
             dict.
-            
+
             Args:
                 file_finder_dict (dict): Dictionary with two key/value pairs;
-                    file_finder_dict["file_finder"] is a 
-                    :obj:`CypherFileFinder` and 
+                    file_finder_dict["file_finder"] is a
+                    :obj:`CypherFileFinder` and
                     file_finder_dict["global_params"] is a dict whose key/value
-                    pairs are extra parameters to be added to the queries 
+                    pairs are extra parameters to be added to the queries
                     identified by the file finder, as appropriate.
-            
-            Yields:
-                :obj:`CypherQuery`
+
+            Returns:
+                tuple of list and dict: The :obj:`CypherFile` objects found,
+                    in priority order, and the global parameters.
             """
             cff = file_finder_dict["file_finder"]
-            global_params = file_finder_dict["global_params"]
-            for cypher_file in cff.iterfiles(priority_sorted=True):
-                for query in cypher_file.queries:
-                    # Get list of parameters in query with None value and
-                    # attempt to replace None with value from global_params
-                    unspecified_native_params = [
-                        k for k in query.params.keys() if not query.params[k]
-                    ]
-                    for unspecified_param in unspecified_native_params:
-                        try:
-                            query.params[unspecified_param] = global_params[
-                                unspecified_param
-                            ]
-                        except KeyError:
-                            # Raise an exception if a query has a required
-                            # None parameter at this stage
-                            raise KeyError(
-                                "The following query requires  a "
-                                + "parameter not given in its originating "
-                                + "Cypher file, nor in the provided global "
-                                + "parameters:\n"
-                                + str(query)
-                            )
-                    yield query
+            files = list(cff.iterfiles(priority_sorted=True))
+            return files, file_finder_dict["global_params"]
+
+        def cypher_file_queries(cypher_file, global_params):
+            """Get a file's queries, parsing it if needed.
+
+            Returns:
+                list of :obj:`CypherQuery`
+            """
+            if global_params is None:
+                return list(cypher_file.queries)
+            return [
+                fill_global_params(query, global_params)
+                for query in cypher_file.queries
+            ]
 
         def handle_tabular_data_source(tabular_source):
             """Yield queries from a tabular data source.
-            
+
             Args:
                 tabular_source (:obj:`TransTableProcessor`)
-                
+
             Yields:
-                :obj:`CypherQuery`
+                tuple of int and iterable of :obj:`CypherQuery`: The whole
+                    table, or each chunk of it, is treated as a single source
+                    with priority 0.
             """
-            for query in tabular_source.iterqueries():
-                yield query
+            tabular_source.prepare()
+            queries = tabular_source.iterqueries(emitted=emitted)
+            if not chunk_size:
+                yield 0, queries
+                return
+            while True:
+                chunk = list(itertools.islice(queries, chunk_size))
+                if not chunk:
+                    return
+                yield 0, chunk
+
+        # Entities described by tables loaded with fresh_load=True, shared so
+        # later tables don't CREATE entities described by earlier ones
+        emitted = set()
 
         handler = {
             CypherFileFinder: handle_cypher_files_no_global_params,
@@ -171,13 +481,157 @@ class GraphLoader(object):
             TransTableProcessor: handle_tabular_data_source,
         }
 
-        for load_job in self._load_job_queue:
+        jobs = []
+        for job_index, load_job in enumerate(self._load_job_queue):
             for t in handler.keys():
                 if isinstance(load_job, t):
-                    for query in handler[t](load_job):
-                        yield query
+                    jobs.append((job_index, load_job, handler[t](load_job)))
                     break
 
+        # Entities created by Cypher files aren't recorded in `emitted`, so
+        # tables loaded with fresh_load would CREATE them again
+        fresh_labels = set()
+        for load_job in self._load_job_queue:
+            if isinstance(load_job, TransTableProcessor) and load_job.fresh_load:
+                labels = load_job.labels
+                fresh_labels.update([labels.state, labels.transition, labels.condition])
+        if fresh_labels:
+            for job_index, load_job, sources in jobs:
+                if isinstance(load_job, TransTableProcessor):
+                    continue
+                files, global_params = sources
+                for cypher_file in files:
+                    for query in cypher_file_queries(cypher_file, global_params):
+                        if written_labels(query.statement) & fresh_labels:
+                            raise ValueError(
+                                "Tables loaded with fresh_load can't describe "
+                                "nodes created by Cypher files, as in "
+                                + cypher_file.filename
+                            )
+
+        # Schema statements from every Cypher file are run before any data
+        # statements, so indexes exist before the queries which use them.
+        for job_index, load_job, sources in jobs:
+            if isinstance(load_job, TransTableProcessor):
+                continue
+            files, global_params = sources
+            for cypher_file in files:
+                if cypher_file.has_schema_statements:
+                    queries = cypher_file_queries(cypher_file, global_params)
+                    yield (job_index, cypher_file.priority, "schema"), [
+                        q for q in queries if q.is_schema
+                    ]
+
+        for job_index, load_job, sources in jobs:
+            if isinstance(load_job, TransTableProcessor):
+                for priority, queries in sources:
+                    yield (job_index, priority), queries
+                continue
+            files, global_params = sources
+            while files:
+                # Popped so the file, and its parsed queries, can be freed
+                # once the caller is done with them
+                cypher_file = files.pop(0)
+                queries = cypher_file_queries(cypher_file, global_params)
+                yield (job_index, cypher_file.priority), [
+                    q for q in queries if not q.is_schema
+                ]
+
+    def iterqueries(self):
+        """Provide an iterable over Cypher queries from all loaded sources.
+
+        Yields:
+            :obj:`CypherQuery`: Cypher queries in an order which respects the
+                order in which they were loaded into the :obj:`GraphLoader`
+                instance.
+        """
+        for _, queries in self._itersources():
+            for query in queries:
+                yield query
+
+    def _iterlevels(self, chunk_size=None):
+        """Provide an iterable over groups of sources sharing a priority level.
+
+        Sources in the same group don't depend on one another's queries, so
+        may be loaded concurrently. Every source in a group should be loaded
+        before any source in the next group.
+
+        Args:
+            chunk_size (int, optional): If given, tables are split into
+                sources of at most this many rows, which share the table's
+                priority level.
+
+        Yields:
+            list of tuple: (level, queries) pairs, as yielded by
+                `_itersources`, which belong to the same priority level.
+        """
+        group = []
+        for level, queries in self._itersources(chunk_size):
+            if group and group[-1][0] != level:
+                yield group
+                group = []
+            group.append((level, queries))
+        if group:
+            yield group
+
+    def iterbatches(self, tx_scope="query", chunk_size=None):
+        """Provide an iterable over groups of queries to commit together.
+
+        Args:
+            tx_scope (str): The unit of atomicity. One of 'query' (each query
+                is committed on its own), 'file' (all queries from a Cypher
+                file or table are committed together), 'priority' (all
+                queries from files sharing a priority level within a single
+                load job are committed together) or 'load' (everything is
+                committed together). Defaults to 'query'.
+            chunk_size (int, optional): If given, tables are split into chunks
+                of at most this many rows, each treated like a separate file.
+
+        Yields:
+            :obj:`CypherQueryBatch`: Batches in an order which respects the
+                order of the queries given by `iterqueries`.
+        """
+        if tx_scope not in TX_SCOPES:
+            raise ValueError(
+                "tx_scope must be one of {0}, not '{1}'".format(TX_SCOPES, tx_scope)
+            )
+
+        if tx_scope == "query":
+            for level, queries in self._itersources():
+                for query in queries:
+                    yield CypherQueryBatch([query], level)
+
+        elif tx_scope == "file":
+            for level, queries in self._itersources(chunk_size):
+                queries = list(queries)
+                if queries:
+                    yield CypherQueryBatch(queries, level)
+
+        elif tx_scope == "priority":
+            batch = None
+            for level, queries in self._itersources(chunk_size):
+                if batch is not None and batch.level != level:
+                    yield batch
+                    batch = None
+                if batch is None:
+                    batch = CypherQueryBatch([], level)
+                batch.queries.extend(queries)
+            if batch:
+                yield batch
+
+        else:
+            # Schema statements can't share a transaction with data statements
+            schema_batch = CypherQueryBatch([])
+            data_batch = CypherQueryBatch([])
+            for level, queries in self._itersources():
+                if is_schema_level(level):
+                    schema_batch.queries.extend(queries)
+                else:
+                    data_batch.queries.extend(queries)
+            for batch in [schema_batch, data_batch]:
+                if batch:
+                    yield batch
+
 
 class ServerGraphLoader(GraphLoader):
     """Loads Cypher data into a running Neo4j database instance."""
@@ -186,6 +640,22 @@ class ServerGraphLoader(GraphLoader):
         super(ServerGraphLoader, self).__init__()
         self.driver = self._get_graph_driver(uri, username, password)
 
+    @classmethod
+    def from_driver(cls, driver):
+        """Create a loader which uses an existing driver object.
+
+        Args:
+            driver: Object providing the same interface as
+                :obj:`GraphDatabase.driver`.
+
+        Returns:
+            :obj:`ServerGraphLoader`
+        """
+        loader = cls.__new__(cls)
+        GraphLoader.__init__(loader)
+        loader.driver = driver
+        return loader
+
     def _get_graph_driver(self, uri, username, password):
         """Attempt to obtain a driver for Neo4j server.
 
@@ -202,64 +672,849 @@ class ServerGraphLoader(GraphLoader):
             print("Exception: %s" % str(e), file=sys.stderr)
             sys.exit(1)
 
-    def refresh_graph(self, params):
+    def refresh_graph(self, params, labels=None, batch_size=10000):
         """Delete nodes in the graph with properties matching given parameters.
 
-        This is useful in cases where we want to update the model specified by 
+        This is useful in cases where we want to update the model specified by
         a particular combination of parameters (e.g. with a particular model
         ID).
 
-        This method will run an appropriate query to remove old data from the
-        graph ahead of loading new data.
+        Nodes are deleted in batches, each in its own transaction, so that
+        large models can be removed without exhausting the database's memory.
 
         Args:
             params (dict): Key/value pairs of Neo4j node properties. Nodes with
-                properties matching these values will be deleted from the 
+                properties matching these values will be deleted from the
                 graph.
+            labels (list of str, optional): If given, only nodes with one of
+                these labels are deleted. This allows indexes on the labels'
+                properties to be used to find the nodes to delete.
+            batch_size (int): Maximum number of nodes deleted in each
+                transaction. Defaults to 10000.
+
+        Returns:
+            int: The number of nodes deleted.
+        """
+        try:
+            return self._delete_matching(params, labels, batch_size)
+        except CypherSyntaxError as e:
+            print("Error in Cypher refreshing database. Check syntax.", file=sys.stderr)
+            print("Exception: %s" % str(e), file=sys.stderr)
+            sys.exit(1)
+
+    def _delete_matching(self, params, labels=None, batch_size=10000):
+        """Delete nodes with matching properties, as `refresh_graph` does, but
+        raise any error rather than exiting.
+
+        Returns:
+            int: The number of nodes deleted.
         """
+        if not params:
+            raise ValueError("At least one parameter is needed to refresh the graph")
 
-        def remove_all_nodes(tx, params):
-            """Remove nodes with properties specified in global_params.
+        total = 0
+        with self.driver.session() as session:
+            for label in labels or [None]:
+                query = delete_matching_query(params, label, batch_size)
+                total += self._delete_in_batches(session, query, total)
+        return total
 
-            A callback function called by driver.session().write_transaction
+    def _delete_in_batches(self, session, query, previous_total=0):
+        """Repeatedly run a deletion query until it deletes a partial batch.
 
-            Args:
-                tx: database transaction object provided by write_transaction.
-                global_params (dict): key/value pairs of property names and
-                    their values which together specify the model to be
-                    refreshed.
-            """
-            # construct query string from provided global_params dict
-            WHERE_CLAUSE = " AND ".join(
-                [
-                    "n." + str(k) + "=" + '"' + str(v) + '"'
-                    for (k, v) in iteritems(params)
-                ]
+        Args:
+            session: A database session.
+            query (:obj:`CypherQuery`): A query with a `batch_size` parameter
+                which returns the number of items it deleted as `deleted`,
+                such as one made by `delete_matching_query`.
+            previous_total (int): Number of items already deleted, used when
+                reporting progress.
+
+        Returns:
+            int: The number of items deleted.
+        """
+        total = 0
+        while True:
+            tx = session.begin_transaction()
+            try:
+                record = tx.run(query.statement, query.params).single()
+            except Exception:
+                tx.rollback()
+                raise
+            tx.commit()
+
+            deleted = record["deleted"] if record else 0
+            total += deleted
+            print(
+                "Removed {0} items matching global parameters "
+                "({1} in total)".format(deleted, previous_total + total)
             )
-            q = "MATCH (n) WHERE " + WHERE_CLAUSE + " DETACH DELETE n"
-            print("Removing existing nodes matching global parameters")
-            tx.run(q)
+            if deleted < query.params["batch_size"]:
+                return total
+
+    def ensure_indexes(self, unique=False, extra_specs=None, timeout=300):
+        """Create any missing indexes needed by the loaded queries.
+
+        Indexes and constraints are created with IF NOT EXISTS, so this is
+        safe to call before every load. Waits for the indexes to come online
+        before returning. Requires Neo4j 4.4 or later.
+
+        Args:
+            unique (bool): If True, use constraints for State nodes generated
+                from tabular data, see :obj:`IndexSpec`. Defaults to False.
+            extra_specs (list of :obj:`IndexSpec`, optional): Indexes to create
+                in addition to those inferred by `index_specs`.
+            timeout (int): Seconds to wait for indexes to come online.
+                Defaults to 300.
 
+        Returns:
+            list of :obj:`IndexSpec`: Specifications which were ensured.
+        """
+        specs = unique_specs(self.index_specs(unique=unique) + (extra_specs or []))
         with self.driver.session() as session:
+            for spec in specs:
+                self._run_query(session, CypherQuery(spec.statement(), params={}))
+            if specs:
+                self._await_indexes(session, timeout)
+        return specs
+
+    def _await_indexes(self, session, timeout=300):
+        """Wait for all indexes in the database to come online.
+
+        Args:
+            session: A database session.
+            timeout (int): Seconds to wait. Defaults to 300.
+        """
+        self._run_query(
+            session,
+            CypherQuery("CALL db.awaitIndexes($timeout)", params={"timeout": timeout}),
+        )
+
+    def commit(
+        self,
+        tx_scope="query",
+        workers=1,
+        prefetch_size=0,
+        checkpoint_file=None,
+        resume=False,
+        max_retries=0,
+        retry_delay=1.0,
+        ensure_indexes=False,
+        query_timeout=None,
+        slow_query_log=None,
+    ):
+        """Load all queries loaded into :obj:`GraphLoader` into the graph.
+
+        Args:
+            tx_scope (str): The unit of atomicity, see
+                :obj:`GraphLoader.iterbatches`. With any scope other than
+                'query', a batch whose queries fail part way through is rolled
+                back, so the graph is never left with a partially applied
+                file, priority level or load. Defaults to 'query'.
+            workers (int): Number of database sessions used to load files
+                concurrently. Files sharing a priority level are distributed
+                between the workers, and every file in a level is loaded
+                before any file in the next level is started. Only the 'query'
+                and 'file' transaction scopes can be used with more than one
+                worker. Files in the same level which MERGE the same node may
+                each create it, so without uniqueness constraints on the
+                properties merged on, more than one worker can leave duplicate
+                nodes. Give such files different priorities, or create the
+                constraints first. Defaults to 1.
+            prefetch_size (int): If greater than 0, queries are generated in a
+                background thread while earlier ones are sent to the database,
+                with at most this many batches (or priority levels, when more
+                than one worker is used) waiting at once. Defaults to 0.
+            checkpoint_file (str, optional): Path of a file in which each
+                committed batch is recorded, see :obj:`CheckpointLog`. With
+                the 'query' scope the file is synced to disk every
+                `CHECKPOINT_SYNC_QUERIES` queries rather than after each one,
+                so if the operating system crashes, up to that many committed
+                queries may be run again when the load is resumed. Queries
+                which MERGE are unaffected by being run twice.
+            resume (bool): If True, skip batches recorded as committed in
+                `checkpoint_file` by a previous, interrupted, call to commit.
+                The load must be configured as it was for that call, including
+                `tx_scope`. Defaults to False.
+            max_retries (int): Number of times a batch is retried after a
+                transient error (e.g. a dropped connection or deadlock) before
+                giving up. Defaults to 0.
+            retry_delay (float): Seconds to wait before the first retry. The
+                delay doubles with each subsequent retry. Defaults to 1.0.
+            ensure_indexes (bool): If True, create any missing indexes needed
+                by the loaded queries, and wait for them to come online,
+                before loading. See `ensure_indexes`. Defaults to False.
+            query_timeout (float, optional): Seconds after which the database
+                aborts a statement. With scopes other than 'query' the limit
+                applies to each batch's transaction. A statement which times
+                out fails its batch like any other error.
+            slow_query_log (:obj:`SlowQueryLog`, optional): If given, records
+                the statements and batches which take longer than its
+                threshold, and the sources whose statements took longest in
+                total are printed to stderr when the load ends. The log isn't
+                closed, so can be used for more than one load, in which case
+                the summary covers all of them.
+        """
+        if resume and not checkpoint_file:
+            raise ValueError("A checkpoint_file is required to resume a load")
+
+        if tx_scope != "query" and any(
+            isinstance(job, CsvTransTableProcessor) for job in self._load_job_queue
+        ):
+            # CALL { ... } IN TRANSACTIONS can't run in an explicit transaction
+            raise ValueError(
+                "Tables loaded with LOAD CSV require the 'query' transaction scope"
+            )
+
+        if query_timeout is not None and Query is None:
+            raise ValueError("query_timeout requires neo4j-driver 4.0 or later")
+
+        if ensure_indexes:
+            self.ensure_indexes()
+
+        checkpoint = None
+        if checkpoint_file:
+            checkpoint = CheckpointLog(
+                checkpoint_file,
+                resume=resume,
+                sync_every=CHECKPOINT_SYNC_QUERIES if tx_scope == "query" else 1,
+            )
+
+        start = timer()
+
+        commit_batch = partial(
+            self._commit_batch,
+            tx_scope=tx_scope,
+            checkpoint=checkpoint,
+            max_retries=max_retries,
+            retry_delay=retry_delay,
+            query_timeout=query_timeout,
+            slow_log=slow_query_log,
+        )
+
+        load_span = jobs = files = None
+        if self.tracer is not None:
+            load_span = self.tracer.start_span(
+                "load", tx_scope=tx_scope, workers=workers
+            )
+            jobs = SpanSwitch(self.tracer, "job")
+            files = SpanSwitch(self.tracer, "file")
+
+        try:
+            if workers > 1:
+                self._commit_parallel(commit_batch, tx_scope, workers, prefetch_size)
+                return
+
+            batches = self.iterbatches(tx_scope)
+            if prefetch_size > 0:
+                batches = prefetch(batches, prefetch_size)
+
+            with closing(batches), self.driver.session() as session:
+                awaiting_indexes = False
+                for batch in batches:
+                    if jobs is not None:
+                        job_index = batch.level[0] if batch.level else None
+                        if job_index != jobs.key:
+                            files.close()
+                        jobs.switch(job_index, job=job_index)
+                        # Batches only belong to a single file with these
+                        # scopes
+                        if tx_scope in ["query", "file"]:
+                            file_key, attrs = self._file_span(batch.queries)
+                            files.switch(file_key, **attrs)
+                    if batch.is_schema:
+                        awaiting_indexes = True
+                    elif awaiting_indexes:
+                        self._await_indexes(session)
+                        awaiting_indexes = False
+                    commit_batch(session, batch)
+                if awaiting_indexes:
+                    self._await_indexes(session)
+        finally:
+            if load_span is not None:
+                files.close()
+                jobs.close()
+                load_span.end()
+            if checkpoint:
+                checkpoint.close()
+            if slow_query_log is not None:
+                print(slow_query_log.format_summary(), file=sys.stderr)
+            if self.metrics is not None:
+                self.metrics.observe("commit_seconds", timer() - start)
+
+    def profile(self, explain=False, commit=False):
+        """Profile each distinct statement template in the load once.
+
+        Statements differing only in their literal values, such as those made
+        from the rows of a table, share a template. See `profile_queries`.
+
+        Args:
+            explain (bool): If True, use EXPLAIN rather than PROFILE, so no
+                statement is run. Defaults to False.
+            commit (bool): If True, commit the changes made by the profiled
+                statements. Defaults to False.
+
+        Returns:
+            :obj:`LoadProfile`: Use `LoadProfile.format_report` to describe
+                the most costly statements with hazardous plan operators.
+
+        Raises:
+            ValueError: If a table is loaded with LOAD CSV.
+        """
+        if any(isinstance(job, CsvTransTableProcessor) for job in self._load_job_queue):
+            # Statements are profiled in explicit transactions, which
+            # CALL { ... } IN TRANSACTIONS can't run in
+            raise ValueError("Tables loaded with LOAD CSV can't be profiled")
+        return profile_queries(
+            self.driver, self.iterqueries(), explain=explain, commit=commit
+        )
+
+    def _file_span(self, queries):
+        """Identify the file or table queries came from, for tracing.
+
+        Args:
+            queries (list of :obj:`CypherQuery`)
+
+        Returns:
+            tuple of tuple and dict: A key identifying the source, None if
+                unknown, and attributes describing it.
+        """
+        source = queries[0].source if queries else None
+        if source is None:
+            return None, {}
+        attrs = source_attributes(source)
+        del attrs["source.index"]
+        if source.ref_type == "tabular":
+            # Tables are identified by the DataFrame object itself
+            return ("tabular", id(source.ref)), attrs
+        return ("cypher", source.ref), attrs
+
+    def commit_delta(
+        self, model_params, manifest_file, chunk_size=10000, batch_size=10000
+    ):
+        """Update a model by re-applying only the sources which have changed.
+
+        Each Cypher file, and each chunk of each table, is a source. The
+        digests of the sources loaded for the model are recorded in
+        `manifest_file` and compared with the current sources. Data belonging
+        to sources which have changed or been removed is deleted, along with
+        data from the sources which depend on it (see `dirty_sources`), and
+        new and changed sources (and those dependents) are re-applied.
+
+        Each source's statements are rewritten to attribute the nodes and
+        relationships they write to it (see `provenance_statement`), so the
+        work done scales with the size of the sources re-applied, not with
+        the size of the model. Statements which delete data, call procedures
+        or write inside subqueries or FOREACH can't be attributed, and are
+        rejected. Delta loads mustn't run concurrently against the same
+        database.
+
+        Args:
+            model_params (dict): Global parameters identifying the model, e.g.
+                {'model_ID': 'abc'}.
+            manifest_file (str): Path of a JSON file recording the sources
+                loaded for each model. Created if it doesn't exist.
+            chunk_size (int): Average number of table rows in each source.
+                Chunk boundaries depend on the content of the rows, so a row
+                inserted into a table changes only the chunk containing it.
+                Defaults to 10000.
+            batch_size (int): Maximum number of nodes or relationships deleted
+                in each transaction. Defaults to 10000.
+
+        Returns:
+            dict: Ids of sources which were 'applied' (new, changed or
+                dependent on a changed source) and 'removed', and the number
+                of sources left 'unchanged'.
+        """
+        if not model_params:
+            raise ValueError("model_params are needed to identify the model")
+
+        for job in self._load_job_queue:
+            if isinstance(job, CsvTransTableProcessor):
+                # Sources are applied in explicit transactions, which
+                # CALL { ... } IN TRANSACTIONS can't run in
+                raise ValueError(
+                    "Tables loaded with LOAD CSV can't be used in delta loads"
+                )
+            if isinstance(job, TransTableProcessor) and job.fresh_load:
+                # Queries generated with fresh_load CREATE entities unless an
+                # earlier row described them, which only holds for full loads
+                raise ValueError(
+                    "Tables loaded with fresh_load can't be used in delta loads"
+                )
+
+        manifest = SourceManifest(manifest_file)
+        previous = manifest.digests(model_params)
+        links = manifest.links(model_params)
+
+        def iter_identified_batches():
+            return identified_batches(self._itersources(), chunk_size)
+
+        current = {}
+        order = {}
+        to_apply = {}
+        for sid, batch in iter_identified_batches():
+            digest = batch.digest()
+            current[sid] = digest
+            order[sid] = len(order)
+            if previous.get(sid) != digest:
+                to_apply[sid] = batch
+
+        changed, removed = plan_delta(previous, current)
+
+        # Sources whose data will be deleted: those no longer loaded, those
+        # which have changed (if they were loaded before) and those which
+        # depend on either
+        dirty = dirty_sources(removed | (changed & set(previous)), links)
+
+        # Dependents which are still loaded must be re-applied, which needs
+        # their queries to be generated again
+        dependents = (dirty - changed - removed) & set(current)
+        if dependents:
+            for sid, batch in iter_identified_batches():
+                if sid in dependents:
+                    to_apply[sid] = batch
+
+        # Rewritten before anything is deleted, so statements which can't be
+        # attributed are rejected while the model is intact
+        for sid, batch in to_apply.items():
+            if not batch.is_schema:
+                queries = attributed_queries(batch.queries, model_params, sid)
+                to_apply[sid] = CypherQueryBatch(queries, batch.level)
+
+        owners = dict(
+            (source_label(model_params, sid), sid)
+            for sid in set(current) | set(previous)
+        )
+        new_links = dict(
+            (sid, links[sid]) for sid in current if sid in links and sid not in dirty
+        )
+        with self.driver.session() as session:
+            for sid in sorted(dirty):
+                self._delete_source(session, model_params, sid, batch_size)
+
+            applied = sorted(to_apply, key=lambda sid: order[sid])
+            for sid in applied:
+                new_links[sid] = self._apply_source(session, sid, to_apply[sid], owners)
+
+        manifest.update(model_params, current, new_links)
+        return {
+            "applied": applied,
+            "removed": sorted(removed),
+            "unchanged": len(current) - len(applied),
+        }
+
+    def _delete_source(self, session, model_params, sid, batch_size):
+        """Detach the nodes and relationships of a source, deleting those which
+        belong to no other source.
+
+        Args:
+            session: A database session.
+            model_params (dict): Global parameters identifying the model.
+            sid (str): Id of the source.
+            batch_size (int): Maximum number of items detached per transaction.
+        """
+        # Relationships are found through the source's nodes, so go first
+        for release, prefix, relationships in [
+            (release_relationships_query, SOURCE_PROPERTY_PREFIX, True),
+            (release_nodes_query, SOURCE_LABEL_PREFIX, False),
+        ]:
+            query = release(model_params, sid, batch_size)
+            while True:
+                tx = session.begin_transaction()
+                try:
+                    records = list(tx.run(query.statement, query.params))
+                    ids = orphans(records, prefix)
+                    if ids:
+                        delete = delete_by_id_query(ids, relationships)
+                        tx.run(delete.statement, delete.params).consume()
+                except Exception:
+                    tx.rollback()
+                    raise
+                tx.commit()
+                if len(records) < batch_size:
+                    break
+
+    def _apply_source(self, session, sid, batch, owners):
+        """Run a source's attributed queries and find the sources it's linked
+        to.
+
+        Args:
+            session: A database session.
+            sid (str): Id of the source.
+            batch (:obj:`CypherQueryBatch`): The source's queries, rewritten
+                by `attributed_queries` unless they're schema statements.
+            owners (dict): Maps the labels of the model's sources to their
+                ids.
+
+        Returns:
+            dict: The source's links, as recorded by :obj:`SourceManifest`.
+        """
+        link = {"touches": [], "modifies": []}
+        if batch.is_schema:
+            self._run_batch(session, batch)
+            self._await_indexes(session)
+            return link
+        tx = session.begin_transaction()
+        try:
+            for cypher_query in batch:
+                self._run_query(tx, cypher_query)
+            for key, link_label in [
+                ("touches", TOUCHED_LABEL),
+                ("modifies", MODIFIED_LABEL),
+            ]:
+                query = linked_labels_query(link_label)
+                labels = [r["label"] for r in tx.run(query.statement, query.params)]
+                linked = set(owners[label] for label in labels if label in owners)
+                link[key] = sorted(linked - set([sid]))
+        except Exception:
+            tx.rollback()
+            raise
+        tx.commit()
+        return link
+
+    def commit_blue_green(
+        self, model_params, version_key="model_ID", background_gc=True, **kwargs
+    ):
+        """Load a new version of a model alongside the old one, then swap.
+
+        The model is loaded with the value of `version_key` in every job's
+        global parameters replaced by a new version id. Once loading is
+        complete, a pointer node labelled :obj:`ACTIVE_MODEL_LABEL` with the
+        properties in `model_params` has its `version` property set to the new
+        version id in a single transaction. Readers which find the model via
+        the pointer, e.g. using::
+
+            MATCH (p:CymodActiveModel {model_ID: "abc"})
+            MATCH (n:State {model_ID: p.version}) ...
+
+        therefore see either the complete old version or the complete new
+        version, never a partially loaded one. The old version is then deleted
+        in batches. If loading fails, the partially loaded version is deleted
+        and the pointer is left unchanged.
+
+        Args:
+            model_params (dict): Global parameters identifying the model,
+                including `version_key`.
+            version_key (str): Name of the global parameter whose value is
+                replaced by the version id. Defaults to 'model_ID'.
+            background_gc (bool): If True, the old version is deleted in a
+                background thread. An error there ends the thread, leaving
+                the rest of the old version to be removed with
+                `refresh_graph`. Defaults to True.
+            **kwargs: Passed to `commit`.
+
+        Returns:
+            tuple of str and :obj:`threading.Thread`: The new version id, and
+                the thread deleting the old version if it is being deleted in
+                the background, otherwise None.
+        """
+        version = "{0}@{1}-{2}".format(
+            model_params[version_key],
+            time.strftime("%Y%m%dT%H%M%S", time.gmtime()),
+            uuid.uuid4().hex[:8],
+        )
+        staged_params = dict(model_params)
+        staged_params[version_key] = version
+
+        try:
+            with self._overridden_global_params({version_key: version}):
+                self.commit(**kwargs)
+        except Exception:
+            print("Load failed, removing partially loaded version " + version)
+            self._delete_matching(staged_params)
+            raise
+
+        with self.driver.session() as session:
+            tx = session.begin_transaction()
             try:
-                session.write_transaction(remove_all_nodes, params)
-            except CypherSyntaxError as e:
-                print(
-                    "Error in Cypher refreshing database. Check syntax.",
-                    file=sys.stderr,
+                pointer, params = properties_map(model_params)
+                params["version"] = version
+                record = tx.run(
+                    "MERGE (p:`"
+                    + ACTIVE_MODEL_LABEL
+                    + "` "
+                    + pointer
+                    + ") WITH p, p.version AS old SET p.version = $version "
+                    + "RETURN old",
+                    params,
+                ).single()
+            except Exception:
+                tx.rollback()
+                raise
+            tx.commit()
+        print("Model version " + version + " is now active")
+
+        old_version = record["old"] if record else None
+        if not old_version:
+            return version, None
+
+        old_params = dict(model_params)
+        old_params[version_key] = old_version
+        if not background_gc:
+            self._delete_matching(old_params)
+            return version, None
+
+        gc_thread = threading.Thread(target=self._delete_matching, args=(old_params,))
+        gc_thread.start()
+        return version, gc_thread
+
+    def active_version(self, model_params):
+        """Get the version id of a model loaded using `commit_blue_green`.
+
+        Args:
+            model_params (dict): Global parameters identifying the model.
+
+        Returns:
+            str: The version id, or None if no version is active.
+        """
+        with self.driver.session() as session:
+            where, params = properties_predicate("p", model_params)
+            record = session.run(
+                "MATCH (p:`"
+                + ACTIVE_MODEL_LABEL
+                + "`) WHERE "
+                + where
+                + " RETURN p.version AS version",
+                params,
+            ).single()
+        return record["version"] if record else None
+
+    def _commit_parallel(self, commit_batch, tx_scope, workers, prefetch_size=0):
+        """Load sources concurrently, one priority level at a time.
+
+        Concurrent MERGEs of the same node only see each other's writes once
+        committed, so sources in a level can create duplicate nodes unless
+        uniqueness constraints cover the properties merged on.
+
+        Args:
+            commit_batch (callable): Commits a :obj:`CypherQueryBatch` given a
+                session and the batch.
+            tx_scope (str): Either 'query' or 'file'.
+            workers (int): Number of threads, each with its own session.
+            prefetch_size (int): Number of priority levels which may be
+                prepared ahead of the one being loaded.
+        """
+        if tx_scope not in ["query", "file"]:
+            raise ValueError(
+                "Only the 'query' and 'file' transaction scopes can be used "
+                + "with more than one worker, not '{0}'".format(tx_scope)
+            )
+
+        levels = self._iterlevels()
+        if prefetch_size > 0:
+            levels = prefetch(levels, prefetch_size)
+
+        jobs = SpanSwitch(self.tracer, "job") if self.tracer is not None else None
+        pool = ThreadPool(workers)
+        try:
+            awaiting_indexes = False
+            for sources in levels:
+                if jobs is not None:
+                    jobs.switch(sources[0][0][0], job=sources[0][0][0])
+                if is_schema_level(sources[0][0]):
+                    awaiting_indexes = True
+                elif awaiting_indexes:
+                    with self.driver.session() as session:
+                        self._await_indexes(session)
+                    awaiting_indexes = False
+                # map blocks until the whole level is loaded, acting as a
+                # barrier before the next level starts.
+                pool.map(
+                    partial(
+                        self._commit_source,
+                        commit_batch=commit_batch,
+                        tx_scope=tx_scope,
+                    ),
+                    sources,
                 )
-                print("Exception: %s" % str(e), file=sys.stderr)
-                sys.exit(1)
+        finally:
+            # Stops any prefetching if loading failed
+            levels.close()
+            if jobs is not None:
+                jobs.close()
+            pool.close()
+            pool.join()
+
+    def _commit_source(self, source, commit_batch, tx_scope):
+        """Load the queries from a single source using a new session.
 
-    def commit(self):
-        """Load all queries loaded into :obj:`GraphLoader` into the graph."""
-        for cypher_query in self.iterqueries():
+        Args:
+            source (tuple): A (level, queries) pair yielded by `_itersources`.
+            commit_batch (callable): Commits a :obj:`CypherQueryBatch` given a
+                session and the batch.
+            tx_scope (str): Either 'query' or 'file'.
+        """
+        level, queries = source
+        file_span = None
+        if self.tracer is not None:
+            queries = list(queries)
+            file_span = self.tracer.start_span("file", **self._file_span(queries)[1])
+        try:
             with self.driver.session() as session:
+                if tx_scope == "query":
+                    for cypher_query in queries:
+                        commit_batch(session, CypherQueryBatch([cypher_query], level))
+                else:
+                    queries = list(queries)
+                    if queries:
+                        commit_batch(session, CypherQueryBatch(queries, level))
+        finally:
+            if file_span is not None:
+                file_span.end()
+
+    def _commit_batch(
+        self,
+        session,
+        batch,
+        tx_scope,
+        checkpoint=None,
+        max_retries=0,
+        retry_delay=1.0,
+        query_timeout=None,
+        slow_log=None,
+    ):
+        """Commit a batch, retrying transient errors and recording success.
+
+        Args:
+            session: A database session.
+            batch (:obj:`CypherQueryBatch`)
+            tx_scope (str): The transaction scope the batch was made with.
+                Batches made with the 'query' scope are run without an
+                explicit transaction.
+            checkpoint (:obj:`CheckpointLog`, optional): Log of committed
+                batches. Batches already in the log are skipped.
+            max_retries (int): Number of retries after transient errors.
+            retry_delay (float): Seconds to wait before the first retry.
+            query_timeout (float, optional): Seconds after which the database
+                aborts the query or, outside the 'query' scope, the batch's
+                transaction.
+            slow_log (:obj:`SlowQueryLog`, optional): Records the time taken
+                by each query and by the batch.
+        """
+        if checkpoint is not None and batch in checkpoint:
+            return
+
+        metrics = self.metrics
+        batch_span = None
+        if self.tracer is not None:
+            batch_span = self.tracer.start_span(
+                "batch", ident=batch.ident, queries=len(batch), level=batch.level
+            )
+        start = timer()
+        attempt = 0
+        failed = True
+        try:
+            while True:
                 try:
-                    session.run(cypher_query.statement, cypher_query.params)
-                except CypherSyntaxError as e:
-                    print("Offending cypher query:\n" + repr(cypher_query))
+                    if tx_scope == "query":
+                        self._run_query(
+                            session, batch.queries[0], query_timeout, slow_log
+                        )
+                    else:
+                        self._run_batch(session, batch, query_timeout, slow_log)
+                    failed = False
+                    break
+                except TRANSIENT_ERRORS as e:
+                    if attempt >= max_retries:
+                        if metrics is not None:
+                            metrics.inc("batches_failed_total")
+                        raise
+                    delay = retry_delay * 2 ** attempt
+                    print(
+                        "Transient error committing {0}, retrying in {1}s: {2}".format(
+                            batch.ident, delay, e
+                        ),
+                        file=sys.stderr,
+                    )
+                    time.sleep(delay)
+                    attempt += 1
+                    if metrics is not None:
+                        metrics.inc("retries_total")
+                except Exception:
+                    if metrics is not None:
+                        metrics.inc("batches_failed_total")
                     raise
+        finally:
+            if batch_span is not None:
+                batch_span.set_attribute("attempts", attempt + 1)
+                batch_span.end()
+            elapsed = timer() - start
+            # Single queries are already recorded by _run_query
+            if slow_log is not None and tx_scope != "query":
+                slow_log.record_batch(batch, elapsed, failed=failed)
+
+        if metrics is not None:
+            metrics.observe("batch_seconds", elapsed)
+            metrics.inc("batches_committed_total")
+            metrics.inc("queries_committed_total", len(batch.queries))
+
+        # Only reached once every result in the batch has been consumed, so
+        # the batch is known to have succeeded
+        if checkpoint is not None:
+            checkpoint.record(batch)
+
+    def _run_query(self, runner, cypher_query, timeout=None, slow_log=None):
+        """Run a single query, reporting it if it contains a syntax error.
+
+        Args:
+            runner: A database session or transaction.
+            cypher_query (:obj:`CypherQuery`)
+            timeout (float, optional): Seconds after which the database aborts
+                the query. Only supported when `runner` is a session.
+            slow_log (:obj:`SlowQueryLog`, optional): Records the time taken,
+                up to the server finishing with the query.
+        """
+        query_span = None
+        if self.tracer is not None:
+            query_span = self.tracer.start_span(
+                "query", **source_attributes(cypher_query.source)
+            )
+        statement = cypher_query.statement
+        if timeout is not None:
+            statement = Query(statement, timeout=timeout)
+        start = timer()
+        failed = True
+        try:
+            # Results are fetched lazily, so wait for the server to finish
+            # with the query, making errors surface against the query which
+            # caused them
+            runner.run(statement, cypher_query.params).consume()
+            failed = False
+        except CypherSyntaxError:
+            print("Offending cypher query:\n" + repr(cypher_query))
+            raise
+        finally:
+            elapsed = timer() - start
+            if query_span is not None:
+                query_span.end()
+            if slow_log is not None:
+                slow_log.record_query(cypher_query, elapsed, failed=failed)
+        if self.metrics is not None:
+            self.metrics.observe("query_seconds", elapsed)
+
+    def _run_batch(self, session, batch, timeout=None, slow_log=None):
+        """Run every query in a batch inside a single explicit transaction.
+
+        Args:
+            session: A database session.
+            batch (:obj:`CypherQueryBatch`)
+            timeout (float, optional): Seconds after which the database aborts
+                the transaction.
+            slow_log (:obj:`SlowQueryLog`, optional): Records the time taken
+                by each query.
+        """
+        if timeout is not None:
+            tx = session.begin_transaction(timeout=timeout)
+        else:
+            tx = session.begin_transaction()
+        try:
+            for cypher_query in batch:
+                self._run_query(tx, cypher_query, slow_log=slow_log)
+        except Exception:
+            tx.rollback()
+            raise
+        tx.commit()
 
 
 class EmbeddedGraphLoader(GraphLoader):
@@ -269,41 +1524,100 @@ class EmbeddedGraphLoader(GraphLoader):
     will allow cymod to be used within Java applicatons to provide data to an
     embedded Neo4j instance.
 
-    Using cymod within Java applications is useful when using Neo4j and Cypher 
-    in situations in which a Java application will have access to a JRE but no 
+    Using cymod within Java applications is useful when using Neo4j and Cypher
+    in situations in which a Java application will have access to a JRE but no
     Neo4j server will be available.
     """
 
     def __init__(self):
         super(EmbeddedGraphLoader, self).__init__()
 
-        self.param_re = re.compile(r"(\$)([a-zA-Z1-9_]*)")
+        # Statement/ StatementTemplate pairs, so each distinct statement is
+        # only parsed once
+        self._templates = {}
 
     def _query_to_concrete_str(self, cypher_query):
         """Convert a parameterised :obj:`CypherQuery` to a concrete string.
-        
+
         Args:
             cypher_query (:obj:`CypherQuery`)
-            
+
         Returns:
-            str: Cypher query with parameter placeholders replaced with 
-                concrete values.
+            str: Cypher query with parameter placeholders replaced with
+                concrete values, expressed as Cypher literals.
         """
-        param_matches = self.param_re.findall(cypher_query.statement)
-        working_string = cypher_query.statement
-        for match in param_matches:
-            param_string = "".join(match)
-            working_string = working_string.replace(
-                param_string, str(cypher_query.params[match[1]])
-            )
-        return working_string
+        statement = cypher_query.statement
+        try:
+            template = self._templates[statement]
+        except KeyError:
+            template = self._templates[statement] = StatementTemplate(statement)
+        return template.render(cypher_query.params or {})
 
     def query_generator(self):
         """Generate concrete strings representing each loaded query.
-        
+
         Yields:
-            str: Queries with parameter placeholders replaced with concrete 
+            str: Queries with parameter placeholders replaced with concrete
                 values.
         """
         for q in self.iterqueries():
             yield self._query_to_concrete_str(q)
+
+    def query_chunks(self, chunk_size=1000, as_array=False):
+        """Generate concrete query strings in chunks.
+
+        Fetching many queries at a time reduces the number of calls made
+        across the Jython/ Java boundary.
+
+        Args:
+            chunk_size (int): Maximum number of queries in each chunk.
+                Defaults to 1000.
+            as_array (bool): If True, each chunk is a Java String[] rather
+                than a Python list. Only available under Jython. Defaults to
+                False.
+
+        Yields:
+            list of str: Queries with parameter placeholders replaced with
+                concrete values.
+        """
+        if as_array:
+            import jarray
+            from java.lang import String
+
+        queries = self.query_generator()
+        while True:
+            chunk = list(itertools.islice(queries, chunk_size))
+            if not chunk:
+                return
+            yield jarray.array(chunk, String) if as_array else chunk
+
+    def write_script(self, filename, tx_size=1000, buffer_size=65536):
+        """Write every concrete query to a single script file.
+
+        Queries are grouped into transactions of at most `tx_size` queries,
+        each delimited by ':begin' and ':commit' lines. Schema statements are
+        kept out of transactions containing data statements. Statements which
+        commit their own transactions, such as the LOAD CSV queries of tables
+        loaded with an `import_dir`, are written on their own, outside any
+        transaction.
+
+        Args:
+            filename (str): Path of the script file to write.
+            tx_size (int): Maximum number of queries in each transaction.
+                Defaults to 1000.
+            buffer_size (int): Size in bytes of the file's write buffer.
+                Defaults to 65536.
+
+        Returns:
+            int: The number of queries written.
+        """
+        count = 0
+        with open(filename, "w", buffer_size) as f:
+            for block in iter_transaction_blocks(self.iterqueries(), tx_size):
+                write_transaction_block(
+                    f,
+                    [self._query_to_concrete_str(q) for q in block],
+                    explicit=not block[0].needs_auto_commit,
+                )
+                count += len(block)
+        return count
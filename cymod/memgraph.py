@@ -0,0 +1,1668 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.memgraph
+~~~~~~~~~~~~~~
+
+An in-process graph which understands the subset of Cypher generated by cymod,
+behind the same driver/ session/ transaction interface as the Neo4j driver.
+
+It allows models to be loaded and their resulting graphs checked without a
+running database, e.g.::
+
+    driver = MemoryDriver()
+    loader = ServerGraphLoader.from_driver(driver)
+    loader.load_cypher("model/")
+    loader.commit()
+    driver.graph.duplicate_nodes()
+
+Supported clauses are MATCH, OPTIONAL MATCH, MERGE (with ON CREATE/ ON MATCH
+SET), CREATE, WITH, UNWIND, WHERE, SET, DELETE, DETACH DELETE and RETURN, with
+patterns made of nodes and single-hop relationships. Schema statements are
+accepted but have no effect, as every label and property combination is
+indexed automatically.
+"""
+from __future__ import print_function
+
+import re
+import numbers
+import threading
+import itertools
+
+import six
+from neo4j.exceptions import CypherSyntaxError
+
+from cymod.cybase import SCHEMA_STATEMENT_RE
+
+
+TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+|//[^\n]*|/\*.*?\*/)
+    |(?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    |(?P<number>(?:\d+\.\d+|\d+)(?:[eE][-+]?\d+)?)
+    |(?P<param>\$(?:`[^`]+`|[A-Za-z_][A-Za-z0-9_]*))
+    |(?P<name>`[^`]*`|[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<symbol><>|<=|>=|\+=|->|<-|[-<>()\[\]{}:,.;=*+/%|])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+STRING_ESCAPE_RE = re.compile(r"\\(u[0-9a-fA-F]{4}|.)", re.DOTALL)
+STRING_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+KEYWORDS = set(
+    """MATCH OPTIONAL MERGE CREATE WITH WHERE UNWIND SET DELETE DETACH REMOVE
+    RETURN ORDER BY SKIP LIMIT ON CALL YIELD AS DISTINCT AND OR XOR NOT IN IS
+    NULL TRUE FALSE ASC DESC ASCENDING DESCENDING FOREACH LOAD UNION""".split()
+)
+AGGREGATES = set(["count", "collect", "sum", "min", "max", "avg"])
+# Procedures which only wait for the schema, which is always up to date here
+NOOP_PROCEDURES = set(["db.awaitindexes", "db.awaitindex"])
+
+
+class Node(object):
+    """A node in a :obj:`MemoryGraph`.
+
+    Attrs:
+        id (int): Identifier, unique within the graph.
+        labels (set of str)
+        properties (dict)
+    """
+
+    __slots__ = ("id", "labels", "properties")
+
+    def __init__(self, node_id, labels, properties):
+        self.id = node_id
+        self.labels = labels
+        self.properties = properties
+
+    def __getitem__(self, key):
+        return self.properties[key]
+
+    def get(self, key, default=None):
+        return self.properties.get(key, default)
+
+    def __repr__(self):
+        return "<Node id={0} labels={1} properties={2}>".format(
+            self.id, sorted(self.labels), self.properties
+        )
+
+
+class Relationship(object):
+    """A relationship in a :obj:`MemoryGraph`.
+
+    Attrs:
+        id (int): Identifier, unique within the graph.
+        type (str)
+        start (:obj:`Node`)
+        end (:obj:`Node`)
+        properties (dict)
+    """
+
+    __slots__ = ("id", "type", "start", "end", "properties")
+
+    def __init__(self, rel_id, rel_type, start, end, properties):
+        self.id = rel_id
+        self.type = rel_type
+        self.start = start
+        self.end = end
+        self.properties = properties
+
+    def __getitem__(self, key):
+        return self.properties[key]
+
+    def get(self, key, default=None):
+        return self.properties.get(key, default)
+
+    def __repr__(self):
+        return "<Relationship id={0} ({1})-[:{2}]->({3}) properties={4}>".format(
+            self.id, self.start.id, self.type, self.end.id, self.properties
+        )
+
+
+def _is_bool(value):
+    return isinstance(value, bool) or type(value).__name__ == "bool_"
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not _is_bool(value)
+
+
+def _hashable(value):
+    """Build a hashable key for a value, distinguishing Cypher types.
+
+    Booleans and numbers compare equal in Python but not in Cypher, so keys
+    are tagged with their type.
+    """
+    if value is None:
+        return ("null",)
+    if _is_bool(value):
+        return ("bool", bool(value))
+    if _is_number(value):
+        return ("number", value)
+    if isinstance(value, six.string_types):
+        return ("string", value)
+    if isinstance(value, (list, tuple)):
+        return ("list", tuple(_hashable(v) for v in value))
+    if isinstance(value, dict):
+        return ("map", tuple(sorted((k, _hashable(v)) for k, v in value.items())))
+    return ("entity", value)
+
+
+def _equals(a, b):
+    """Compare values as Cypher's '=' does, returning None if either is null."""
+    if a is None or b is None:
+        return None
+    return _hashable(a) == _hashable(b)
+
+
+class MemoryGraph(object):
+    """A graph held in memory, which can run the Cypher cymod generates.
+
+    Nodes are indexed by label, and by every label and property combination,
+    so node lookups by label and property are constant time.
+
+    Attrs:
+        nodes (dict): Node id/ :obj:`Node` pairs.
+        relationships (dict): Relationship id/ :obj:`Relationship` pairs.
+        lock (:obj:`threading.Lock`): Held by transactions while they're
+            open, and by auto-committed statements while they run, so
+            transactions are serialised. It isn't owned by a thread, so a
+            transaction may be used from several threads in turn.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.relationships = {}
+        self.lock = threading.Lock()
+        self._ids = itertools.count()
+        self._out = {}
+        self._in = {}
+        self._label_index = {}
+        self._property_index = {}
+        self._parsed = {}
+        # Inverse operations of changes made by the current statement
+        self._undo = None
+        self._counters = None
+
+    # Primitive changes, which keep the indexes up to date
+
+    def _index_property(self, node, label, key, value, add):
+        index = self._property_index.setdefault((label, key), {})
+        hkey = _hashable(value)
+        if add:
+            index.setdefault(hkey, set()).add(node.id)
+        else:
+            ids = index.get(hkey)
+            if ids is not None:
+                ids.discard(node.id)
+                if not ids:
+                    del index[hkey]
+
+    def _index_label(self, node, label, add):
+        if add:
+            self._label_index.setdefault(label, set()).add(node.id)
+        else:
+            self._label_index[label].discard(node.id)
+        for key, value in node.properties.items():
+            self._index_property(node, label, key, value, add)
+
+    def _add_node(self, node):
+        self.nodes[node.id] = node
+        self._out[node.id] = set()
+        self._in[node.id] = set()
+        for label in node.labels:
+            self._index_label(node, label, True)
+
+    def _remove_node(self, node):
+        for label in node.labels:
+            self._index_label(node, label, False)
+        del self.nodes[node.id]
+        del self._out[node.id]
+        del self._in[node.id]
+
+    def _add_relationship(self, rel):
+        self.relationships[rel.id] = rel
+        self._out[rel.start.id].add(rel.id)
+        self._in[rel.end.id].add(rel.id)
+
+    def _remove_relationship(self, rel):
+        del self.relationships[rel.id]
+        self._out[rel.start.id].discard(rel.id)
+        self._in[rel.end.id].discard(rel.id)
+
+    def _set_property(self, entity, key, value):
+        """Set or, if value is None, remove a property. Returns the old value."""
+        old = entity.properties.get(key)
+        is_node = isinstance(entity, Node)
+        if old is not None:
+            if is_node:
+                for label in entity.labels:
+                    self._index_property(entity, label, key, old, False)
+            del entity.properties[key]
+        if value is not None:
+            entity.properties[key] = value
+            if is_node:
+                for label in entity.labels:
+                    self._index_property(entity, label, key, value, True)
+        return old
+
+    def _add_label(self, node, label):
+        node.labels.add(label)
+        self._index_label(node, label, True)
+
+    def _remove_label(self, node, label):
+        self._index_label(node, label, False)
+        node.labels.discard(label)
+
+    # Changes made by statements, which can be undone
+
+    def _log(self, fn, *args):
+        if self._undo is not None:
+            self._undo.append((fn, args))
+
+    def _count(self, counter, n=1):
+        if self._counters is not None:
+            self._counters[counter] = self._counters.get(counter, 0) + n
+
+    def create_node(self, labels, properties):
+        props = dict((k, v) for k, v in properties.items() if v is not None)
+        node = Node(six.next(self._ids), set(labels), props)
+        self._add_node(node)
+        self._log(self._remove_node, node)
+        self._count("nodes_created")
+        self._count("labels_added", len(node.labels))
+        self._count("properties_set", len(props))
+        return node
+
+    def create_relationship(self, rel_type, start, end, properties):
+        props = dict((k, v) for k, v in properties.items() if v is not None)
+        rel = Relationship(six.next(self._ids), rel_type, start, end, props)
+        self._add_relationship(rel)
+        self._log(self._remove_relationship, rel)
+        self._count("relationships_created")
+        self._count("properties_set", len(props))
+        return rel
+
+    def delete_relationship(self, rel):
+        if rel.id not in self.relationships:
+            return
+        self._remove_relationship(rel)
+        self._log(self._add_relationship, rel)
+        self._count("relationships_deleted")
+
+    def delete_node(self, node, detach=False):
+        if node.id not in self.nodes:
+            return
+        rel_ids = self._out[node.id] | self._in[node.id]
+        if rel_ids and not detach:
+            raise ValueError(
+                "Cannot delete node {0}, because it still has relationships. "
+                "To delete this node, you must first delete its "
+                "relationships.".format(node.id)
+            )
+        for rel_id in sorted(rel_ids):
+            self.delete_relationship(self.relationships[rel_id])
+        self._remove_node(node)
+        self._log(self._add_node, node)
+        self._count("nodes_deleted")
+
+    def set_property(self, entity, key, value):
+        old = self._set_property(entity, key, value)
+        self._log(self._set_property, entity, key, old)
+        self._count("properties_set")
+
+    def add_label(self, node, label):
+        if label not in node.labels:
+            self._add_label(node, label)
+            self._log(self._remove_label, node, label)
+            self._count("labels_added")
+
+    def _rollback(self, undo):
+        for fn, args in reversed(undo):
+            fn(*args)
+
+    # Lookups
+
+    def find_nodes(self, labels=(), properties=None):
+        """Find the nodes with all of the given labels and property values.
+
+        Args:
+            labels (iterable of str)
+            properties (dict, optional): Property name/ value pairs.
+
+        Returns:
+            list of :obj:`Node`
+        """
+        properties = properties or {}
+        if any(v is None for v in properties.values()):
+            return []
+        # Use the smallest of the label and label/ property index entries
+        candidates = None
+        for label in labels:
+            ids = [self._label_index.get(label, set())]
+            for key, value in properties.items():
+                index = self._property_index.get((label, key), {})
+                ids.append(index.get(_hashable(value), set()))
+            smallest = min(ids, key=len)
+            if candidates is None or len(smallest) < len(candidates):
+                candidates = smallest
+        if candidates is None:
+            candidates = self.nodes.keys()
+
+        hprops = [(k, _hashable(v)) for k, v in properties.items()]
+        found = []
+        for node_id in candidates:
+            node = self.nodes[node_id]
+            if not all(label in node.labels for label in labels):
+                continue
+            if all(
+                k in node.properties and _hashable(node.properties[k]) == v
+                for k, v in hprops
+            ):
+                found.append(node)
+        return sorted(found, key=lambda n: n.id)
+
+    def node_relationships(self, node, direction="both"):
+        """Get a node's relationships.
+
+        Args:
+            node (:obj:`Node`)
+            direction (str): 'out', 'in' or 'both'.
+
+        Returns:
+            list of :obj:`Relationship`
+        """
+        rel_ids = set()
+        if direction in ("out", "both"):
+            rel_ids |= self._out[node.id]
+        if direction in ("in", "both"):
+            rel_ids |= self._in[node.id]
+        return [self.relationships[i] for i in sorted(rel_ids)]
+
+    # Inspection
+
+    def node_count(self, label=None):
+        if label is None:
+            return len(self.nodes)
+        return len(self._label_index.get(label, ()))
+
+    def relationship_count(self, rel_type=None):
+        if rel_type is None:
+            return len(self.relationships)
+        return sum(1 for r in self.relationships.values() if r.type == rel_type)
+
+    def summary(self):
+        """Count nodes by label and relationships by type.
+
+        Returns:
+            dict: With 'nodes' and 'relationships' keys, each mapping a label
+                or type to a count.
+        """
+        rel_counts = {}
+        for rel in self.relationships.values():
+            rel_counts[rel.type] = rel_counts.get(rel.type, 0) + 1
+        return {
+            "nodes": dict(
+                (label, len(ids)) for label, ids in self._label_index.items() if ids
+            ),
+            "relationships": rel_counts,
+        }
+
+    def duplicate_nodes(self, label=None):
+        """Find nodes indistinguishable from each other.
+
+        Nodes are duplicates if they have the same labels and properties, and
+        relationships of the same types and properties to the same nodes, as
+        would result from running a CREATE clause twice.
+
+        Args:
+            label (str, optional): Only consider nodes with this label.
+
+        Returns:
+            list of list of :obj:`Node`: Groups of duplicate nodes.
+        """
+        nodes = (
+            [self.nodes[i] for i in self._label_index.get(label, ())]
+            if label
+            else self.nodes.values()
+        )
+        groups = {}
+        for node in nodes:
+            neighbours = sorted(
+                (
+                    rel.start is node,
+                    rel.type,
+                    (rel.end if rel.start is node else rel.start).id,
+                    _hashable(rel.properties),
+                )
+                for rel in self.node_relationships(node)
+            )
+            key = (
+                tuple(sorted(node.labels)),
+                _hashable(node.properties),
+                tuple(neighbours),
+            )
+            groups.setdefault(key, []).append(node)
+        return [
+            sorted(g, key=lambda n: n.id) for g in groups.values() if len(g) > 1
+        ]
+
+    def duplicate_relationships(self):
+        """Find parallel relationships with the same type and properties.
+
+        Returns:
+            list of list of :obj:`Relationship`: Groups of duplicates.
+        """
+        groups = {}
+        for rel in self.relationships.values():
+            key = (rel.start.id, rel.type, rel.end.id, _hashable(rel.properties))
+            groups.setdefault(key, []).append(rel)
+        return [
+            sorted(g, key=lambda r: r.id) for g in groups.values() if len(g) > 1
+        ]
+
+    # Running statements
+
+    def _parse(self, statement):
+        try:
+            return self._parsed[statement]
+        except KeyError:
+            parsed = self._parsed[statement] = _Parser(statement).parse_statement()
+            return parsed
+
+    def execute(self, statement, params=None, undo=None):
+        """Run a statement, undoing its changes if it fails.
+
+        Args:
+            statement (str): Cypher statement.
+            params (dict, optional): Parameter name/ value pairs.
+            undo (list, optional): If given, inverse operations of the changes
+                made are appended, so they can be undone later. The caller
+                must hold `lock`, as a transaction does.
+
+        Returns:
+            :obj:`MemoryResult`
+        """
+        if undo is None:
+            with self.lock:
+                return self._execute(statement, params, undo)
+        return self._execute(statement, params, undo)
+
+    def _execute(self, statement, params, undo):
+        parsed = self._parse(statement)
+        self._undo = []
+        self._counters = {}
+        try:
+            keys, rows = _Executor(self, params or {}).run(parsed)
+        except Exception:
+            self._rollback(self._undo)
+            raise
+        finally:
+            statement_undo = self._undo
+            counters = self._counters
+            self._undo = None
+            self._counters = None
+        if undo is not None:
+            undo.extend(statement_undo)
+        return MemoryResult(keys, rows, counters)
+
+
+class _Parser(object):
+    """Parses the supported subset of Cypher into nested tuples."""
+
+    def __init__(self, statement):
+        self.statement = statement
+        self.tokens = []
+        pos = 0
+        while pos < len(statement):
+            match = TOKEN_RE.match(statement, pos)
+            if match is None:
+                raise CypherSyntaxError(
+                    "Invalid input at position {0}: {1!r}".format(
+                        pos, statement[pos : pos + 20]
+                    )
+                )
+            kind = match.lastgroup
+            if kind != "ws":
+                self.tokens.append((kind, match.group(), match.start(), match.end()))
+            pos = match.end()
+        self.pos = 0
+        self._anon = itertools.count()
+
+    # Token helpers
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else (None, None, None, None)
+
+    def error(self, message=None):
+        kind, text, start, _ = self.peek()
+        raise CypherSyntaxError(
+            (message or "Unexpected input")
+            + (" at '{0}' (position {1})".format(text, start) if kind else " at end")
+            + " in: "
+            + self.statement
+        )
+
+    def is_kw(self, *words):
+        kind, text, _, _ = self.peek()
+        return kind == "name" and text.upper() in words and not text.startswith("`")
+
+    def accept_kw(self, *words):
+        if self.is_kw(*words):
+            self.pos += 1
+            return True
+        return False
+
+    def expect_kw(self, *words):
+        if not self.accept_kw(*words):
+            self.error("Expected " + "/".join(words))
+
+    def is_sym(self, *symbols):
+        kind, text, _, _ = self.peek()
+        return kind == "symbol" and text in symbols
+
+    def accept_sym(self, *symbols):
+        if self.is_sym(*symbols):
+            self.pos += 1
+            return self.tokens[self.pos - 1][1]
+        return None
+
+    def expect_sym(self, symbol):
+        if not self.accept_sym(symbol):
+            self.error("Expected '" + symbol + "'")
+
+    def name(self):
+        kind, text, _, _ = self.peek()
+        if kind != "name":
+            self.error("Expected a name")
+        self.pos += 1
+        return text[1:-1] if text.startswith("`") else text
+
+    def variable(self):
+        kind, text, _, _ = self.peek()
+        if kind == "name" and (text.startswith("`") or text.upper() not in KEYWORDS):
+            return self.name()
+        return None
+
+    def anonymous(self):
+        return "  anon{0}".format(six.next(self._anon))
+
+    # Statements and clauses
+
+    def parse_statement(self):
+        if SCHEMA_STATEMENT_RE.match(self.statement):
+            return [("SCHEMA",)]
+        clauses = []
+        while self.peek()[0] is not None and not self.is_sym(";"):
+            clauses.append(self.clause())
+        self.accept_sym(";")
+        if self.peek()[0] is not None:
+            self.error("Only one statement can be run at a time")
+        if not clauses:
+            self.error("Empty statement")
+        return clauses
+
+    def clause(self):
+        if self.accept_kw("OPTIONAL"):
+            self.expect_kw("MATCH")
+            return self.match_clause(optional=True)
+        if self.accept_kw("MATCH"):
+            return self.match_clause(optional=False)
+        if self.accept_kw("MERGE"):
+            pattern = self.pattern()
+            on_create, on_match = [], []
+            while self.is_kw("ON"):
+                self.pos += 1
+                if self.accept_kw("CREATE"):
+                    target = on_create
+                else:
+                    self.expect_kw("MATCH")
+                    target = on_match
+                self.expect_kw("SET")
+                target.extend(self.set_items())
+            return ("MERGE", pattern, on_create, on_match)
+        if self.accept_kw("CREATE"):
+            return ("CREATE", self.patterns())
+        if self.accept_kw("WITH"):
+            return ("WITH",) + self.projection(allow_where=True)
+        if self.accept_kw("RETURN"):
+            return ("RETURN",) + self.projection(allow_where=False)
+        if self.accept_kw("UNWIND"):
+            expr = self.expression()
+            self.expect_kw("AS")
+            return ("UNWIND", expr, self.name())
+        if self.accept_kw("SET"):
+            return ("SET", self.set_items())
+        if self.accept_kw("DETACH"):
+            self.expect_kw("DELETE")
+            return ("DELETE", self.expression_list(), True)
+        if self.accept_kw("DELETE"):
+            return ("DELETE", self.expression_list(), False)
+        if self.accept_kw("REMOVE"):
+            return ("REMOVE", self.remove_items())
+        if self.accept_kw("CALL"):
+            parts = [self.name()]
+            while self.accept_sym("."):
+                parts.append(self.name())
+            args = []
+            if self.accept_sym("("):
+                if not self.is_sym(")"):
+                    args = self.expression_list()
+                self.expect_sym(")")
+            return ("CALL", ".".join(parts), args)
+        self.error("Unsupported clause")
+
+    def match_clause(self, optional):
+        patterns = self.patterns()
+        where = self.expression() if self.accept_kw("WHERE") else None
+        return ("MATCH", patterns, where, optional)
+
+    def projection(self, allow_where):
+        distinct = self.accept_kw("DISTINCT")
+        if self.accept_sym("*"):
+            items = None
+        else:
+            items = []
+            while True:
+                start = self.peek()[2]
+                expr = self.expression()
+                if self.accept_kw("AS"):
+                    alias = self.name()
+                elif expr[0] == "var":
+                    alias = expr[1]
+                else:
+                    alias = self.statement[start : self.tokens[self.pos - 1][3]]
+                items.append((expr, alias))
+                if not self.accept_sym(","):
+                    break
+        order = []
+        if self.accept_kw("ORDER"):
+            self.expect_kw("BY")
+            while True:
+                expr = self.expression()
+                desc = self.accept_kw("DESC", "DESCENDING")
+                if not desc:
+                    self.accept_kw("ASC", "ASCENDING")
+                order.append((expr, desc))
+                if not self.accept_sym(","):
+                    break
+        skip = self.expression() if self.accept_kw("SKIP") else None
+        limit = self.expression() if self.accept_kw("LIMIT") else None
+        where = None
+        if allow_where and self.accept_kw("WHERE"):
+            where = self.expression()
+        return items, distinct, order, skip, limit, where
+
+    def set_items(self):
+        items = []
+        while True:
+            var = self.name()
+            if self.accept_sym("."):
+                key = self.name()
+                self.expect_sym("=")
+                items.append(("property", var, key, self.expression()))
+            elif self.accept_sym("+="):
+                items.append(("merge", var, self.expression()))
+            elif self.accept_sym("="):
+                items.append(("replace", var, self.expression()))
+            elif self.is_sym(":"):
+                labels = []
+                while self.accept_sym(":"):
+                    labels.append(self.name())
+                items.append(("labels", var, labels))
+            else:
+                self.error("Unsupported SET item")
+            if not self.accept_sym(","):
+                return items
+
+    def remove_items(self):
+        items = []
+        while True:
+            var = self.name()
+            if self.accept_sym("."):
+                items.append(("property", var, self.name()))
+            else:
+                labels = []
+                while self.accept_sym(":"):
+                    labels.append(self.name())
+                if not labels:
+                    self.error("Unsupported REMOVE item")
+                items.append(("labels", var, labels))
+            if not self.accept_sym(","):
+                return items
+
+    # Patterns
+
+    def patterns(self):
+        patterns = [self.pattern()]
+        while self.accept_sym(","):
+            patterns.append(self.pattern())
+        return patterns
+
+    def pattern(self):
+        """Parse a path pattern.
+
+        Returns:
+            tuple: The node patterns and the relationship patterns between
+                them. Node patterns are (var, labels, properties) and
+                relationship patterns (var, types, properties, direction),
+                where direction is 'out', 'in' or 'both' going left to right.
+        """
+        if self.peek(1)[1] == "=" and self.peek()[0] == "name":
+            self.error("Path variables are not supported")
+        nodes = [self.node_pattern()]
+        rels = []
+        while self.is_sym("-", "<-"):
+            rels.append(self.relationship_pattern())
+            nodes.append(self.node_pattern())
+        return nodes, rels
+
+    def node_pattern(self):
+        self.expect_sym("(")
+        var = self.variable() or self.anonymous()
+        labels = []
+        while self.accept_sym(":"):
+            labels.append(self.name())
+        props = self.map_literal() if self.is_sym("{") else []
+        self.expect_sym(")")
+        return var, labels, props
+
+    def relationship_pattern(self):
+        incoming = self.accept_sym("<-") is not None
+        if not incoming:
+            self.expect_sym("-")
+        var, types, props = None, [], []
+        if self.accept_sym("["):
+            var = self.variable()
+            if self.accept_sym(":"):
+                types.append(self.name())
+                while self.accept_sym("|"):
+                    self.accept_sym(":")
+                    types.append(self.name())
+            if self.is_sym("*"):
+                self.error("Variable length relationships are not supported")
+            if self.is_sym("{"):
+                props = self.map_literal()
+            self.expect_sym("]")
+        outgoing = self.accept_sym("->") is not None
+        if not outgoing:
+            self.expect_sym("-")
+        if incoming and outgoing:
+            self.error("Relationships can't point both ways")
+        direction = "in" if incoming else "out" if outgoing else "both"
+        return var or self.anonymous(), types, props, direction
+
+    # Expressions
+
+    def expression_list(self):
+        exprs = [self.expression()]
+        while self.accept_sym(","):
+            exprs.append(self.expression())
+        return exprs
+
+    def expression(self):
+        left = self.xor_expression()
+        while self.accept_kw("OR"):
+            left = ("or", left, self.xor_expression())
+        return left
+
+    def xor_expression(self):
+        left = self.and_expression()
+        while self.accept_kw("XOR"):
+            left = ("xor", left, self.and_expression())
+        return left
+
+    def and_expression(self):
+        left = self.not_expression()
+        while self.accept_kw("AND"):
+            left = ("and", left, self.not_expression())
+        return left
+
+    def not_expression(self):
+        if self.accept_kw("NOT"):
+            return ("not", self.not_expression())
+        return self.comparison()
+
+    def comparison(self):
+        left = self.additive()
+        while True:
+            op = self.accept_sym("=", "<>", "<", ">", "<=", ">=")
+            if op:
+                left = ("cmp", op, left, self.additive())
+            elif self.accept_kw("IN"):
+                left = ("in", left, self.additive())
+            elif self.accept_kw("IS"):
+                negate = self.accept_kw("NOT")
+                self.expect_kw("NULL")
+                left = ("isnull", left, negate)
+            else:
+                return left
+
+    def additive(self):
+        left = self.multiplicative()
+        while True:
+            op = self.accept_sym("+", "-")
+            if not op:
+                return left
+            left = ("arith", op, left, self.multiplicative())
+
+    def multiplicative(self):
+        left = self.unary()
+        while True:
+            op = self.accept_sym("*", "/", "%")
+            if not op:
+                return left
+            left = ("arith", op, left, self.unary())
+
+    def unary(self):
+        if self.accept_sym("-"):
+            return ("neg", self.unary())
+        self.accept_sym("+")
+        return self.postfix()
+
+    def postfix(self):
+        expr = self.atom()
+        while True:
+            if self.accept_sym("."):
+                expr = ("prop", expr, self.name())
+            elif self.accept_sym("["):
+                index = self.expression()
+                self.expect_sym("]")
+                expr = ("index", expr, index)
+            else:
+                return expr
+
+    def atom(self):
+        kind, text, _, _ = self.peek()
+        if kind == "number":
+            self.pos += 1
+            if "." in text or "e" in text or "E" in text:
+                return ("lit", float(text))
+            return ("lit", int(text))
+        if kind == "string":
+            self.pos += 1
+            return ("lit", _decode_string(text))
+        if kind == "param":
+            self.pos += 1
+            name = text[1:]
+            return ("param", name[1:-1] if name.startswith("`") else name)
+        if self.accept_sym("("):
+            expr = self.expression()
+            self.expect_sym(")")
+            return expr
+        if self.accept_sym("["):
+            items = [] if self.is_sym("]") else self.expression_list()
+            self.expect_sym("]")
+            return ("list", items)
+        if self.is_sym("{"):
+            return ("map", self.map_literal())
+        if kind == "name":
+            if self.accept_kw("NULL"):
+                return ("lit", None)
+            if self.accept_kw("TRUE"):
+                return ("lit", True)
+            if self.accept_kw("FALSE"):
+                return ("lit", False)
+            if self.peek(1)[1] == "(" and self.peek(1)[0] == "symbol":
+                return self.function_call()
+            var = self.variable()
+            if var is not None:
+                return ("var", var)
+        self.error()
+
+    def function_call(self):
+        name = self.name().lower()
+        self.expect_sym("(")
+        if name == "count" and self.accept_sym("*"):
+            self.expect_sym(")")
+            return ("call", name, "*", False)
+        distinct = self.accept_kw("DISTINCT")
+        args = [] if self.is_sym(")") else self.expression_list()
+        self.expect_sym(")")
+        return ("call", name, args, distinct)
+
+    def map_literal(self):
+        self.expect_sym("{")
+        entries = []
+        if not self.is_sym("}"):
+            while True:
+                key = self.name()
+                self.expect_sym(":")
+                entries.append((key, self.expression()))
+                if not self.accept_sym(","):
+                    break
+        self.expect_sym("}")
+        return entries
+
+
+def _decode_string(text):
+    def unescape(match):
+        escape = match.group(1)
+        if escape.startswith("u") and len(escape) == 5:
+            return six.unichr(int(escape[1:], 16))
+        return STRING_ESCAPES.get(escape, escape)
+
+    return STRING_ESCAPE_RE.sub(unescape, text[1:-1])
+
+
+def _is_aggregate(expr):
+    return expr[0] == "call" and expr[1] in AGGREGATES
+
+
+def _sort_key(value):
+    # Nulls sort last, as in Cypher
+    return (value is None, _hashable(value))
+
+
+def _to_number(value, convert):
+    if value is None or _is_number(value):
+        return None if value is None else convert(value)
+    try:
+        return convert(float(value)) if convert is int else convert(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_boolean(value):
+    if value is None or _is_bool(value):
+        return value
+    text = six.text_type(value).strip().lower()
+    return {"true": True, "false": False}.get(text)
+
+
+def _to_string(value):
+    if value is None:
+        return None
+    if _is_bool(value):
+        return "true" if value else "false"
+    return six.text_type(value)
+
+
+def _properties(value):
+    return value.properties if hasattr(value, "properties") else value
+
+
+def _null_safe(fn):
+    """Wrap a single argument function so it returns null given null."""
+    return lambda value: None if value is None else fn(value)
+
+
+SCALAR_FUNCTIONS = {
+    "tointeger": lambda v: _to_number(v, int),
+    "tofloat": lambda v: _to_number(v, float),
+    "toboolean": _to_boolean,
+    "tostring": _to_string,
+    "id": _null_safe(lambda e: e.id),
+    "labels": _null_safe(lambda n: sorted(n.labels)),
+    "type": _null_safe(lambda r: r.type),
+    "keys": _null_safe(lambda e: sorted(_properties(e))),
+    "properties": _null_safe(lambda e: dict(_properties(e))),
+    "size": _null_safe(len),
+}
+
+
+class _Executor(object):
+    """Runs parsed clauses against a :obj:`MemoryGraph`.
+
+    Rows are dicts mapping variable names to values, starting from a single
+    empty row, and each clause transforms the list of rows.
+    """
+
+    def __init__(self, graph, params):
+        self.graph = graph
+        self.params = params
+
+    def run(self, clauses):
+        rows = [{}]
+        keys = []
+        for clause in clauses:
+            kind = clause[0]
+            if kind == "SCHEMA":
+                return [], []
+            if kind == "RETURN":
+                keys, rows = self.project(rows, *clause[1:])
+                return keys, rows
+            rows = getattr(self, "clause_" + kind.lower())(rows, *clause[1:])
+        return keys, []
+
+    # Clauses
+
+    def clause_match(self, rows, patterns, where, optional):
+        result = []
+        for row in rows:
+            matched = False
+            for new_row in self.match_patterns(patterns, row):
+                if where is None or self.evaluate(where, new_row) is True:
+                    matched = True
+                    result.append(new_row)
+            if optional and not matched:
+                new_row = dict(row)
+                for nodes, rels in patterns:
+                    for var in [n[0] for n in nodes] + [r[0] for r in rels]:
+                        new_row.setdefault(var, None)
+                result.append(new_row)
+        return result
+
+    def clause_merge(self, rows, pattern, on_create, on_match):
+        result = []
+        for row in rows:
+            matches = list(self.match_patterns([pattern], row))
+            if matches:
+                for new_row in matches:
+                    self.apply_set_items(on_match, new_row)
+                result.extend(matches)
+            else:
+                new_row = self.create_pattern(pattern, row)
+                self.apply_set_items(on_create, new_row)
+                result.append(new_row)
+        return result
+
+    def clause_create(self, rows, patterns):
+        result = []
+        for row in rows:
+            for pattern in patterns:
+                row = self.create_pattern(pattern, row)
+            result.append(row)
+        return result
+
+    def clause_with(self, rows, items, distinct, order, skip, limit, where):
+        if items is None and not (distinct or order or skip or limit):
+            projected = rows
+        else:
+            _, projected = self.project(rows, items, distinct, order, skip, limit)
+        if where is not None:
+            projected = [r for r in projected if self.evaluate(where, r) is True]
+        return projected
+
+    def clause_unwind(self, rows, expr, var):
+        result = []
+        for row in rows:
+            values = self.evaluate(expr, row)
+            if values is None:
+                continue
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            for value in values:
+                new_row = dict(row)
+                new_row[var] = value
+                result.append(new_row)
+        return result
+
+    def clause_set(self, rows, items):
+        for row in rows:
+            self.apply_set_items(items, row)
+        return rows
+
+    def clause_remove(self, rows, items):
+        for row in rows:
+            for item in items:
+                entity = row.get(item[1])
+                if entity is None:
+                    continue
+                if item[0] == "property":
+                    self.graph.set_property(entity, item[2], None)
+                else:
+                    for label in item[2]:
+                        if label in entity.labels:
+                            self.graph._remove_label(entity, label)
+                            self.graph._log(self.graph._add_label, entity, label)
+        return rows
+
+    def clause_delete(self, rows, exprs, detach):
+        for row in rows:
+            for expr in exprs:
+                entity = self.evaluate(expr, row)
+                if isinstance(entity, Relationship):
+                    self.graph.delete_relationship(entity)
+                elif isinstance(entity, Node):
+                    self.graph.delete_node(entity, detach=detach)
+                elif entity is not None:
+                    raise ValueError("Can't delete {0!r}".format(entity))
+        return rows
+
+    def clause_call(self, rows, procedure, args):
+        if procedure.lower() not in NOOP_PROCEDURES:
+            raise ValueError(
+                "Procedure {0} is not supported by MemoryGraph".format(procedure)
+            )
+        return rows
+
+    # Projection
+
+    def project(self, rows, items, distinct, order, skip, limit, where=None):
+        """Evaluate WITH or RETURN items, aggregating if required.
+
+        Returns:
+            tuple: The projected column names and rows.
+        """
+        if items is None:
+            keys = sorted(
+                k for k in (rows[0] if rows else {}) if not k.startswith("  ")
+            )
+            projected = [dict((k, row[k]) for k in keys) for row in rows]
+            sources = rows
+        elif any(_is_aggregate(expr) for expr, _ in items):
+            keys = [alias for _, alias in items]
+            projected = self.aggregate(rows, items)
+            sources = projected
+        else:
+            keys = [alias for _, alias in items]
+            projected = [
+                dict((alias, self.evaluate(expr, row)) for expr, alias in items)
+                for row in rows
+            ]
+            sources = rows
+
+        if distinct:
+            seen = set()
+            unique = []
+            for row in projected:
+                key = tuple(_hashable(row[k]) for k in keys)
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(row)
+            projected = sources = unique
+
+        if order:
+            # Order expressions can refer to projected names or, without
+            # aggregation or DISTINCT, to variables in scope before projection
+            pairs = list(zip(projected, sources))
+
+            def sort_key(pair):
+                scope = dict(pair[1])
+                scope.update(pair[0])
+                return [self.evaluate(expr, scope) for expr, _ in order]
+
+            for i in reversed(range(len(order))):
+                pairs.sort(
+                    key=lambda p: _sort_key(sort_key(p)[i]), reverse=order[i][1]
+                )
+            projected = [p[0] for p in pairs]
+
+        if skip is not None:
+            projected = projected[self.evaluate(skip, {}) :]
+        if limit is not None:
+            projected = projected[: self.evaluate(limit, {})]
+        return keys, projected
+
+    def aggregate(self, rows, items):
+        group_items = [(e, a) for e, a in items if not _is_aggregate(e)]
+        groups = {}
+        order = []
+        for row in rows:
+            values = [self.evaluate(e, row) for e, _ in group_items]
+            key = tuple(_hashable(v) for v in values)
+            if key not in groups:
+                groups[key] = (values, [])
+                order.append(key)
+            groups[key][1].append(row)
+        if not rows and not group_items:
+            groups[()] = ([], [])
+            order.append(())
+
+        projected = []
+        for key in order:
+            values, group_rows = groups[key]
+            out = dict((a, v) for (_, a), v in zip(group_items, values))
+            for expr, alias in items:
+                if _is_aggregate(expr):
+                    out[alias] = self.aggregate_value(expr, group_rows)
+            projected.append(out)
+        return projected
+
+    def aggregate_value(self, expr, rows):
+        _, name, args, distinct = expr
+        if args == "*":
+            return len(rows)
+        values = [self.evaluate(args[0], row) for row in rows]
+        values = [v for v in values if v is not None]
+        if distinct:
+            seen = set()
+            unique = []
+            for v in values:
+                if _hashable(v) not in seen:
+                    seen.add(_hashable(v))
+                    unique.append(v)
+            values = unique
+        if name == "count":
+            return len(values)
+        if name == "collect":
+            return values
+        if not values:
+            return 0 if name == "sum" else None
+        if name == "sum":
+            return sum(values)
+        if name == "avg":
+            return float(sum(values)) / len(values)
+        key = lambda v: _hashable(v)
+        return min(values, key=key) if name == "min" else max(values, key=key)
+
+    # Patterns
+
+    def pattern_properties(self, props, row):
+        return dict((k, self.evaluate(e, row)) for k, e in props)
+
+    def node_matches(self, node_pattern, node, row):
+        var, labels, props = node_pattern
+        bound = row.get(var)
+        if var in row and bound is not node:
+            return False
+        if not all(label in node.labels for label in labels):
+            return False
+        for key, value in self.pattern_properties(props, row).items():
+            if _equals(node.properties.get(key), value) is not True:
+                return False
+        return True
+
+    def rel_matches(self, rel_pattern, rel, row):
+        var, types, props, _ = rel_pattern
+        if var in row and row[var] is not rel:
+            return False
+        if types and rel.type not in types:
+            return False
+        for key, value in self.pattern_properties(props, row).items():
+            if _equals(rel.properties.get(key), value) is not True:
+                return False
+        return True
+
+    def node_candidates(self, node_pattern, row):
+        var, labels, props = node_pattern
+        if var in row:
+            bound = row[var]
+            return [bound] if isinstance(bound, Node) else []
+        return self.graph.find_nodes(labels, self.pattern_properties(props, row))
+
+    def match_patterns(self, patterns, row, used=frozenset()):
+        """Generate rows extending `row` with bindings matching every pattern.
+
+        Relationships are only matched once per row, as in Cypher.
+        """
+        if not patterns:
+            yield row
+            return
+        for new_row, new_used in self.match_pattern(patterns[0], row, used):
+            for result in self.match_patterns(patterns[1:], new_row, new_used):
+                yield result
+
+    def match_pattern(self, pattern, row, used):
+        nodes, rels = pattern
+        # Start from a bound node if there is one, otherwise from the node
+        # pattern with fewest candidates
+        anchor, candidates = None, None
+        for i, node_pattern in enumerate(nodes):
+            if node_pattern[0] in row:
+                anchor, candidates = i, self.node_candidates(node_pattern, row)
+                break
+        if anchor is None:
+            for i, node_pattern in enumerate(nodes):
+                found = self.node_candidates(node_pattern, row)
+                if candidates is None or len(found) < len(candidates):
+                    anchor, candidates = i, found
+
+        steps = [(j, j + 1, False) for j in range(anchor, len(rels))]
+        steps += [(j, j, True) for j in range(anchor - 1, -1, -1)]
+
+        for node in candidates:
+            if not self.node_matches(nodes[anchor], node, row):
+                continue
+            start_row = dict(row)
+            start_row[nodes[anchor][0]] = node
+            for result in self.expand(nodes, rels, steps, start_row, used):
+                yield result
+
+    def expand(self, nodes, rels, steps, row, used):
+        if not steps:
+            yield row, used
+            return
+        rel_index, _, backward = steps[0]
+        from_pattern = nodes[rel_index + 1] if backward else nodes[rel_index]
+        to_pattern = nodes[rel_index] if backward else nodes[rel_index + 1]
+        rel_pattern = rels[rel_index]
+        direction = rel_pattern[3]
+        if backward and direction != "both":
+            direction = "in" if direction == "out" else "out"
+
+        from_node = row[from_pattern[0]]
+        for rel in self.graph.node_relationships(from_node, direction):
+            if rel.id in used or not self.rel_matches(rel_pattern, rel, row):
+                continue
+            if direction == "out":
+                other = rel.end
+            elif direction == "in":
+                other = rel.start
+            else:
+                other = rel.end if rel.start is from_node else rel.start
+            if not self.node_matches(to_pattern, other, row):
+                continue
+            new_row = dict(row)
+            new_row[rel_pattern[0]] = rel
+            new_row[to_pattern[0]] = other
+            for result in self.expand(nodes, rels, steps[1:], new_row, used | {rel.id}):
+                yield result
+
+    def create_pattern(self, pattern, row):
+        nodes, rels = pattern
+        row = dict(row)
+        for var, labels, props in nodes:
+            if var in row:
+                if row[var] is None:
+                    raise ValueError("Can't create a relationship to null")
+                continue
+            row[var] = self.graph.create_node(
+                labels, self.pattern_properties(props, row)
+            )
+        for i, (var, types, props, direction) in enumerate(rels):
+            if len(types) != 1:
+                raise CypherSyntaxError(
+                    "A single relationship type must be given to create a "
+                    "relationship"
+                )
+            left, right = row[nodes[i][0]], row[nodes[i + 1][0]]
+            start, end = (right, left) if direction == "in" else (left, right)
+            row[var] = self.graph.create_relationship(
+                types[0], start, end, self.pattern_properties(props, row)
+            )
+        return row
+
+    def apply_set_items(self, items, row):
+        for item in items:
+            entity = row.get(item[1])
+            if entity is None:
+                continue
+            if item[0] == "property":
+                self.graph.set_property(entity, item[2], self.evaluate(item[3], row))
+            elif item[0] == "labels":
+                for label in item[2]:
+                    self.graph.add_label(entity, label)
+            else:
+                values = self.evaluate(item[2], row)
+                if hasattr(values, "properties"):
+                    values = values.properties
+                if item[0] == "replace":
+                    for key in list(entity.properties):
+                        if key not in values:
+                            self.graph.set_property(entity, key, None)
+                for key, value in values.items():
+                    self.graph.set_property(entity, key, value)
+
+    # Expressions
+
+    def evaluate(self, expr, row):
+        kind = expr[0]
+        if kind == "lit":
+            return expr[1]
+        if kind == "param":
+            try:
+                return self.params[expr[1]]
+            except KeyError:
+                raise ValueError("Expected parameter(s): " + expr[1])
+        if kind == "var":
+            try:
+                return row[expr[1]]
+            except KeyError:
+                raise CypherSyntaxError("Variable `{0}` not defined".format(expr[1]))
+        if kind == "prop":
+            target = self.evaluate(expr[1], row)
+            if target is None:
+                return None
+            if isinstance(target, dict):
+                return target.get(expr[2])
+            return target.properties.get(expr[2])
+        if kind == "index":
+            target = self.evaluate(expr[1], row)
+            index = self.evaluate(expr[2], row)
+            if target is None or index is None:
+                return None
+            if isinstance(target, (list, tuple)):
+                return target[index] if -len(target) <= index < len(target) else None
+            return self.evaluate(("prop", ("lit", target), index), row)
+        if kind == "list":
+            return [self.evaluate(e, row) for e in expr[1]]
+        if kind == "map":
+            return dict((k, self.evaluate(e, row)) for k, e in expr[1])
+        if kind == "and":
+            a, b = self.evaluate(expr[1], row), self.evaluate(expr[2], row)
+            if a is False or b is False:
+                return False
+            return None if a is None or b is None else True
+        if kind == "or":
+            a, b = self.evaluate(expr[1], row), self.evaluate(expr[2], row)
+            if a is True or b is True:
+                return True
+            return None if a is None or b is None else False
+        if kind == "xor":
+            a, b = self.evaluate(expr[1], row), self.evaluate(expr[2], row)
+            return None if a is None or b is None else a != b
+        if kind == "not":
+            value = self.evaluate(expr[1], row)
+            return None if value is None else not value
+        if kind == "isnull":
+            value = self.evaluate(expr[1], row)
+            return (value is not None) if expr[2] else (value is None)
+        if kind == "in":
+            value = self.evaluate(expr[1], row)
+            values = self.evaluate(expr[2], row)
+            if values is None:
+                return None
+            results = [_equals(value, v) for v in values]
+            if True in results:
+                return True
+            return None if None in results else False
+        if kind == "cmp":
+            return self.compare(
+                expr[1], self.evaluate(expr[2], row), self.evaluate(expr[3], row)
+            )
+        if kind == "arith":
+            return self.arithmetic(
+                expr[1], self.evaluate(expr[2], row), self.evaluate(expr[3], row)
+            )
+        if kind == "neg":
+            value = self.evaluate(expr[1], row)
+            return None if value is None else -value
+        if kind == "call":
+            if _is_aggregate(expr):
+                raise CypherSyntaxError(
+                    "Aggregations are only supported as WITH or RETURN items"
+                )
+            return self.call(expr[1], [self.evaluate(e, row) for e in expr[2]])
+        raise ValueError("Unknown expression " + repr(expr))
+
+    def compare(self, op, a, b):
+        if op == "=":
+            return _equals(a, b)
+        if op == "<>":
+            equal = _equals(a, b)
+            return None if equal is None else not equal
+        if a is None or b is None:
+            return None
+        if _is_number(a) != _is_number(b):
+            return None
+        return {
+            "<": lambda: a < b,
+            ">": lambda: a > b,
+            "<=": lambda: a <= b,
+            ">=": lambda: a >= b,
+        }[op]()
+
+    def arithmetic(self, op, a, b):
+        if a is None or b is None:
+            return None
+        if op == "+":
+            if isinstance(a, six.string_types) or isinstance(b, six.string_types):
+                return six.text_type(a) + six.text_type(b)
+            return a + b
+        if op == "-":
+            return a - b
+        if op == "*":
+            return a * b
+        if op == "/":
+            if isinstance(a, numbers.Integral) and isinstance(b, numbers.Integral):
+                # Integer division truncates towards zero in Cypher
+                return int(float(a) / b)
+            return a / b
+        return a % b
+
+    def call(self, name, args):
+        if name == "coalesce":
+            for value in args:
+                if value is not None:
+                    return value
+            return None
+        try:
+            fn = SCALAR_FUNCTIONS[name]
+        except KeyError:
+            raise ValueError(
+                "Function {0} is not supported by MemoryGraph".format(name)
+            )
+        return fn(*args)
+
+
+class MemoryRecord(tuple):
+    """A result record, accessible by column name or position."""
+
+    def __new__(cls, keys, values):
+        record = super(MemoryRecord, cls).__new__(cls, values)
+        record._keys = tuple(keys)
+        return record
+
+    def __getitem__(self, key):
+        if isinstance(key, six.string_types):
+            try:
+                key = self._keys.index(key)
+            except ValueError:
+                raise KeyError(key)
+        return super(MemoryRecord, self).__getitem__(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._keys)
+
+    def values(self):
+        return list(self)
+
+    def items(self):
+        return list(zip(self._keys, self))
+
+    def data(self):
+        return dict(self.items())
+
+
+class MemoryResult(object):
+    """Result of running a statement, mimicking the driver's result object.
+
+    Attrs:
+        counters (dict): Numbers of changes made, e.g. 'nodes_created'.
+    """
+
+    def __init__(self, keys, rows, counters):
+        self._keys = keys
+        self._records = [MemoryRecord(keys, [row[k] for k in keys]) for row in rows]
+        self.counters = counters
+
+    def keys(self):
+        return list(self._keys)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def single(self):
+        return self._records[0] if self._records else None
+
+    def data(self):
+        return [r.data() for r in self._records]
+
+    def consume(self):
+        return self
+
+
+class MemoryTransaction(object):
+    """An explicit transaction, holding the graph's lock until it ends."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.graph.lock.acquire()
+        self._undo = []
+        self.closed = False
+
+    def run(self, statement, parameters=None, **kwparameters):
+        if self.closed:
+            raise ValueError("Transaction is closed")
+        params = dict(parameters or {}, **kwparameters)
+        return self.graph.execute(statement, params, undo=self._undo)
+
+    def commit(self):
+        self._close()
+
+    def rollback(self):
+        self.graph._rollback(self._undo)
+        self._close()
+
+    def _close(self):
+        if self.closed:
+            raise ValueError("Transaction is closed")
+        self.closed = True
+        self._undo = None
+        self.graph.lock.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if not self.closed:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+
+
+class MemorySession(object):
+    """A session on a :obj:`MemoryGraph`. Statements run auto-committed.
+
+    Statements may be given as :obj:`neo4j.Query` objects. Their timeouts,
+    like those of transactions, are ignored.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def run(self, statement, parameters=None, **kwparameters):
+        params = dict(parameters or {}, **kwparameters)
+        return self.graph.execute(getattr(statement, "text", statement), params)
+
+    def begin_transaction(self, metadata=None, timeout=None):
+        return MemoryTransaction(self.graph)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MemoryDriver(object):
+    """Stand-in for a Neo4j driver, backed by a :obj:`MemoryGraph`.
+
+    Args:
+        graph (:obj:`MemoryGraph`, optional): The graph sessions operate on.
+            A new, empty graph is used if not given.
+    """
+
+    def __init__(self, graph=None):
+        self.graph = graph if graph is not None else MemoryGraph()
+
+    def session(self, **kwargs):
+        return MemorySession(self.graph)
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.metrics
+~~~~~~~~~~~~~
+
+This module contains :obj:`Metrics`, which collects counters, gauges and
+latency histograms describing each stage of a load, and can export them as
+JSON or in the Prometheus text exposition format.
+"""
+from __future__ import print_function
+
+import json
+import time
+import bisect
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from six import iteritems
+
+try:
+    timer = time.perf_counter
+except AttributeError:
+    timer = time.time
+
+# Upper bounds, in seconds, of the buckets latencies are counted in
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+# Descriptions of the metrics recorded by cymod, used in Prometheus output
+HELP = {
+    "files_discovered_total": "Cypher files found by CypherFileFinder.",
+    "discovery_seconds": "Time taken to search a directory tree for files.",
+    "cypher_files_parsed_total": "Cypher files parsed.",
+    "cypher_bytes_parsed_total": "Bytes of Cypher files parsed.",
+    "cypher_queries_parsed_total": "Queries found in parsed Cypher files.",
+    "cypher_parse_seconds": "Time taken to parse a Cypher file.",
+    "table_rows_total": "Transition table rows converted to queries.",
+    "table_seconds": "Time spent generating the queries for a table.",
+    "table_rows_per_second": "Table rows converted to queries per second.",
+    "queries_committed_total": "Queries committed to the database.",
+    "batches_committed_total": "Batches committed to the database.",
+    "batches_failed_total": "Batches which failed after any retries.",
+    "retries_total": "Batch retries after transient errors.",
+    "query_seconds": "Time taken to run a query.",
+    "batch_seconds": "Time taken to commit a batch, including retries.",
+    "commit_seconds": "Time taken by a call to commit.",
+}
+
+
+class Histogram(object):
+    """Counts of observed values falling into buckets.
+
+    Args:
+        buckets (iterable of float): Upper bounds of the buckets. Values
+            greater than every bound are counted in a final, unbounded,
+            bucket.
+
+    Attributes:
+        count (int): Number of values observed.
+        sum (float): Sum of the values observed.
+        min (float): Smallest value observed, None if none have been.
+        max (float): Largest value observed, None if none have been.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket containing it.
+
+        Args:
+            q (float): Quantile, between 0 and 1.
+
+        Returns:
+            float: The estimate, or None if no values have been observed.
+                Quantiles in the unbounded bucket are estimated by `max`.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            if cumulative >= rank and cumulative > 0:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return OrderedDict(
+            [
+                ("count", self.count),
+                ("sum", self.sum),
+                ("min", self.min),
+                ("max", self.max),
+                ("p50", self.quantile(0.5)),
+                ("p99", self.quantile(0.99)),
+                ("buckets", OrderedDict(zip(self.buckets, self.counts))),
+                ("overflow", self.counts[-1]),
+            ]
+        )
+
+
+class Metrics(object):
+    """Named counters, gauges and histograms, safe to update from threads.
+
+    Metrics are created the first time they're updated. Each loader has a
+    :obj:`Metrics` object, `metrics`, which is shared with the file finders
+    and table processors it creates.
+
+    Attributes:
+        counters (dict): Name/ value pairs of values which only increase.
+        gauges (dict): Name/ value pairs of values which may go up or down.
+        histograms (dict): Name/ :obj:`Histogram` pairs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = OrderedDict()
+        self.gauges = OrderedDict()
+        self.histograms = OrderedDict()
+
+    def inc(self, name, amount=1):
+        """Increase a counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        """Set a gauge's value."""
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS):
+        """Record a value in a histogram.
+
+        Args:
+            name (str): Name of the histogram.
+            value (float): Value observed, e.g. a time in seconds.
+            buckets (iterable of float): Bucket upper bounds, used if the
+                histogram doesn't exist yet.
+        """
+        with self._lock:
+            try:
+                histogram = self.histograms[name]
+            except KeyError:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def set_rate(self, name, counter, histogram):
+        """Set a gauge to a counter's value per unit of a histogram's sum.
+
+        E.g. rows per second, from a counter of rows and a histogram of the
+        seconds taken to process them. Both are read under the lock, so
+        updates from other threads can't be interleaved.
+
+        Args:
+            name (str): Name of the gauge.
+            counter (str): Name of the counter.
+            histogram (str): Name of the histogram. The gauge isn't set if the
+                histogram doesn't exist or its sum isn't positive.
+        """
+        with self._lock:
+            h = self.histograms.get(histogram)
+            if h is not None and h.sum > 0:
+                self.gauges[name] = self.counters.get(counter, 0) / h.sum
+
+    @contextmanager
+    def time(self, name):
+        """Context manager recording how long its block takes in a histogram."""
+        start = timer()
+        try:
+            yield
+        finally:
+            self.observe(name, timer() - start)
+
+    def reset(self):
+        """Discard every metric."""
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def as_dict(self):
+        """Provide a snapshot of the metrics.
+
+        Returns:
+            dict: With 'counters', 'gauges' and 'histograms' keys.
+        """
+        with self._lock:
+            histograms = OrderedDict(
+                (name, h.as_dict()) for name, h in iteritems(self.histograms)
+            )
+            return OrderedDict(
+                [
+                    ("counters", OrderedDict(self.counters)),
+                    ("gauges", OrderedDict(self.gauges)),
+                    ("histograms", histograms),
+                ]
+            )
+
+    def to_json(self, filename=None):
+        """Export the metrics as JSON.
+
+        Args:
+            filename (str, optional): File to write the JSON to.
+
+        Returns:
+            str
+        """
+        data = self.as_dict()
+        for histogram in data["histograms"].values():
+            # JSON object keys must be strings
+            histogram["buckets"] = OrderedDict(
+                (repr(bound), n) for bound, n in iteritems(histogram["buckets"])
+            )
+        text = json.dumps(data, indent=2)
+        if filename:
+            with open(filename, "w") as f:
+                f.write(text)
+        return text
+
+    def to_prometheus(self, filename=None, prefix="cymod_"):
+        """Export the metrics in the Prometheus text exposition format.
+
+        The output can be served to Prometheus or written to a file read by
+        the node exporter's textfile collector.
+
+        Args:
+            filename (str, optional): File to write the metrics to.
+            prefix (str): Prepended to every metric's name. Defaults to
+                'cymod_'.
+
+        Returns:
+            str
+        """
+        lines = []
+
+        def header(name, kind):
+            full_name = prefix + name
+            if name in HELP:
+                lines.append("# HELP {0} {1}".format(full_name, HELP[name]))
+            lines.append("# TYPE {0} {1}".format(full_name, kind))
+            return full_name
+
+        with self._lock:
+            for name, value in iteritems(self.counters):
+                lines.append("{0} {1}".format(header(name, "counter"), value))
+            for name, value in iteritems(self.gauges):
+                lines.append("{0} {1}".format(header(name, "gauge"), value))
+            for name, histogram in iteritems(self.histograms):
+                full_name = header(name, "histogram")
+                cumulative = 0
+                for bound, n in zip(histogram.buckets, histogram.counts):
+                    cumulative += n
+                    lines.append(
+                        '{0}_bucket{{le="{1!r}"}} {2}'.format(
+                            full_name, float(bound), cumulative
+                        )
+                    )
+                lines.append(
+                    '{0}_bucket{{le="+Inf"}} {1}'.format(full_name, histogram.count)
+                )
+                lines.append("{0}_sum {1!r}".format(full_name, histogram.sum))
+                lines.append("{0}_count {1}".format(full_name, histogram.count))
+
+        text = "\n".join(lines) + "\n"
+        if filename:
+            with open(filename, "w") as f:
+                f.write(text)
+        return text
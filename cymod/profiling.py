@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.profiling
+~~~~~~~~~~~~~~~
+
+This module contains tools which run each distinct statement template in a
+load once with PROFILE (or EXPLAIN, which doesn't execute the statement) and
+report the statements whose plans contain operators which make loads slow,
+ranked by their estimated total cost.
+"""
+from __future__ import print_function
+
+import re
+from collections import namedtuple, OrderedDict
+
+import six
+
+from neo4j.exceptions import CypherSyntaxError
+
+# String and numeric literals, and quoted identifiers which may contain text
+# looking like them
+LITERAL_RE = re.compile(
+    r"`[^`]*`"
+    r"|'(?:[^'\\]|\\.)*'"
+    r'|"(?:[^"\\]|\\.)*"'
+    r"|(?<![\w$.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b"
+)
+
+# Plan operators which make statements slow, and the hazards they indicate
+HAZARDOUS_OPERATORS = OrderedDict(
+    [
+        ("Eager", "eager"),
+        ("CartesianProduct", "cartesian product"),
+        ("NodeByLabelScan", "label scan"),
+        ("AllNodesScan", "all nodes scan"),
+    ]
+)
+
+PlanOperator = namedtuple("PlanOperator", ["name", "db_hits", "rows", "estimated_rows"])
+
+
+def statement_template(statement):
+    """Reduce a statement to a template shared by statements differing only
+    in their literal values.
+
+    Args:
+        statement (str): Cypher statement.
+
+    Returns:
+        str: The statement with literals replaced by '?' and whitespace
+            collapsed.
+    """
+
+    def replace(match):
+        text = match.group()
+        return text if text.startswith("`") else "?"
+
+    return " ".join(LITERAL_RE.sub(replace, statement).split())
+
+
+def _plan_field(plan, key, attr):
+    """Get a field from a plan given as a dict (neo4j-driver 4.0 and later)
+    or an object (earlier versions)."""
+    if isinstance(plan, dict):
+        return plan.get(key)
+    return getattr(plan, attr, None)
+
+
+def plan_operators(plan):
+    """Flatten a query plan into its operators.
+
+    Args:
+        plan: A plan or profiled plan from a result summary.
+
+    Returns:
+        list of :obj:`PlanOperator`: Operators in depth first order, starting
+            at the root. `db_hits` and `rows` are None for plans which
+            weren't profiled.
+    """
+    operators = []
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            args = node.get("args") or node.get("arguments") or {}
+        else:
+            args = getattr(node, "arguments", None) or {}
+        # Operator names may be qualified by the runtime, e.g. 'Eager@neo4j'
+        name = (_plan_field(node, "operatorType", "operator_type") or "").split("@")[0]
+        operators.append(
+            PlanOperator(
+                name,
+                _plan_field(node, "dbHits", "db_hits"),
+                _plan_field(node, "rows", "rows"),
+                args.get("EstimatedRows"),
+            )
+        )
+        stack.extend(reversed(_plan_field(node, "children", "children") or []))
+    return operators
+
+
+class StatementProfile(object):
+    """The plan of one statement template and how often the load runs it.
+
+    Args:
+        template (str): See `statement_template`.
+        query (:obj:`CypherQuery`): The first query in the load using the
+            template, which was profiled.
+        executions (int): Number of queries in the load using the template.
+
+    Attributes:
+        operators (list of :obj:`PlanOperator`): Set by `set_plan`.
+        profiled (bool): True if the plan came from PROFILE, so includes db
+            hits, rather than EXPLAIN.
+    """
+
+    def __init__(self, template, query, executions=1):
+        self.template = template
+        self.query = query
+        self.executions = executions
+        self.operators = []
+        self.profiled = False
+
+    def set_plan(self, plan, profiled):
+        self.operators = plan_operators(plan) if plan is not None else []
+        self.profiled = profiled
+
+    @property
+    def db_hits(self):
+        return sum(op.db_hits or 0 for op in self.operators)
+
+    @property
+    def rows(self):
+        """Rows produced by the root operator."""
+        return self.operators[0].rows if self.operators else None
+
+    @property
+    def estimated_rows(self):
+        return sum(op.estimated_rows or 0 for op in self.operators)
+
+    @property
+    def cost(self):
+        """Estimated total cost of the statement's executions in the load.
+
+        Db hits when profiled, otherwise the planner's estimate of the rows
+        passing through every operator, multiplied by `executions`.
+        """
+        per_execution = self.db_hits if self.profiled else self.estimated_rows
+        return per_execution * self.executions
+
+    @property
+    def hazards(self):
+        """list of str: Descriptions of the hazardous operators in the plan."""
+        names = set(op.name for op in self.operators)
+        return [h for op, h in HAZARDOUS_OPERATORS.items() if op in names]
+
+    def describe_source(self):
+        source = self.query.source
+        if source is None:
+            return "unknown source"
+        if source.ref_type == "cypher":
+            return "{0} query {1}".format(source.ref, source.index)
+        return "table row {0}".format(source.index)
+
+
+class LoadProfile(object):
+    """Profiles of every statement template in a load.
+
+    Args:
+        profiles (list of :obj:`StatementProfile`)
+    """
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+
+    def ranked(self):
+        """list of :obj:`StatementProfile`: Most costly first."""
+        return sorted(self.profiles, key=lambda p: p.cost, reverse=True)
+
+    def hazardous(self):
+        """list of :obj:`StatementProfile`: Those with hazardous operators,
+        most costly first."""
+        return [p for p in self.ranked() if p.hazards]
+
+    def format_report(self, top=10):
+        """Describe the most costly statements with hazardous operators.
+
+        Args:
+            top (int): Maximum number of statements described.
+
+        Returns:
+            str
+        """
+        hazardous = self.hazardous()
+        lines = [
+            "{0} of {1} statement templates have hazardous plan operators".format(
+                len(hazardous), len(self.profiles)
+            )
+        ]
+        for profile in hazardous[:top]:
+            lines.append(
+                "{0}: {1} (cost {2:g}, {3} executions)".format(
+                    profile.describe_source(),
+                    ", ".join(profile.hazards),
+                    profile.cost,
+                    profile.executions,
+                )
+            )
+            lines.append("    " + profile.template)
+        return "\n".join(lines)
+
+
+def profile_queries(driver, queries, explain=False, commit=False):
+    """Profile each distinct statement template among some queries once.
+
+    Args:
+        driver: A Neo4j driver.
+        queries (iterable of :obj:`CypherQuery`): Schema statements are
+            skipped.
+        explain (bool): If True, use EXPLAIN, which plans statements without
+            running them, instead of PROFILE. Defaults to False.
+        commit (bool): If True, the changes made by profiled statements are
+            committed. Otherwise each is run in a transaction which is rolled
+            back, so statements which depend on data made by earlier ones
+            should be profiled against a database already holding the model.
+            Defaults to False.
+
+    Returns:
+        :obj:`LoadProfile`
+    """
+    profiles = OrderedDict()
+    for query in queries:
+        if query.is_schema:
+            continue
+        template = statement_template(query.statement)
+        try:
+            profiles[template].executions += 1
+        except KeyError:
+            profiles[template] = StatementProfile(template, query)
+
+    prefix = "EXPLAIN " if explain else "PROFILE "
+    with driver.session() as session:
+        for profile in six.itervalues(profiles):
+            query = profile.query
+            tx = session.begin_transaction()
+            try:
+                summary = tx.run(prefix + query.statement, query.params).consume()
+            except CypherSyntaxError:
+                print("Offending cypher query:\n" + repr(query))
+                tx.rollback()
+                raise
+            except Exception:
+                tx.rollback()
+                raise
+            if commit and not explain:
+                tx.commit()
+            else:
+                tx.rollback()
+            if explain:
+                profile.set_plan(summary.plan, profiled=False)
+            else:
+                profile.set_plan(summary.profile, profiled=True)
+
+    return LoadProfile(list(profiles.values()))
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.schema
+~~~~~~~~~~~~
+
+This module contains classes and functions used to describe the indexes and
+constraints which allow the queries generated by cymod to find existing nodes
+without scanning every node with a given label.
+"""
+import re
+
+# Clauses which look up existing nodes using the properties in their patterns
+LOOKUP_CLAUSE_RE = re.compile(r"\b(MATCH|MERGE)\b", re.IGNORECASE)
+# Clauses which end a MATCH or MERGE clause's patterns
+CLAUSE_RE = re.compile(
+    r"\b(MATCH|MERGE|CREATE|WITH|WHERE|SET|DELETE|DETACH|RETURN|UNWIND|ON|CALL)\b",
+    re.IGNORECASE,
+)
+# Node pattern with a label and properties, e.g. (n:State {code:"a"})
+NODE_PATTERN_RE = re.compile(r"\(\s*\w*\s*:\s*`?(\w+)`?\s*\{([^}]*)\}\s*\)")
+PROPERTY_RE = re.compile(r"`?(\w+)`?\s*:\s*(\$\w+)?")
+
+
+class IndexSpec(object):
+    """Description of an index, or uniqueness constraint, on node properties.
+
+    Args:
+        label (str): Label of the nodes to be indexed.
+        properties (list of str): Names of the indexed properties.
+        unique (bool): If True, the combination of properties should be
+            unique and a constraint will be used instead of an index: a
+            uniqueness constraint for a single property, or a node key for
+            several, as Neo4j 4.4 only has single property uniqueness
+            constraints. Node keys also require every node with the label to
+            have all of the properties, and need Neo4j Enterprise Edition.
+            Defaults to False.
+    """
+
+    def __init__(self, label, properties, unique=False):
+        self.label = label
+        self.properties = tuple(properties)
+        self.unique = unique
+
+    @property
+    def name(self):
+        """str: Name given to the index or constraint in the database."""
+        return "cymod_" + "_".join((self.label,) + self.properties)
+
+    def statement(self):
+        """Build the statement which creates the index or constraint.
+
+        The statement does nothing if an index or constraint with the same name
+        already exists, so it can safely be run before every load. Its syntax
+        is that of Neo4j 4.4.
+
+        Returns:
+            str: Cypher schema statement.
+        """
+        props = ", ".join("n.`" + p + "`" for p in self.properties)
+        if self.unique:
+            if len(self.properties) == 1:
+                requirement = props + " IS UNIQUE"
+            else:
+                requirement = "(" + props + ") IS NODE KEY"
+            return (
+                "CREATE CONSTRAINT `{0}` IF NOT EXISTS FOR (n:`{1}`) REQUIRE {2}"
+            ).format(self.name, self.label, requirement)
+        return "CREATE INDEX `{0}` IF NOT EXISTS FOR (n:`{1}`) ON ({2})".format(
+            self.name, self.label, props
+        )
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return (
+                self.label == other.label
+                and self.properties == other.properties
+                and self.unique == other.unique
+            )
+        return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.label, self.properties, self.unique))
+
+    def __repr__(self):
+        return "IndexSpec({0!r}, {1!r}, unique={2!r})".format(
+            self.label, list(self.properties), self.unique
+        )
+
+
+def lookup_specs_from_statement(statement, param_names):
+    """Identify the node lookups made by a Cypher statement.
+
+    Finds node patterns in MATCH and MERGE clauses which have a label and at
+    least one property whose value is one of the given parameters, e.g.
+    ``MATCH (n:LandCoverType {code:"a", model_ID:$model_ID})`` when
+    `param_names` includes 'model_ID'.
+
+    Args:
+        statement (str): Cypher statement.
+        param_names (iterable of str): Names of global parameters which
+            identify the model nodes belong to.
+
+    Returns:
+        list of :obj:`IndexSpec`: An index for each lookup, on all of the
+            properties in the node pattern.
+    """
+    param_refs = set("$" + p for p in param_names)
+    specs = []
+    clause_starts = [m.start() for m in CLAUSE_RE.finditer(statement)]
+    for match in LOOKUP_CLAUSE_RE.finditer(statement):
+        following = [i for i in clause_starts if i > match.start()]
+        end = following[0] if following else len(statement)
+        for node in NODE_PATTERN_RE.finditer(statement, match.end(), end):
+            props = PROPERTY_RE.findall(node.group(2))
+            if any(value in param_refs for _, value in props):
+                specs.append(IndexSpec(node.group(1), sorted(k for k, _ in props)))
+    return specs
+
+
+def unique_specs(specs):
+    """Remove duplicates from a list of specs, preserving order."""
+    seen = set()
+    result = []
+    for spec in specs:
+        if spec not in seen:
+            seen.add(spec)
+            result.append(spec)
+    return result
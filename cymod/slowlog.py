@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.slowlog
+~~~~~~~~~~~~~
+
+This module contains a log of the statements and batches which took longest
+to commit, and a summary of the sources (Cypher files and tables) which
+dominated a load.
+"""
+from __future__ import print_function
+
+import json
+import datetime
+import threading
+
+import six
+
+# Maximum number of characters of a statement included in a log entry
+STATEMENT_PREVIEW_LENGTH = 200
+
+
+def _param_sizes(params):
+    """Approximate the size of each parameter as the length of its JSON."""
+    return dict(
+        (name, len(json.dumps(value, default=str)))
+        for name, value in (params or {}).items()
+    )
+
+
+class SlowQueryLog(object):
+    """Records statements and batches which take longer than a threshold.
+
+    Each slow statement or batch is written to the log file as a line of JSON
+    giving its source, elapsed time and the sizes of its parameters. The time
+    taken by every statement timed is also totalled by source, so the
+    slowest sources can be summarised at the end of a load.
+
+    Args:
+        filename (str, optional): Path of the log file. If not given, slow
+            statements are only counted in the summary.
+        threshold (float): Seconds a statement or batch must take to be
+            logged. Defaults to 1.0.
+        top (int): Number of sources included in the summary. Defaults to 10.
+    """
+
+    def __init__(self, filename=None, threshold=1.0, top=10):
+        self.threshold = threshold
+        self.filename = filename
+        self.top = top
+        self.slow_count = 0
+        self._lock = threading.Lock()
+        # Source name/ [total seconds, statements, slowest seconds] lists
+        self._sources = {}
+        # ids of DataFrames/ numbers used to name tables
+        self._tables = {}
+        self._file = open(filename, "w") if filename else None
+
+    def _source_name(self, source):
+        """Name the file or table a query came from."""
+        if source is None:
+            return "unknown"
+        if source.ref_type == "cypher":
+            return six.text_type(source.ref)
+        key = id(source.ref)
+        if key not in self._tables:
+            self._tables[key] = len(self._tables)
+        return "table {0} ({1} rows)".format(self._tables[key], len(source.ref))
+
+    def _write(self, entry):
+        self.slow_count += 1
+        if self._file is not None:
+            entry["time"] = datetime.datetime.now().isoformat()
+            self._file.write(json.dumps(entry, sort_keys=True) + "\n")
+            self._file.flush()
+
+    def record_query(self, query, elapsed, failed=False):
+        """Record the time taken to run a statement.
+
+        Args:
+            query (:obj:`CypherQuery`)
+            elapsed (float): Seconds taken.
+            failed (bool): True if the statement raised an error, e.g.
+                because it timed out.
+        """
+        source = query.source
+        with self._lock:
+            name = self._source_name(source)
+            totals = self._sources.setdefault(name, [0.0, 0, 0.0])
+            totals[0] += elapsed
+            totals[1] += 1
+            totals[2] = max(totals[2], elapsed)
+            if elapsed < self.threshold:
+                return
+            self._write(
+                {
+                    "kind": "query",
+                    "elapsed": elapsed,
+                    "failed": failed,
+                    "source": name,
+                    "source_type": source.ref_type if source else None,
+                    "index": source.index if source else None,
+                    "param_bytes": _param_sizes(query.params),
+                    "statement": query.statement[:STATEMENT_PREVIEW_LENGTH],
+                }
+            )
+
+    def record_batch(self, batch, elapsed, failed=False):
+        """Record the time taken to commit a batch of statements.
+
+        Args:
+            batch (:obj:`CypherQueryBatch`)
+            elapsed (float): Seconds taken, including any retries.
+            failed (bool): True if the batch couldn't be committed.
+        """
+        if elapsed < self.threshold:
+            return
+        param_bytes = 0
+        for query in batch:
+            param_bytes += sum(_param_sizes(query.params).values())
+        with self._lock:
+            self._write(
+                {
+                    "kind": "batch",
+                    "elapsed": elapsed,
+                    "failed": failed,
+                    "ident": batch.ident,
+                    "queries": len(batch),
+                    "param_bytes": param_bytes,
+                }
+            )
+
+    def slowest_sources(self, n=None):
+        """Find the sources whose statements took longest in total.
+
+        Args:
+            n (int, optional): Number of sources. Defaults to `top`.
+
+        Returns:
+            list of tuple: (source name, total seconds, statements, slowest
+                statement's seconds), slowest first.
+        """
+        with self._lock:
+            sources = [(name,) + tuple(t) for name, t in self._sources.items()]
+        sources.sort(key=lambda s: s[1], reverse=True)
+        return sources[: self.top if n is None else n]
+
+    def format_summary(self):
+        """Describe the slowest sources, for printing at the end of a load.
+
+        Returns:
+            str
+        """
+        lines = [
+            "{0} statements or batches took over {1}s. Slowest sources:".format(
+                self.slow_count, self.threshold
+            )
+        ]
+        for name, total, count, slowest in self.slowest_sources():
+            lines.append(
+                "  {0:10.3f}s total {1:6d} statements {2:8.3f}s slowest  {3}".format(
+                    total, count, slowest, name
+                )
+            )
+        return "\n".join(lines)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
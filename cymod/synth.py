@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.synth
+~~~~~~~~~~~
+
+This module contains functions which generate synthetic models, made of
+Cypher files and transition tables, of any chosen size. The same seed always
+produces the same model, so they can be used to reproduce performance problems
+which only appear at scale.
+"""
+from __future__ import print_function
+
+import os
+import json
+import random
+import collections
+
+import pandas as pd
+
+from cymod.tabproc import EnvrStateAliasTranslator
+
+SyntheticModel = collections.namedtuple(
+    "SyntheticModel", ["cypher_dir", "cypher_files", "table", "translator"]
+)
+SyntheticModel.__doc__ = """A synthetic model written by `generate_model`.
+
+Attrs:
+    cypher_dir (str): Root of the directory tree of Cypher files.
+    cypher_files (list of str): Paths of the Cypher files.
+    table (:obj:`pandas.DataFrame`): Coded transition table.
+    translator (:obj:`EnvrStateAliasTranslator`): Aliases for the codes in
+        `table`.
+"""
+
+
+def _entity_id(file_index, statement_index):
+    return "e{0}_{1}".format(file_index, statement_index)
+
+
+def write_cypher_tree(
+    root_dir,
+    n_files,
+    statements_per_file,
+    depth=3,
+    fan_out=4,
+    n_priorities=3,
+    seed=0,
+):
+    """Write Cypher files in a nested directory tree.
+
+    Each file starts with a JSON header giving its priority and parameters.
+    Files at priority 0 create entities, and files at higher priorities
+    connect entities created by priority 0 files, so the files must be loaded
+    in priority order. Some statements are preceded by comments.
+
+    Args:
+        root_dir (str): Directory in which to create the tree. Created if it
+            doesn't exist.
+        n_files (int): Number of files to write.
+        statements_per_file (int): Number of statements in each file.
+        depth (int): Maximum depth of directories below `root_dir`.
+            Defaults to 3.
+        fan_out (int): Number of subdirectories in each directory.
+            Defaults to 4.
+        n_priorities (int): Number of distinct priorities used. Defaults to 3.
+        seed (int): Seed for the random choices made. Defaults to 0.
+
+    Returns:
+        list of str: Paths of the files written, in the order written.
+    """
+    rng = random.Random(seed)
+    # The first file must create entities for the others to refer to
+    priorities = [0] + [rng.randrange(n_priorities) for _ in range(n_files - 1)]
+    entity_files = [i for i, p in enumerate(priorities) if p == 0]
+
+    filenames = []
+    for i, priority in enumerate(priorities):
+        subdirs = [
+            "view{0}".format(rng.randrange(fan_out))
+            for _ in range(rng.randrange(depth + 1))
+        ]
+        directory = os.path.join(root_dir, *subdirs)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        header = collections.OrderedDict(
+            [
+                ("priority", priority),
+                ("view", "view{0}".format(i)),
+                ("weight", round(rng.uniform(0, 1), 3)),
+            ]
+        )
+        lines = [json.dumps(header)]
+        for j in range(statements_per_file):
+            if rng.random() < 0.2:
+                lines.append("// Statement {0} of file {1}".format(j, i))
+            if priority == 0:
+                lines.append(
+                    'MERGE (:Entity {{id: "{0}", view: $view}});'.format(
+                        _entity_id(i, j)
+                    )
+                )
+            else:
+                source, target = [
+                    _entity_id(
+                        rng.choice(entity_files), rng.randrange(statements_per_file)
+                    )
+                    for _ in range(2)
+                ]
+                lines.append(
+                    (
+                        'MATCH (a:Entity {{id: "{0}"}}), (b:Entity {{id: "{1}"}}) '
+                        "MERGE (a)-[:RELATES_TO {{view: $view, weight: $weight}}]"
+                        "->(b);"
+                    ).format(source, target)
+                )
+
+        filename = os.path.join(directory, "file{0}.cql".format(i))
+        with open(filename, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        filenames.append(filename)
+
+    return filenames
+
+
+def transition_table(
+    n_rows,
+    n_states,
+    n_conditions,
+    n_levels=3,
+    start_state_col="start",
+    end_state_col="end",
+    time_col="delta_t",
+    seed=0,
+):
+    """Build a transition table whose states and conditions are coded.
+
+    States are coded 0 to `n_states` - 1, and condition columns, named
+    'cond0', 'cond1' etc., are coded 0 to `n_levels` - 1. Each row's end state
+    differs from its start state.
+
+    Args:
+        n_rows (int): Number of rows.
+        n_states (int): Number of state codes. Must be at least 2.
+        n_conditions (int): Number of condition columns.
+        n_levels (int): Number of codes used in each condition column.
+            Defaults to 3.
+        start_state_col (str): Name of the start state column.
+        end_state_col (str): Name of the end state column.
+        time_col (str, optional): Name of a column of transition times, as
+            needed by :obj:`EnvironTransitionSet`. If None, no times are
+            included. Defaults to 'delta_t'.
+        seed (int): Seed for the random choices made. Defaults to 0.
+
+    Returns:
+        :obj:`pandas.DataFrame`
+    """
+    if n_states < 2:
+        raise ValueError("At least 2 states are needed, not {0}".format(n_states))
+
+    rng = random.Random(seed)
+    starts = [rng.randrange(n_states) for _ in range(n_rows)]
+    # Shift by a non-zero offset so no row transitions to its own start state
+    ends = [(s + 1 + rng.randrange(n_states - 1)) % n_states for s in starts]
+    columns = collections.OrderedDict(
+        [(start_state_col, starts), (end_state_col, ends)]
+    )
+    for c in range(n_conditions):
+        columns["cond{0}".format(c)] = [rng.randrange(n_levels) for _ in range(n_rows)]
+    if time_col:
+        columns[time_col] = [rng.randrange(1, 50) for _ in range(n_rows)]
+    return pd.DataFrame(columns, columns=list(columns))
+
+
+def alias_translator(n_states, n_conditions, n_levels=3):
+    """Build aliases for the codes in a table made by `transition_table`.
+
+    Conditions with two levels are given boolean aliases, others are given
+    names such as 'cond0_level2'.
+
+    Args:
+        n_states (int): Number of state codes.
+        n_conditions (int): Number of condition columns.
+        n_levels (int): Number of codes used in each condition column.
+            Defaults to 3.
+
+    Returns:
+        :obj:`EnvrStateAliasTranslator`
+    """
+    translator = EnvrStateAliasTranslator()
+    translator.state_aliases = dict((i, "state{0}".format(i)) for i in range(n_states))
+    for c in range(n_conditions):
+        name = "cond{0}".format(c)
+        if n_levels == 2:
+            aliases = {0: False, 1: True}
+        else:
+            aliases = dict(
+                (level, "{0}_level{1}".format(name, level)) for level in range(n_levels)
+            )
+        translator.add_cond_aliases(name, aliases)
+    return translator
+
+
+def generate_model(
+    directory,
+    n_files,
+    statements_per_file,
+    n_rows,
+    n_states,
+    n_conditions,
+    n_levels=3,
+    depth=3,
+    n_priorities=3,
+    seed=0,
+):
+    """Write a complete synthetic model to a directory.
+
+    Cypher files are written to a 'cypher' subdirectory, and the coded
+    transition table to 'transitions.csv'.
+
+    Args:
+        directory (str): Directory to write the model to.
+        n_files (int): Number of Cypher files.
+        statements_per_file (int): Number of statements in each Cypher file.
+        n_rows (int): Number of rows in the transition table.
+        n_states (int): Number of state codes in the transition table.
+        n_conditions (int): Number of condition columns in the table.
+        n_levels (int): Number of codes in each condition column.
+            Defaults to 3.
+        depth (int): Maximum depth of the Cypher file tree. Defaults to 3.
+        n_priorities (int): Number of Cypher file priorities. Defaults to 3.
+        seed (int): Seed for the random choices made. Defaults to 0.
+
+    Returns:
+        :obj:`SyntheticModel`
+    """
+    cypher_dir = os.path.join(directory, "cypher")
+    files = write_cypher_tree(
+        cypher_dir,
+        n_files,
+        statements_per_file,
+        depth=depth,
+        n_priorities=n_priorities,
+        seed=seed,
+    )
+    table = transition_table(n_rows, n_states, n_conditions, n_levels, seed=seed)
+    table.to_csv(os.path.join(directory, "transitions.csv"), index=False)
+    translator = alias_translator(n_states, n_conditions, n_levels)
+    return SyntheticModel(cypher_dir, files, table, translator)
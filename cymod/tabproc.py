@@ -6,8 +6,10 @@ cymod.tabproc
 This module contains classes involved in loading Cypher queries from a tabular
 data source.
 """
+import os
 import re
 import json
+import hashlib
 import collections
 import warnings
 
@@ -17,6 +19,8 @@ import pandas as pd
 from cymod.params import validate_cypher_params
 from cymod.cybase import CypherQuery, CypherQuerySource
 from cymod.customise import NodeLabels
+from cymod.schema import IndexSpec
+from cymod.metrics import timer
 
 
 class EnvrStateAliasTranslator(object):
@@ -100,6 +104,8 @@ class TransTableProcessor(object):
         labels=None,
         global_params=None,
         state_alias_translator=None,
+        fresh_load=False,
+        metrics=None,
     ):
         """
         Args:
@@ -119,8 +125,18 @@ class TransTableProcessor(object):
                 will be added as parameters to every query.
             state_alias_translator (:obj:`EnvrStateAliasTranslator`): Container 
                 for translations from codes to human readable values.
+            fresh_load (bool): If True, queries assume none of the nodes they
+                describe exist in the database before the load, and use CREATE
+                for nodes and relationships which haven't been described by an
+                earlier row, rather than MERGE. The resulting graph is the same
+                as with MERGE, but is faster to build. Defaults to False.
+            metrics (:obj:`Metrics`, optional): If given, the number of rows
+                processed and the time spent generating their queries are
+                recorded.
         """
         self.start_state_col = start_state_col
+        self.fresh_load = fresh_load
+        self.metrics = metrics
         self.end_state_col = end_state_col
         self.global_params = global_params
 
@@ -230,6 +246,29 @@ class TransTableProcessor(object):
 
         return out_str
 
+    def _conditions_str(self, row):
+        """Build the string used to express transition conditions.
+
+        This is the part in curly braces specifying the Condition node's
+        properties.
+        """
+        row = row.drop([self.start_state_col, self.end_state_col])
+        count = 0
+        s = ""
+        for i, val in row.iteritems():
+            s += i + ":"
+            if isinstance(val, six.string_types):
+                s += '"' + val + '"'
+            elif isinstance(val, bool):
+                s += str(val).lower()
+            else:
+                s += str(val)
+            if count < len(row) - 1:
+                s += ", "
+            count += 1
+
+        return "{" + s + "}"
+
     def _row_to_query_statement_string(self, row):
         """Build the string specifying the cypher query for a single row."""
         start_node = 'MERGE (start:{state_lab} {{code:"{start_state}"}})'.format(
@@ -244,32 +283,9 @@ class TransTableProcessor(object):
             trans_lab=self.labels.transition
         )
 
-        def _conditions_str(row, start_state_col, end_state_col):
-            """Build the string used to express transition conditions.
-            
-            This is the part in curly braces specifying the Condition node's
-            properties.
-            """
-            row = row.drop([start_state_col, end_state_col])
-            count = 0
-            s = ""
-            for i, val in row.iteritems():
-                s += i + ":"
-                if isinstance(val, six.string_types):
-                    s += '"' + val + '"'
-                elif isinstance(val, bool):
-                    s += str(val).lower()
-                else:
-                    s += str(val)
-                if count < len(row) - 1:
-                    s += ", "
-                count += 1
-
-            return "{" + s + "}"
-
         condition = "MERGE (cond:{cond_lab} {cond_str})-[:CAUSES]->(trans)".format(
             cond_lab=self.labels.condition,
-            cond_str=_conditions_str(row, self.start_state_col, self.end_state_col),
+            cond_str=self._conditions_str(row),
         )
 
         query_str = (
@@ -283,11 +299,324 @@ class TransTableProcessor(object):
 
         return query_str
 
-    def _row_to_cypher_query(self, row_index, row):
-        statement = self._row_to_query_statement_string(row)
+    def index_specs(self, unique=False):
+        """Describe the indexes which speed up the generated MERGE clauses.
+
+        State nodes are looked up by their code and the global parameters, 
+        Transition and Condition nodes by the global parameters.
+
+        Args:
+            unique (bool): If True, State nodes' properties are specified as 
+                unique, so a uniqueness constraint will be used in place of an
+                index. Defaults to False.
+
+        Returns:
+            list of :obj:`IndexSpec`
+        """
+        global_keys = sorted(self.global_params.keys()) if self.global_params else []
+        specs = [IndexSpec(self.labels.state, sorted(["code"] + global_keys), unique)]
+        if global_keys:
+            specs.append(IndexSpec(self.labels.transition, global_keys))
+            specs.append(IndexSpec(self.labels.condition, global_keys))
+        return specs
+
+    def _row_to_fresh_query_statement_string(self, row, emitted):
+        """Build the query for a single row, creating entities where possible.
+
+        Produces the same graph as `_row_to_query_statement_string` provided
+        the only entities already in the database are those described by
+        previous queries in the load.
+
+        Args:
+            row (:obj:`pandas.Series`): Row of the transition table.
+            emitted (set): Keys of the entities described by previous queries
+                in the load. Updated with the entities described by this row.
+
+        Returns:
+            str: Query string.
+        """
+        globals_str = (
+            self._dict_to_cypher_properties(self.global_params)
+            if self.global_params
+            else ""
+        )
+        start_code = row[self.start_state_col]
+        end_code = row[self.end_state_col]
+        state_node = '({var}:{state_lab} {{code:"{code}"}})'
+
+        # Reading clauses must precede updating clauses
+        reads = []
+        updates = []
+
+        def add(key, read_clause, update_clause):
+            if key in emitted:
+                if read_clause:
+                    reads.append(read_clause)
+            else:
+                emitted.add(key)
+                updates.append(update_clause)
+
+        for var, code in [("start", start_code), ("end", end_code)]:
+            if var == "end" and end_code == start_code:
+                continue
+            node = state_node.format(var=var, state_lab=self.labels.state, code=code)
+            add(
+                ("state", self.labels.state, globals_str, code),
+                "MATCH " + node,
+                "CREATE " + node,
+            )
+
+        end_var = "start" if end_code == start_code else "end"
+        transition = "(start)<-[:SOURCE]-(trans:{0})-[:TARGET]->({1})".format(
+            self.labels.transition, end_var
+        )
+        trans_key = ("trans", self.labels.transition, globals_str, start_code, end_code)
+        add(trans_key, "MATCH " + transition, "CREATE " + transition)
+
+        cond_str = self._conditions_str(row)
+        condition = "(cond:{cond_lab} {cond_str})-[:CAUSES]->(trans)".format(
+            cond_lab=self.labels.condition, cond_str=cond_str
+        )
+        cond_key = ("cond", self.labels.condition, cond_str) + trans_key
+        if cond_key in emitted:
+            updates.append("MERGE " + condition)
+        else:
+            add(cond_key, None, "CREATE " + condition)
+
+        query_str = " ".join(reads + updates) + ";"
+
+        if self.global_params:
+            query_str = self._add_global_params_to_query_string(
+                query_str, self.global_params
+            )
+
+        return query_str
+
+    def _row_to_cypher_query(self, row_index, row, emitted=None):
+        if emitted is None:
+            statement = self._row_to_query_statement_string(row)
+        else:
+            statement = self._row_to_fresh_query_statement_string(row, emitted)
         source = CypherQuerySource(self.df, "tabular", row_index)
         return CypherQuery(statement, params=None, source=source)
 
-    def iterqueries(self):
-        for i, row in self.df.iterrows():
-            yield self._row_to_cypher_query(i, row)
+    def prepare(self):
+        """Do any work needed before queries are generated.
+
+        Nothing is needed for tables whose rows are written into queries.
+        """
+
+    def iterqueries(self, emitted=None):
+        """Generate a query for each row of the table.
+
+        Args:
+            emitted (set, optional): Used if `fresh_load` is True. Keys of the
+                entities described by queries earlier in the load, for 
+                example by another :obj:`TransTableProcessor`. Updated as 
+                queries are generated. If not given, only the entities
+                described by this table are taken into account.
+
+        Yields:
+            :obj:`CypherQuery`
+        """
+        if self.fresh_load and emitted is None:
+            emitted = set()
+        elif not self.fresh_load:
+            emitted = None
+
+        if self.metrics is None:
+            for i, row in self.df.iterrows():
+                yield self._row_to_cypher_query(i, row, emitted)
+            return
+
+        # Only time spent generating queries is counted, not time spent by
+        # the consumer between rows
+        rows = 0
+        elapsed = 0.0
+        try:
+            start = timer()
+            for i, row in self.df.iterrows():
+                query = self._row_to_cypher_query(i, row, emitted)
+                elapsed += timer() - start
+                rows += 1
+                yield query
+                start = timer()
+        finally:
+            self._record_metrics(rows, elapsed)
+
+    def _record_metrics(self, rows, elapsed):
+        """Record rows processed and the time taken to generate their queries."""
+        self.metrics.inc("table_rows_total", rows)
+        self.metrics.observe("table_seconds", elapsed)
+        self.metrics.set_rate(
+            "table_rows_per_second", "table_rows_total", "table_seconds"
+        )
+
+
+class CsvTransTableProcessor(TransTableProcessor):
+    """Loads a transition table with a single server-side LOAD CSV query.
+
+    Rather than generating a query for each row, the table is written to a
+    CSV file in the database's import directory and a single query is
+    generated which reads the file and performs the same MERGE clauses as
+    :obj:`TransTableProcessor` for each row, committing in batches.
+
+    The file is written once, by `prepare`, before the query is generated.
+    The query uses CALL { ... } IN TRANSACTIONS, so must be committed with the
+    'query' transaction scope, and can't be profiled.
+    """
+
+    def __init__(
+        self,
+        df,
+        start_state_col,
+        end_state_col,
+        import_dir,
+        file_name=None,
+        batch_size=10000,
+        labels=None,
+        global_params=None,
+        state_alias_translator=None,
+        metrics=None,
+    ):
+        """
+        Args:
+            df (:obj:`pandas.DataFrame`): Table containing data which will be 
+                converted into Cypher.
+            start_state_col (str): Name of the column specifying the start 
+                state of the transition described by each row.
+            end_state_col (str): Name of the column specifying the end state of
+                the transition described by each row.
+            import_dir (str): The database's import directory, from which 
+                LOAD CSV reads files. Must be accessible from this machine.
+            file_name (str, optional): Name of the CSV file written to
+                `import_dir`. Defaults to a name derived from the table's 
+                content.
+            batch_size (int): Number of rows committed in each transaction.
+                Defaults to 10000.
+            labels (:obj:`CustomLabels`, optional): Custom labels for State,
+                Transition and Condition nodes.
+            global_params (dict, optional): property name/ value pairs which 
+                will be added to every node.
+            state_alias_translator (:obj:`EnvrStateAliasTranslator`): Container 
+                for translations from codes to human readable values.
+            metrics (:obj:`Metrics`, optional): If given, the number of rows
+                written and the time taken to write them are recorded.
+        """
+        super(CsvTransTableProcessor, self).__init__(
+            df,
+            start_state_col,
+            end_state_col,
+            labels=labels,
+            global_params=global_params,
+            state_alias_translator=state_alias_translator,
+            metrics=metrics,
+        )
+        self.import_dir = import_dir
+        self.batch_size = batch_size
+        if file_name is None:
+            digest = hashlib.sha1(
+                self.df.to_csv(index=False).encode("utf-8")
+            ).hexdigest()
+            file_name = "cymod_" + digest[:16] + ".csv"
+        self.file_name = file_name
+        # Path of the CSV file once written by `prepare`
+        self._csv_filename = None
+
+    def _column_expression(self, col):
+        """Build the expression reading a column from a CSV row.
+
+        LOAD CSV reads every value as a string, so values are converted back
+        to the type of the column in the table.
+        """
+        expr = "row.`" + col + "`"
+        kind = self.df[col].dtype.kind
+        if kind in "iu":
+            return "toInteger(" + expr + ")"
+        if kind == "f":
+            return "toFloat(" + expr + ")"
+        if kind == "b":
+            return "toBoolean(" + expr + ")"
+        return expr
+
+    def _properties_str(self, exprs):
+        """Build a node's properties from CSV columns and global parameters.
+
+        Args:
+            exprs (list of tuple): Property name/ Cypher expression pairs.
+        """
+        props = [name + ":" + expr for name, expr in exprs]
+        if self.global_params:
+            props.append(self._dict_to_cypher_properties(self.global_params))
+        return "{" + ", ".join(props) + "}"
+
+    def _load_csv_statement_string(self):
+        """Build the LOAD CSV statement which loads every row of the table."""
+        state_cols = [self.start_state_col, self.end_state_col]
+        cond_cols = [c for c in self.df.columns if c not in state_cols]
+        # States' codes are always strings, as in TransTableProcessor
+        start_props = self._properties_str([("code", "row.`" + state_cols[0] + "`")])
+        end_props = self._properties_str([("code", "row.`" + state_cols[1] + "`")])
+        trans_props = " " + self._properties_str([]) if self.global_params else ""
+        cond_props = self._properties_str(
+            [(c, self._column_expression(c)) for c in cond_cols]
+        )
+
+        clauses = [
+            "MERGE (start:{0} {1})".format(self.labels.state, start_props),
+            "MERGE (end:{0} {1})".format(self.labels.state, end_props),
+            "MERGE (start)<-[:SOURCE]-(trans:{0}{1})-[:TARGET]->(end)".format(
+                self.labels.transition, trans_props
+            ),
+            "MERGE (cond:{0} {1})-[:CAUSES]->(trans)".format(
+                self.labels.condition, cond_props
+            ),
+        ]
+        return (
+            "LOAD CSV WITH HEADERS FROM {0} AS row CALL {{ WITH row {1} }} "
+            + "IN TRANSACTIONS OF {2} ROWS;"
+        ).format(
+            json.dumps("file:///" + self.file_name), " ".join(clauses), self.batch_size
+        )
+
+    def write_csv(self):
+        """Write the table to the import directory.
+
+        Returns:
+            str: Path of the file written.
+        """
+        filename = os.path.join(self.import_dir, self.file_name)
+        self.df.to_csv(filename, index=False)
+        return filename
+
+    def prepare(self):
+        """Write the table to CSV, unless it has already been written.
+
+        Called before the query is generated, so however many times the
+        loader's queries are iterated over, the file is only written once.
+
+        Returns:
+            str: Path of the file.
+        """
+        if self._csv_filename is None:
+            start = timer()
+            self._csv_filename = self.write_csv()
+            if self.metrics is not None:
+                self._record_metrics(len(self.df), timer() - start)
+        return self._csv_filename
+
+    def iterqueries(self, emitted=None):
+        """Generate the query which loads the table's CSV file.
+
+        The file must be written first, with `prepare`.
+
+        Args:
+            emitted (set, optional): Ignored, as entities are always merged.
+
+        Yields:
+            :obj:`CypherQuery`: The single LOAD CSV query.
+        """
+        source = CypherQuerySource(self.df, "tabular", self.file_name)
+        yield CypherQuery(
+            self._load_csv_statement_string(), params=None, source=source
+        )
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+cymod.tracing
+~~~~~~~~~~~~~
+
+This module contains tracers which record hierarchical spans (load, job,
+file, batch and query) while a loader commits queries. :obj:`Tracer` writes
+them to a Chrome trace-event JSON file, which can be opened in a trace viewer
+such as Perfetto or chrome://tracing. :obj:`OpenTelemetryTracer` forwards them
+to OpenTelemetry, so any exporter configured there can be used.
+"""
+from __future__ import print_function
+
+import os
+import json
+import threading
+from contextlib import contextmanager
+
+import six
+
+from cymod.metrics import timer
+
+
+def source_attributes(source):
+    """Describe where a query came from as span attributes.
+
+    Args:
+        source (:obj:`CypherQuerySource`, optional)
+
+    Returns:
+        dict: 'source.type' and 'source.index', plus 'source.file' for
+            queries from Cypher files.
+    """
+    if source is None:
+        return {}
+    attrs = {"source.type": source.ref_type, "source.index": source.index}
+    if source.ref_type == "cypher":
+        attrs["source.file"] = six.text_type(source.ref)
+    return attrs
+
+
+def _attribute_value(value):
+    """Convert a value to one which can be stored as a span attribute."""
+    if value is None or isinstance(value, (bool, int, float) + six.string_types):
+        return value
+    return six.text_type(value)
+
+
+class Span(object):
+    """A timed operation, recorded by its :obj:`Tracer` when it ends.
+
+    Args:
+        tracer (:obj:`Tracer`)
+        name (str): Name of the operation, e.g. 'batch'.
+        attributes (dict): Name/ value pairs describing the operation.
+    """
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.thread_id = threading.current_thread().ident
+        self.start = timer()
+        self.end_time = None
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def end(self):
+        if self.end_time is None:
+            self.end_time = timer()
+            self.tracer._record(self)
+
+
+class Tracer(object):
+    """Records spans and writes them as Chrome trace events.
+
+    Spans started and ended on the same thread nest, so a span started while
+    another is open is shown inside it.
+
+    Attributes:
+        spans (list of :obj:`Span`): Spans which have ended.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+        self._origin = timer()
+
+    def start_span(self, name, **attributes):
+        """Start a span, which must later be ended with `Span.end`.
+
+        Returns:
+            :obj:`Span`
+        """
+        return Span(self, name, attributes)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Context manager recording its block as a span.
+
+        Yields:
+            :obj:`Span`
+        """
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        finally:
+            span.end()
+
+    def _record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def chrome_trace_events(self):
+        """Convert the recorded spans to Chrome trace events.
+
+        Returns:
+            list of dict: Complete ('X') events with times in microseconds.
+        """
+        pid = os.getpid()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return [
+            {
+                "name": span.name,
+                "cat": "cymod",
+                "ph": "X",
+                "ts": (span.start - self._origin) * 1e6,
+                "dur": (span.end_time - span.start) * 1e6,
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": dict(
+                    (k, _attribute_value(v)) for k, v in span.attributes.items()
+                ),
+            }
+            for span in spans
+        ]
+
+    def write_chrome_trace(self, filename):
+        """Write the recorded spans to a Chrome trace-event JSON file.
+
+        Args:
+            filename (str)
+        """
+        with open(filename, "w") as f:
+            json.dump(
+                {"traceEvents": self.chrome_trace_events(), "displayTimeUnit": "ms"},
+                f,
+            )
+
+
+class _OpenTelemetrySpan(object):
+    """Wraps an OpenTelemetry span, keeping it current until it ends."""
+
+    def __init__(self, span, token, detach):
+        self._span = span
+        self._token = token
+        self._detach = detach
+
+    def set_attribute(self, name, value):
+        self._span.set_attribute(name, _attribute_value(value))
+
+    def end(self):
+        if self._token is not None:
+            self._detach(self._token)
+            self._token = None
+            self._span.end()
+
+
+class OpenTelemetryTracer(object):
+    """Forwards spans to OpenTelemetry, which must be installed.
+
+    Exporting is configured through OpenTelemetry, e.g. by setting a tracer
+    provider with a span processor writing to a local collector or file.
+
+    Args:
+        tracer (optional): An OpenTelemetry tracer. Defaults to the global
+            tracer provider's tracer named 'cymod'.
+    """
+
+    def __init__(self, tracer=None):
+        try:
+            from opentelemetry import context, trace
+        except ImportError:
+            raise ImportError(
+                "OpenTelemetryTracer requires the opentelemetry-api package"
+            )
+        self._context = context
+        self._trace = trace
+        self._tracer = tracer if tracer is not None else trace.get_tracer("cymod")
+
+    def start_span(self, name, **attributes):
+        span = self._tracer.start_span(
+            name,
+            attributes=dict(
+                (k, _attribute_value(v))
+                for k, v in attributes.items()
+                if v is not None
+            ),
+        )
+        # Make the span current so spans started before it ends are its
+        # children
+        token = self._context.attach(self._trace.set_span_in_context(span))
+        return _OpenTelemetrySpan(span, token, self._context.detach)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        span = self.start_span(name, **attributes)
+        try:
+            yield span
+        finally:
+            span.end()
+
+
+class SpanSwitch(object):
+    """Keeps a span open while consecutive items share a key.
+
+    Used to group batches into spans for the job or file they came from,
+    without needing the batches to be nested in the code which commits them.
+
+    Args:
+        tracer: A :obj:`Tracer` or :obj:`OpenTelemetryTracer`.
+        name (str): Name of the spans started.
+    """
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.key = None
+        self._span = None
+
+    def switch(self, key, **attributes):
+        """End the open span if `key` differs from its key, and start another.
+
+        Args:
+            key: Identifies the span which should be open. If None, no span
+                is left open.
+        """
+        if self._span is not None and key == self.key:
+            return
+        self.close()
+        if key is not None:
+            self.key = key
+            self._span = self.tracer.start_span(self.name, **attributes)
+
+    def close(self):
+        if self._span is not None:
+            self._span.end()
+        self._span = None
+        self.key = None
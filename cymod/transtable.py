@@ -1,6 +1,7 @@
 from __future__ import print_function
 
 import os
+import collections
 import datetime
 
 from future.utils import iteritems
@@ -198,7 +199,7 @@ class EnvironTransitionSet(object):
         )
         return header_str
 
-    def _get_succession_traj_query(self, start_code, end_code):
+    def _get_succession_traj_query(self, start_code, end_code, fresh_load=False):
         """Return a string containing a SuccessionTrajectory query.
 
         This will specify the possibility of transitioning from ``start_code``
@@ -210,17 +211,25 @@ class EnvironTransitionSet(object):
           (tgtLCT:LandCoverType {{code:\"{1}\", model_ID:$model_ID}})
         CREATE
           (traj:SuccessionTrajectory {{model_ID:$model_ID}})
-        MERGE (srcLCT)<-[:SOURCE]-(traj)-[:TARGET]->(tgtLCT);
+        {2} (srcLCT)<-[:SOURCE]-(traj)-[:TARGET]->(tgtLCT);
 
         """.format(
-            start_code, end_code
+            start_code, end_code, "CREATE" if fresh_load else "MERGE"
         )
         return traj_query
 
-    def _get_env_cond_query(self, env_trans):
-        """Given an EnvironTransition construct environ conditions query."""
+    def _get_env_cond_query(self, env_trans, create_cond=False, create_rel=False):
+        """Given an EnvironTransition construct environ conditions query.
+
+        Args:
+            env_trans (:obj:`EnvironTransition`)
+            create_cond (bool): If True, the EnvironCondition is known not to 
+                exist yet and is created rather than merged.
+            create_rel (bool): If True, the CAUSES relationship is known not to
+                exist yet and is created rather than merged.
+        """
         env_cond_query = """
-        MERGE
+        {4}
           (ec:EnvironCondition {{model_ID:$model_ID,
                                 {0},
                                 {1}}})
@@ -229,19 +238,36 @@ class EnvironTransitionSet(object):
           (:LandCoverType {{code:\"{2}\", model_ID:$model_ID}})
           <-[:SOURCE]-(traj:SuccessionTrajectory {{model_ID:$model_ID}})-[:TARGET]->
           (:LandCoverType {{code:\"{3}\", model_ID:$model_ID}})
-        MERGE
+        {5}
           (ec)-[:CAUSES]->(traj);
         """.format(
             env_trans.env_cond_as_string().replace(",\n", ",\n" + 32 * " "),
             env_trans.time_as_string(),
             env_trans.start_state,
             env_trans.end_state,
+            "CREATE" if create_cond else "MERGE",
+            "CREATE" if create_rel else "MERGE",
         )
         return env_cond_query
 
-    def _get_file_dict(self):
-        """Return file name/ file contents key/value pairs."""
+    def _env_cond_key(self, env_trans):
+        return (env_trans.env_cond_as_string(), env_trans.time_as_string())
+
+    def _get_file_dict(self, fresh_load=False):
+        """Return file name/ file contents key/value pairs.
+
+        Args:
+            fresh_load (bool): If True, use CREATE for entities which can't
+                already exist when the files are loaded into a database 
+                without the model, and MERGE only where another query could
+                have produced the entity. Files may be loaded in any order, so
+                EnvironConditions shared between transitions are still merged.
+        """
+        cond_counts = collections.Counter(
+            self._env_cond_key(trans) for trans in self.transitions
+        )
         d = {}
+        file_conds = {}
         for trans in self.transitions:
             start = trans.start_state
             end = trans.end_state
@@ -249,17 +275,34 @@ class EnvironTransitionSet(object):
             if fname not in d:
                 d[fname] = self._get_header_str(
                     "succession", start, end
-                ) + self._get_succession_traj_query(start, end)
-            d[fname] += self._get_env_cond_query(trans)
+                ) + self._get_succession_traj_query(start, end, fresh_load)
+                file_conds[fname] = set()
+            key = self._env_cond_key(trans)
+            first_in_file = key not in file_conds[fname]
+            file_conds[fname].add(key)
+            d[fname] += self._get_env_cond_query(
+                trans,
+                create_cond=fresh_load and cond_counts[key] == 1,
+                create_rel=fresh_load and first_in_file,
+            )
 
         return d
 
-    def write_cypher_files(self, project_path):
+    def write_cypher_files(self, project_path, fresh_load=False):
+        """Write a Cypher file for each pair of states with a transition.
+
+        Args:
+            project_path (str): Directory in which to create the 'succession'
+                directory containing the files.
+            fresh_load (bool): If True, the files will only produce the 
+                correct graph when loaded into a database which doesn't 
+                already contain the model, but load faster. Defaults to False.
+        """
         target_dir = os.path.join(project_path, "succession")
         if not os.path.isdir(target_dir):
             os.makedirs(target_dir)
 
-        d = self._get_file_dict()
+        d = self._get_file_dict(fresh_load)
         for k in d.keys():
             fname = os.path.join(target_dir, k)
             with open(fname, "w") as f:
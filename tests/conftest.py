@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+pytest configuration for the cymod tests
+"""
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    # Coroutine syntax is a SyntaxError before 3.5, and the tests drive the
+    # event loop with asyncio.run, added in 3.7
+    collect_ignore.append("test_asyncload.py")
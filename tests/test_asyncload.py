@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.asyncload
+"""
+import asyncio
+import shutil, tempfile
+import os
+from os import path
+import threading
+import unittest
+
+import pandas as pd
+
+from cymod.asyncload import AsyncServerGraphLoader, ThreadedAsyncDriver
+from tests.test_load import (
+    RecordingDriver,
+    write_query_set_1_to_file,
+    write_query_set_2_to_file,
+)
+
+
+class AsyncServerGraphLoaderTestCase(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary directory
+        self.test_dir = tempfile.mkdtemp()
+        write_query_set_1_to_file(path.join(self.test_dir, "file1.cql"))
+        write_query_set_2_to_file(path.join(self.test_dir, "file2.cql"))
+
+    def tearDown(self):
+        # Remove the temp directory after the test
+        shutil.rmtree(self.test_dir)
+
+    def commit(self, driver, table=None, fresh_load=False, **kwargs):
+        gl = AsyncServerGraphLoader.from_driver(ThreadedAsyncDriver(driver))
+        gl.load_cypher(self.test_dir)
+        if table is not None:
+            gl.load_tabular(table, "start", "end", fresh_load=fresh_load)
+
+        async def run():
+            await gl.commit(**kwargs)
+            await gl.close()
+
+        asyncio.run(run())
+
+    def test_commit_loads_queries_in_priority_order(self):
+        """All queries should be loaded, lower priority files first."""
+        driver = RecordingDriver()
+        self.commit(driver)
+        self.assertEqual(
+            driver.log,
+            [
+                'MERGE (n:TestNode {test_str: "test value"});',
+                "MERGE (n:TestNode {test_int: 2});",
+                "MERGE (n:TestNode {test_bool: true});",
+            ],
+        )
+
+    def test_commit_per_file_uses_transactions(self):
+        """File transaction scope should wrap each file in a transaction."""
+        driver = RecordingDriver()
+        self.commit(driver, tx_scope="file")
+        self.assertEqual(driver.log.count("BEGIN"), 2)
+        self.assertEqual(driver.log.count("COMMIT"), 2)
+
+    def test_failed_file_is_rolled_back(self):
+        """A failure part way through a file should roll back the file."""
+        driver = RecordingDriver(fail_on="test_int")
+        with self.assertRaises(RuntimeError):
+            self.commit(driver, tx_scope="file")
+        self.assertIn("ROLLBACK", driver.log)
+        self.assertNotIn("COMMIT", driver.log)
+
+    def test_unsupported_tx_scope_raises_error(self):
+        """Transaction scopes spanning several sources can't be used."""
+        with self.assertRaises(ValueError):
+            self.commit(RecordingDriver(), tx_scope="load")
+
+    def test_table_chunks_loaded_separately(self):
+        """Each chunk of a table should be loaded as a source of its own."""
+        table = pd.DataFrame(
+            {"start": ["a", "b", "c"], "end": ["b", "c", "a"], "cond": [1, 2, 3]}
+        )
+        driver = RecordingDriver()
+        self.commit(driver, table=table, tx_scope="file", chunk_size=2)
+        # Two Cypher files and two table chunks
+        self.assertEqual(driver.log.count("BEGIN"), 4)
+        self.assertEqual(len(driver.log), 4 * 2 + 6)
+
+    def test_chunks_of_fresh_load_tables_rejected(self):
+        """Fresh load tables' rows depend on entities made by earlier rows."""
+        table = pd.DataFrame({"start": ["a"], "end": ["b"], "cond": [1]})
+        with self.assertRaises(ValueError):
+            self.commit(RecordingDriver(), table=table, fresh_load=True, chunk_size=1)
+
+    def test_sources_prepared_off_event_loop(self):
+        """Files should be parsed outside the thread running the event loop."""
+        threads = set()
+        gl = AsyncServerGraphLoader.from_driver(ThreadedAsyncDriver(RecordingDriver()))
+        gl.load_cypher(self.test_dir)
+        itersources = gl._itersources
+
+        def recording_itersources(chunk_size=None):
+            for source in itersources(chunk_size):
+                threads.add(threading.current_thread())
+                yield source
+
+        gl._itersources = recording_itersources
+
+        async def run():
+            await gl.commit()
+            await gl.close()
+
+        asyncio.run(run())
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
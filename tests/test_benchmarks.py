@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Smoke tests for the benchmarks, run at their smallest sizes
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import six
+
+from cymod.load import ServerGraphLoader
+from cymod.memgraph import MemoryDriver
+from benchmarks import micro, throughput
+from benchmarks.latency import LatencyDriver
+
+
+class BenchmarkSmokeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = six.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        shutil.rmtree(self.test_dir)
+
+    def test_latency_driver_runs_queries_in_memory(self):
+        with open(os.path.join(self.test_dir, "a.cql"), "w") as f:
+            f.write("MERGE (:A {id: 1});\nMERGE (:A {id: 2});")
+        inner = MemoryDriver()
+        driver = LatencyDriver(round_trip=0, inner=inner)
+        loader = ServerGraphLoader.from_driver(driver)
+        loader.load_cypher(self.test_dir)
+        loader.commit(tx_scope="file", query_timeout=5)
+        self.assertEqual(len(inner.graph.find_nodes(["A"], {})), 2)
+        # Two queries and a commit
+        self.assertEqual(driver.round_trips, 3)
+
+    def test_throughput_variants_load_every_query(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            results = throughput.main(
+                ["--sizes", "small", "--in-process", "--memory", "--round-trip", "0"]
+            )
+        self.assertEqual(
+            [r["variant"] for r in results], list(throughput.VARIANTS.keys())
+        )
+        self.assertEqual(len(set(r["queries"] for r in results)), 1)
+
+    def test_micro_run_and_compare(self):
+        output = os.path.join(self.test_dir, "results.json")
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            status = micro.main(
+                [
+                    "run",
+                    "--rows",
+                    "10",
+                    "--repeat",
+                    "1",
+                    "--min-time",
+                    "0",
+                    "--output",
+                    output,
+                ]
+            )
+        self.assertEqual(status, 0)
+        with open(output) as f:
+            self.assertTrue(json.load(f))
+        self.assertEqual(micro.main(["compare", output, output]), 0)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.checkpoint
+"""
+from __future__ import print_function
+
+import os
+import shutil, tempfile
+from os import path
+import unittest
+
+from cymod.cybase import CypherQuery, CypherQuerySource, CypherQueryBatch
+from cymod.checkpoint import CheckpointLog
+
+
+def make_batch(statement, index=0):
+    query = CypherQuery(
+        statement, params={}, source=CypherQuerySource("file.cql", "cypher", index)
+    )
+    return CypherQueryBatch([query], (0, 0))
+
+
+class CheckpointLogTestCase(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary directory
+        self.test_dir = tempfile.mkdtemp()
+        self.fname = path.join(self.test_dir, "load.ckpt")
+
+    def tearDown(self):
+        # Remove the temp directory after the test
+        shutil.rmtree(self.test_dir)
+
+    def test_recorded_batch_is_committed_on_resume(self):
+        """Batches recorded in one run are known about when resuming."""
+        with CheckpointLog(self.fname) as log:
+            log.record(make_batch("MERGE (n:A);"))
+
+        with CheckpointLog(self.fname, resume=True) as log:
+            self.assertIn(make_batch("MERGE (n:A);"), log)
+            self.assertNotIn(make_batch("MERGE (n:A);", index=1), log)
+
+    def test_changed_batch_is_not_committed(self):
+        """A batch whose content has changed should not be skipped."""
+        with CheckpointLog(self.fname) as log:
+            log.record(make_batch("MERGE (n:A);"))
+
+        with CheckpointLog(self.fname, resume=True) as log:
+            self.assertNotIn(make_batch("MERGE (n:B);"), log)
+
+    def test_log_truncated_unless_resuming(self):
+        """Starting a new load should discard the previous checkpoints."""
+        with CheckpointLog(self.fname) as log:
+            log.record(make_batch("MERGE (n:A);"))
+
+        CheckpointLog(self.fname).close()
+
+        with CheckpointLog(self.fname, resume=True) as log:
+            self.assertNotIn(make_batch("MERGE (n:A);"), log)
+
+    def test_partially_written_line_ignored(self):
+        """A torn final line shouldn't prevent a load being resumed."""
+        with CheckpointLog(self.fname) as log:
+            log.record(make_batch("MERGE (n:A);"))
+        with open(self.fname, "a") as f:
+            f.write('{"ident": "0:file.cql#1..fi')
+
+        with CheckpointLog(self.fname, resume=True) as log:
+            self.assertIn(make_batch("MERGE (n:A);"), log)
+
+    def test_records_synced_in_batches(self):
+        """Records should be synced every sync_every batches and on close."""
+        synced = []
+        fsync = os.fsync
+        os.fsync = synced.append
+        try:
+            with CheckpointLog(self.fname, sync_every=3) as log:
+                for i in range(4):
+                    log.record(make_batch("MERGE (n:A);", index=i))
+                self.assertEqual(len(synced), 1)
+            self.assertEqual(len(synced), 2)
+        finally:
+            os.fsync = fsync
+
+        with CheckpointLog(self.fname, resume=True) as log:
+            for i in range(4):
+                self.assertIn(make_batch("MERGE (n:A);", index=i), log)
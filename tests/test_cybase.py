@@ -11,7 +11,12 @@ import unittest
 
 import pandas as pd
 
-from cymod.cybase import CypherQuery, CypherQuerySource
+from cymod.cybase import (
+    CypherQuery,
+    CypherQuerySource,
+    StatementTemplate,
+    cypher_literal,
+)
 
 
 class CypherQuerySourceTestCase(unittest.TestCase):
@@ -82,3 +87,46 @@ class CypherQueryTestCase(unittest.TestCase):
             source=CypherQuerySource("queries.cql", "cypher", 10),
         )
         self.assertIsInstance(q.source, CypherQuerySource)
+
+    def test_is_schema(self):
+        """Index and constraint statements should be identified."""
+        schema_statements = [
+            "CREATE INDEX idx FOR (n:A) ON (n.b);",
+            "create constraint c IF NOT EXISTS FOR (n:A) REQUIRE n.b IS UNIQUE;",
+            "CREATE TEXT INDEX t FOR (n:A) ON (n.b);",
+            "DROP INDEX idx;",
+            "CREATE OR REPLACE INDEX idx FOR (n:A) ON (n.b);",
+        ]
+        for statement in schema_statements:
+            self.assertTrue(CypherQuery(statement).is_schema, statement)
+
+        self.assertFalse(CypherQuery("CREATE (n:Index {a: 1});").is_schema)
+        self.assertFalse(CypherQuery("MERGE (n:A);").is_schema)
+
+
+class StatementTemplateTestCase(unittest.TestCase):
+    def test_values_rendered_as_cypher_literals(self):
+        self.assertEqual(cypher_literal(None), "null")
+        self.assertEqual(cypher_literal(False), "false")
+        self.assertEqual(cypher_literal(3), "3")
+        self.assertEqual(cypher_literal(0.5), "0.5")
+        self.assertEqual(cypher_literal('a "b"'), '"a \\"b\\""')
+        self.assertEqual(cypher_literal({"b": [1, "x"]}), '{`b`: [1, "x"]}')
+        with self.assertRaises(TypeError):
+            cypher_literal(object())
+
+    def test_parameters_with_shared_prefix_rendered_separately(self):
+        t = StatementTemplate("MERGE (n {a: $id, b: $id_2}) RETURN $id;")
+        self.assertEqual(t.param_names, ["id", "id_2", "id"])
+        self.assertEqual(
+            t.render({"id": "x", "id_2": 2}),
+            'MERGE (n {a: "x", b: 2}) RETURN "x";',
+        )
+
+    def test_dollars_in_strings_and_names_ignored(self):
+        t = StatementTemplate("MERGE (n {a: '$id', `$b`: \"\\\"$id\", c: $id});")
+        self.assertEqual(t.param_names, ["id"])
+
+    def test_missing_parameter_raises_key_error(self):
+        with self.assertRaises(KeyError):
+            StatementTemplate("RETURN $a").render({})
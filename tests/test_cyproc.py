@@ -298,6 +298,58 @@ class CypherFileTestCase(unittest.TestCase):
         cf = CypherFile(f1_name)
         self.assertEqual(cf.priority, 1)
 
+    def test_schema_statement_ends_params(self):
+        """Schema statements should be recognised as the start of queries."""
+        fname = path.join(self.test_dir, "schema.cql")
+        with open(fname, "w") as f:
+            f.write(
+                '{ "priority": 1 }\n'
+                + "DROP INDEX old_index IF EXISTS;\n"
+                + "CREATE INDEX new_index FOR (n:TestNode) ON (n.name);\n"
+                + 'MERGE (n:TestNode {name: "Sue"});'
+            )
+        cf = CypherFile(fname)
+        self.assertEqual(cf.priority, 1)
+        self.assertEqual(
+            [q.is_schema for q in cf.queries], [True, True, False]
+        )
+
+    def test_braces_in_queries_dont_end_params(self):
+        """Only the closing brace of the parameters should end them."""
+        fname = path.join(self.test_dir, "queries.cql")
+        with open(fname, "w") as f:
+            f.write(
+                '{ "priority": 1 }\n'
+                + "MATCH (n) SET n += {a: 1} WITH n MERGE (n)-[:R]->(:B {b: 2});"
+            )
+        cf = CypherFile(fname)
+        self.assertEqual(cf.priority, 1)
+        self.assertEqual(len(cf.queries), 1)
+        self.assertTrue(cf.queries[0].statement.startswith("MATCH (n) SET"))
+
+    def test_semicolons_in_strings_dont_end_queries(self):
+        fname = path.join(self.test_dir, "queries.cql")
+        with open(fname, "w") as f:
+            f.write(
+                'MERGE (:A {name: "a;b", other: \'c;\\\'d\'});\n'
+                + "MERGE (:`B;C`);"
+            )
+        cf = CypherFile(fname)
+        self.assertEqual(
+            [q.statement for q in cf.queries],
+            ['MERGE (:A {name: "a;b", other: \'c;\\\'d\'});', "MERGE (:`B;C`);"],
+        )
+
+    def test_file_read_once(self):
+        """The text read when the file is scanned should be parsed."""
+        fname = path.join(self.test_dir, "queries.cql")
+        with open(fname, "w") as f:
+            f.write('{"priority": 1}\nMERGE (:A);')
+        cf = CypherFile(fname)
+        os.remove(fname)
+        self.assertEqual(cf.priority, 1)
+        self.assertEqual([q.statement for q in cf.queries], ["MERGE (:A);"])
+
     def test_extant_but_empty_file_gives_warning(self):
         """If a Cypher file doesn't contain any queries it should warn user."""
         empty_fname = os.path.join(self.test_dir, "empty.cql")
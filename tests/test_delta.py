@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.delta
+"""
+from __future__ import print_function
+
+import shutil, tempfile
+from os import path
+import unittest
+
+import pandas as pd
+
+from cymod.cybase import CypherQuery, CypherQuerySource
+from cymod.delta import (
+    SourceManifest,
+    identified_batches,
+    plan_delta,
+    dirty_sources,
+    provenance_statement,
+    attributed_queries,
+    orphans,
+)
+from cymod.load import ServerGraphLoader
+from cymod.memgraph import MemoryDriver
+
+
+class SourceManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary directory
+        self.test_dir = tempfile.mkdtemp()
+        self.fname = path.join(self.test_dir, "manifest.json")
+
+    def tearDown(self):
+        # Remove the temp directory after the test
+        shutil.rmtree(self.test_dir)
+
+    def test_unknown_model_has_no_digests(self):
+        manifest = SourceManifest(self.fname)
+        self.assertEqual(manifest.digests({"model_ID": 1}), {})
+        self.assertEqual(manifest.links({"model_ID": 1}), {})
+
+    def test_digests_persisted_per_model(self):
+        """Digests saved for one model should be reloaded for that model."""
+        link = {"touches": ["b.cql"], "modifies": []}
+        SourceManifest(self.fname).update(
+            {"model_ID": 1}, {"a.cql": "123"}, {"a.cql": link}
+        )
+        SourceManifest(self.fname).update({"model_ID": 2}, {"b.cql": "456"}, {})
+
+        manifest = SourceManifest(self.fname)
+        self.assertEqual(manifest.digests({"model_ID": 1}), {"a.cql": "123"})
+        self.assertEqual(manifest.links({"model_ID": 1}), {"a.cql": link})
+        self.assertEqual(manifest.digests({"model_ID": 2}), {"b.cql": "456"})
+
+
+class PlanDeltaTestCase(unittest.TestCase):
+    def test_changed_new_and_removed_sources_identified(self):
+        changed, removed = plan_delta(
+            {"a": "1", "b": "2", "c": "3"}, {"a": "1", "b": "20", "d": "4"}
+        )
+        self.assertEqual(changed, set(["b", "d"]))
+        self.assertEqual(removed, set(["c"]))
+
+    def test_dirty_sources_follow_links_from_frontier(self):
+        """Sources touching a dirty source, or modified by one, are dirty."""
+        links = {
+            "a": {"touches": [], "modifies": []},
+            "b": {"touches": ["a"], "modifies": []},
+            "c": {"touches": ["b"], "modifies": ["d"]},
+            "d": {"touches": [], "modifies": []},
+            "e": {"touches": ["d"], "modifies": []},
+            "f": {"touches": [], "modifies": []},
+        }
+        self.assertEqual(
+            dirty_sources(set(["a"]), links), set(["a", "b", "c", "d", "e"])
+        )
+        self.assertEqual(dirty_sources(set(["f"]), links), set(["f"]))
+
+
+class IdentifiedBatchesTestCase(unittest.TestCase):
+    def table_queries(self, values):
+        return [
+            CypherQuery(
+                "MERGE (n:A {{v: {0}}});".format(v),
+                source=CypherQuerySource(None, "tabular", i),
+            )
+            for i, v in enumerate(values)
+        ]
+
+    def test_cypher_files_identified_by_name(self):
+        """Adding a query to a file shouldn't change its identity."""
+        queries = [
+            CypherQuery("MERGE (n:A);", source=CypherQuerySource("f.cql", "cypher", i))
+            for i in range(3)
+        ]
+        before = list(identified_batches([((0, 0), queries[:2])], 10))
+        after = list(identified_batches([((0, 0), queries)], 10))
+        self.assertEqual([sid for sid, _ in before], ["f.cql"])
+        self.assertEqual([sid for sid, _ in after], ["f.cql"])
+        self.assertEqual(len(after[0][1]), 3)
+
+    def test_inserted_row_changes_one_chunk(self):
+        """Chunk boundaries follow row content, not row positions."""
+
+        def chunks(values):
+            batches = identified_batches([((1, 0), self.table_queries(values))], 4)
+            return dict((sid, batch.digest()) for sid, batch in batches)
+
+        before = chunks(range(100))
+        after = chunks([-1] + list(range(100)))
+        self.assertGreater(len(before), 5)
+        self.assertTrue(all(sid.startswith("1:tabular@") for sid in before))
+        changed, removed = plan_delta(before, after)
+        self.assertLessEqual(len(changed), 2)
+        self.assertLessEqual(len(removed), 1)
+
+
+class ProvenanceStatementTestCase(unittest.TestCase):
+    def test_created_and_merged_data_attributed(self):
+        self.assertEqual(
+            provenance_statement('CREATE (:A {name: "x;y"})-[:R]->(b:B);', "L", "p"),
+            'CREATE (cymod_e0:A {name: "x;y"})-[cymod_e1:R]->(b:B) '
+            "SET cymod_e0:`L`, cymod_e1.`p` = true, b:`L`;",
+        )
+
+    def test_matched_and_modified_nodes_marked(self):
+        self.assertEqual(
+            provenance_statement("MATCH (a:A)-[:R]->(b) SET a.x = 1", "L", "p"),
+            "MATCH (a:A)-[:R]->(b) SET a:`L`:`CymodTouched`, "
+            "b:`L`:`CymodTouched` SET a.x = 1 SET a:`CymodModified`",
+        )
+
+    def test_marks_placed_after_reading_clauses(self):
+        """Cypher needs a WITH between an updating clause and a MATCH."""
+        self.assertEqual(
+            provenance_statement(
+                "MATCH (a:A) MATCH (b:B) MERGE (a)-[:R]->(b)", "L", "p"
+            ),
+            "MATCH (a:A) MATCH (b:B) SET a:`L`:`CymodTouched`, b:`L`:`CymodTouched` "
+            "MERGE (a)-[cymod_e0:R]->(b) SET cymod_e0.`p` = true",
+        )
+
+    def test_on_match_changes_marked(self):
+        self.assertEqual(
+            provenance_statement(
+                "MERGE (n:A) ON CREATE SET n.x = 1 ON MATCH SET n.y = 2", "L", "p"
+            ),
+            "MERGE (n:A) ON CREATE SET n.x = 1 ON MATCH SET n.y = 2 "
+            "SET n:`L`, n:`CymodModified`",
+        )
+
+    def test_unattributable_statements(self):
+        for statement in [
+            "MATCH (n:A) DETACH DELETE n",
+            "FOREACH (x IN [1, 2] | CREATE (:A {v: x}))",
+            "MATCH (a:A) WITH a AS b MERGE (b)-[:R]->(:C)",
+            "CALL db.labels()",
+        ]:
+            self.assertIsNone(provenance_statement(statement, "L", "p"), statement)
+        with self.assertRaises(ValueError):
+            attributed_queries([CypherQuery("MATCH (n) DELETE n")], {"m": 1}, "a")
+
+    def test_orphans(self):
+        records = [
+            {"id": 1, "keys": ["State", "CymodSource_a"]},
+            {"id": 2, "keys": ["State"]},
+        ]
+        self.assertEqual(orphans(records, "CymodSource_"), [2])
+
+
+class DeltaLoadTestCase(unittest.TestCase):
+    """Delta loads applied to a :obj:`MemoryGraph`."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.manifest = path.join(self.test_dir, "manifest.json")
+        self.driver = MemoryDriver()
+        self.graph = self.driver.graph
+        self.model = {"model_ID": "m"}
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def write(self, name, text):
+        fname = path.join(self.test_dir, name)
+        with open(fname, "w") as f:
+            f.write(text)
+        return fname
+
+    def commit_delta(self, table=None, **kwargs):
+        gl = ServerGraphLoader.from_driver(self.driver)
+        gl.load_cypher(self.test_dir)
+        if table is not None:
+            gl.load_tabular(table, "start", "end", global_params=self.model)
+        return gl.commit_delta(self.model, self.manifest, **kwargs)
+
+    def test_set_only_dependent_reapplied(self):
+        """A file which only sets properties on another file's nodes should be
+        re-applied when that file changes, and undone when it changes."""
+        a = self.write("a.cql", "MERGE (:A {id: 1, v: 1});")
+        b = self.write(
+            "b.cql", '{"priority": 1}\nMATCH (n:A {id: 1}) SET n.flag = true;'
+        )
+        self.commit_delta()
+
+        self.write("a.cql", "MERGE (:A {id: 1, v: 2});")
+        summary = self.commit_delta()
+        self.assertEqual(summary["applied"], [a, b])
+        nodes = self.graph.find_nodes(["A"], {})
+        self.assertEqual(len(nodes), 1)
+        self.assertEqual(nodes[0]["v"], 2)
+        self.assertIs(nodes[0]["flag"], True)
+
+        self.write(
+            "b.cql", '{"priority": 1}\nMATCH (n:A {id: 1}) SET n.other = true;'
+        )
+        summary = self.commit_delta()
+        self.assertEqual(summary["applied"], [a, b])
+        nodes = self.graph.find_nodes(["A"], {})
+        self.assertEqual(len(nodes), 1)
+        self.assertIsNone(nodes[0].get("flag"))
+        self.assertIs(nodes[0]["other"], True)
+
+    def test_relationship_dependent_reapplied(self):
+        a = self.write("a.cql", "MERGE (:A {id: 1, v: 1});")
+        c = self.write(
+            "c.cql",
+            '{"priority": 1}\nMATCH (n:A {id: 1}) MERGE (n)-[:R]->(:C {id: 1});',
+        )
+        self.commit_delta()
+
+        self.write("a.cql", "MERGE (:A {id: 1, v: 2});")
+        summary = self.commit_delta()
+        self.assertEqual(summary["applied"], [a, c])
+        self.assertEqual(self.graph.node_count("A"), 1)
+        self.assertEqual(self.graph.node_count("C"), 1)
+        self.assertEqual(self.graph.relationship_count("R"), 1)
+
+        self.write("c.cql", '{"priority": 1}\nMERGE (:C {id: 2});')
+        summary = self.commit_delta()
+        self.assertEqual(summary["applied"], [c])
+        self.assertEqual(self.graph.node_count("A"), 1)
+        self.assertEqual(self.graph.node_count("C"), 1)
+        self.assertEqual(self.graph.relationship_count(), 0)
+
+    def test_inserted_row_reapplies_its_chunk(self):
+        """Nodes shared between chunks survive when one chunk changes."""
+        states = ["s" + str(i % 7) for i in range(60)]
+        rows = {
+            "start": states,
+            "end": states[1:] + states[:1],
+            "cond": list(range(60)),
+        }
+        first = self.commit_delta(pd.DataFrame(rows), chunk_size=4)
+        self.assertGreater(len(first["applied"]), 5)
+
+        rows = dict((k, [v[0]] + v) for k, v in rows.items())
+        rows["cond"][0] = -1
+        summary = self.commit_delta(pd.DataFrame(rows), chunk_size=4)
+        self.assertLessEqual(len(summary["applied"]), 2)
+
+        expected = MemoryDriver()
+        gl = ServerGraphLoader.from_driver(expected)
+        gl.load_tabular(pd.DataFrame(rows), "start", "end", global_params=self.model)
+        gl.commit()
+        for label in ["State", "Transition", "Condition"]:
+            self.assertEqual(
+                self.graph.node_count(label), expected.graph.node_count(label)
+            )
+        self.assertEqual(
+            self.graph.relationship_count(), expected.graph.relationship_count()
+        )
+
+    def test_fresh_load_tables_rejected(self):
+        """Queries generated with fresh_load assume every row is applied."""
+        gl = ServerGraphLoader.from_driver(self.driver)
+        gl.load_tabular(
+            pd.DataFrame({"start": ["a"], "end": ["b"], "cond": [1]}),
+            "start",
+            "end",
+            fresh_load=True,
+        )
+        with self.assertRaises(ValueError):
+            gl.commit_delta(self.model, self.manifest)
+        self.assertEqual(self.graph.node_count(), 0)
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.export
+"""
+from __future__ import print_function
+
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import pandas as pd
+
+from cymod.load import GraphLoader
+from cymod.customise import NodeLabels
+from cymod.transtable import EnvironTransitionSet
+from cymod.cybase import CypherQuery
+from cymod.export import (
+    AdminImportWriter,
+    iter_transaction_blocks,
+    export_admin_import,
+    export_cypher_shell_script,
+    export_environ_transitions,
+)
+
+
+def read_csv(filename):
+    with open(filename, "r") as f:
+        return list(csv.reader(f))
+
+
+class AdminImportExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.table = pd.DataFrame(
+            {
+                "start": ["state1", "state1", "state2"],
+                "end": ["state2", "state2", "state1"],
+                "cond": ["low", "high", "low"],
+                "level": [1, 2, 1],
+            }
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def rows(self, name):
+        return read_csv(os.path.join(self.directory, name))
+
+    def test_tabular_jobs_written_with_typed_headers(self):
+        loader = GraphLoader()
+        loader.load_tabular(
+            self.table,
+            "start",
+            "end",
+            labels=NodeLabels({"State": "MyState"}),
+            global_params={"model_ID": 1},
+        )
+        writer = export_admin_import(loader, self.directory)
+
+        states = self.rows("nodes_MyState.csv")
+        self.assertEqual(states[0], [":ID", "code", "model_ID:int", ":LABEL"])
+        self.assertEqual(
+            [r[1:] for r in states[1:]],
+            [["state1", "1", "MyState"], ["state2", "1", "MyState"]],
+        )
+
+        transitions = self.rows("nodes_Transition.csv")
+        self.assertEqual(len(transitions), 3)
+
+        conditions = self.rows("nodes_Condition.csv")
+        self.assertEqual(
+            conditions[0], [":ID", "cond", "level:int", "model_ID:int", ":LABEL"]
+        )
+        # The repeated 'low' condition causes different transitions, so is a
+        # separate node
+        self.assertEqual(len(conditions), 4)
+
+        self.assertEqual(
+            self.rows("relationships_CAUSES.csv")[0], [":START_ID", ":END_ID", ":TYPE"]
+        )
+        self.assertEqual(len(writer.node_files), 3)
+        self.assertEqual(len(writer.relationship_files), 3)
+
+    def test_relationships_refer_to_written_nodes(self):
+        loader = GraphLoader()
+        loader.load_tabular(self.table, "start", "end")
+        writer = export_admin_import(loader, self.directory)
+
+        node_ids = set()
+        for filename in writer.node_files:
+            node_ids.update(r[0] for r in read_csv(filename)[1:])
+        for filename in writer.relationship_files:
+            for start_id, end_id, _ in read_csv(filename)[1:]:
+                self.assertIn(start_id, node_ids)
+                self.assertIn(end_id, node_ids)
+
+    def test_ids_are_stable(self):
+        loader = GraphLoader()
+        loader.load_tabular(self.table, "start", "end")
+        first = export_admin_import(loader, self.directory)
+        first_rows = [read_csv(f) for f in first.node_files]
+        second = export_admin_import(loader, self.directory)
+        self.assertEqual([read_csv(f) for f in second.node_files], first_rows)
+
+    def test_cypher_jobs_skipped_with_warning(self):
+        loader = GraphLoader()
+        loader.load_cypher(self.directory)
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            writer = export_admin_import(loader, self.directory)
+        self.assertEqual(len(w), 1)
+        self.assertEqual(writer.node_files, [])
+
+    def test_environ_transitions_share_conditions(self):
+        df = pd.DataFrame(
+            {
+                "start": ["a", "b"],
+                "end": ["b", "a"],
+                "delta_t": [10, 10],
+                "water": ["xeric", "xeric"],
+                "fire": [True, True],
+            }
+        )
+        ets = EnvironTransitionSet(df, "start", "end", "delta_t")
+        with AdminImportWriter(self.directory) as writer:
+            export_environ_transitions(writer, ets, {"model_ID": 1})
+
+        conditions = self.rows("nodes_EnvironCondition.csv")
+        self.assertEqual(
+            conditions[0],
+            [":ID", "delta_t:int", "fire:boolean", "model_ID:int", "water", ":LABEL"],
+        )
+        self.assertEqual(
+            conditions[1][1:], ["10", "true", "1", "xeric", "EnvironCondition"]
+        )
+        self.assertEqual(len(conditions), 2)
+        self.assertEqual(len(self.rows("nodes_SuccessionTrajectory.csv")), 3)
+        self.assertEqual(len(self.rows("relationships_CAUSES.csv")), 3)
+
+    def test_nodes_with_different_properties_written_to_separate_files(self):
+        with AdminImportWriter(self.directory) as writer:
+            writer.add_node("State", {"code": "a"})
+            writer.add_node("State", {"code": "b", "extra": 1.5})
+        self.assertEqual(
+            [os.path.basename(f) for f in writer.node_files],
+            ["nodes_State.csv", "nodes_State_1.csv"],
+        )
+        self.assertEqual(
+            self.rows("nodes_State_1.csv")[0], [":ID", "code", "extra:float", ":LABEL"]
+        )
+        self.assertIn("--nodes=" + writer.node_files[1], writer.import_command())
+
+
+class TransactionBlockTestCase(unittest.TestCase):
+    def test_blocks_split_by_size_and_kind(self):
+        queries = [
+            CypherQuery("CREATE INDEX a FOR (n:A) ON (n.a);"),
+            CypherQuery("MERGE (n:A {a: 1});"),
+            CypherQuery("MERGE (n:A {a: 2});"),
+            CypherQuery("MERGE (n:A {a: 3});"),
+        ]
+        blocks = list(iter_transaction_blocks(queries, tx_size=2))
+        self.assertEqual([len(b) for b in blocks], [1, 2, 1])
+
+    def test_blocks_split_only_by_conflicting_params(self):
+        queries = [
+            CypherQuery("MERGE (n:A);", params={}),
+            CypherQuery("MERGE (n:A {x: $x});", params={"x": 1}),
+            CypherQuery("MERGE (n:A);", params={}),
+            CypherQuery("MERGE (n:A {x: $x});", params={"x": 1}),
+            CypherQuery("MERGE (n:A {x: $x});", params={"x": 2}),
+        ]
+        blocks = list(iter_transaction_blocks(queries, 100, split_params=True))
+        self.assertEqual([len(b) for b in blocks], [4, 1])
+
+    def test_auto_commit_statements_in_blocks_of_their_own(self):
+        load = "LOAD CSV FROM 'file:///a.csv' AS row CALL { WITH row MERGE (:A) } "
+        queries = [
+            CypherQuery("MERGE (n:A);"),
+            CypherQuery(load + "IN TRANSACTIONS OF 10 ROWS;"),
+            CypherQuery(load + "IN TRANSACTIONS OF 10 ROWS;"),
+            CypherQuery("MERGE (n:A);"),
+        ]
+        blocks = list(iter_transaction_blocks(queries, tx_size=100))
+        self.assertEqual([len(b) for b in blocks], [1, 1, 1, 1])
+
+
+class CypherShellScriptTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        for name in ["a", "b"]:
+            job_dir = os.path.join(self.test_dir, name)
+            os.makedirs(job_dir)
+            with open(os.path.join(job_dir, "nodes.cql"), "w") as f:
+                f.write("MERGE (:A {id: $id, n: 1});\nMERGE (:A {id: $id, n: 2});")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_params_set_before_transactions_using_them(self):
+        loader = GraphLoader()
+        loader.load_cypher(os.path.join(self.test_dir, "a"), global_params={"id": 1})
+        loader.load_cypher(
+            os.path.join(self.test_dir, "b"), global_params={"id": "two"}
+        )
+        fname = os.path.join(self.test_dir, "script.cypher")
+        self.assertEqual(export_cypher_shell_script(loader, fname, tx_size=10), 4)
+
+        with open(fname) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(
+            lines,
+            [
+                ":param id => 1",
+                ":begin",
+                "MERGE (:A {id: $id, n: 1});",
+                "MERGE (:A {id: $id, n: 2});",
+                ":commit",
+                ':param id => "two"',
+                ":begin",
+                "MERGE (:A {id: $id, n: 1});",
+                "MERGE (:A {id: $id, n: 2});",
+                ":commit",
+            ],
+        )
+
+    def test_params_set_once_for_compatible_queries(self):
+        """Queries only need a transaction of their own if their parameter
+        values conflict with those of earlier queries."""
+        with open(os.path.join(self.test_dir, "a", "more.cql"), "w") as f:
+            f.write('{"priority": 1}\nMERGE (:B);')
+        loader = GraphLoader()
+        loader.load_cypher(os.path.join(self.test_dir, "a"), global_params={"id": 1})
+        fname = os.path.join(self.test_dir, "script.cypher")
+        export_cypher_shell_script(loader, fname, tx_size=100)
+
+        with open(fname) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[:2], [":param id => 1", ":begin"])
+        self.assertEqual(lines.count(":begin"), 1)
+
+    def test_load_csv_written_outside_transactions(self):
+        loader = GraphLoader()
+        loader.load_cypher(os.path.join(self.test_dir, "a"), global_params={"id": 1})
+        loader.load_tabular(
+            pd.DataFrame({"start": ["a"], "end": ["b"], "cond": [1]}),
+            "start",
+            "end",
+            import_dir=self.test_dir,
+        )
+        fname = os.path.join(self.test_dir, "script.cypher")
+        export_cypher_shell_script(loader, fname)
+
+        with open(fname) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[-2], ":commit")
+        self.assertTrue(lines[-1].startswith("LOAD CSV WITH HEADERS"))
+
+    def test_transactions_limited_to_tx_size(self):
+        loader = GraphLoader()
+        loader.load_cypher(os.path.join(self.test_dir, "a"), global_params={"id": 1})
+        fname = os.path.join(self.test_dir, "script.cypher")
+        export_cypher_shell_script(loader, fname, tx_size=1)
+
+        with open(fname) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines.count(":begin"), 2)
+        self.assertEqual(lines.count(":param id => 1"), 1)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.lint
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cymod.lint import lint_statement, lint_directory, written_labels
+
+
+def rules(statement):
+    return [rule for rule, _ in lint_statement(statement)]
+
+
+class LintStatementTestCase(unittest.TestCase):
+    def test_disconnected_match_patterns(self):
+        self.assertEqual(
+            rules("MATCH (a:A), (b:B) MERGE (a)-[:R]->(b);"), ["cartesian-product"]
+        )
+        self.assertEqual(
+            rules("UNWIND $rows AS row MATCH (a:A) SET a.x = row.x"),
+            ["cartesian-product"],
+        )
+        self.assertEqual(
+            rules("MATCH (a:A) WITH a MATCH (b:B) RETURN a, b"), ["cartesian-product"]
+        )
+
+    def test_connected_or_keyed_patterns_allowed(self):
+        self.assertEqual(rules("MATCH (a:A)-[:R]->(b:B), (b)-->(c) RETURN c"), [])
+        self.assertEqual(rules("UNWIND $rows AS row MATCH (a:A {id: row.id})"), [])
+        self.assertEqual(rules("MATCH (a:A {id: 1}) WITH a MATCH (a)-->(b)"), [])
+        # Lookups by key match few nodes
+        self.assertEqual(
+            rules('MATCH (a:A {id: "x, (y)"}) MATCH (b:B {id: 2}) MERGE (a)-->(b)'),
+            [],
+        )
+
+    def test_merge_without_key(self):
+        self.assertEqual(
+            rules("MERGE (n:State) ON CREATE SET n.t = timestamp()"),
+            ["merge-without-key"],
+        )
+        self.assertEqual(rules("MERGE ({id: 1})"), ["merge-without-key"])
+        self.assertEqual(
+            rules("MATCH (n:A {id: 1}) MERGE (n)-[:R]->(:B {id: $id})"), []
+        )
+
+    def test_anchored_merge_allowed(self):
+        """Nodes connected to bound nodes are found without an index."""
+        self.assertEqual(
+            rules(
+                'MATCH (a:S {code: "a"}), (b:S {code: "b"}) '
+                "MERGE (a)<-[:SOURCE]-(trans:Transition)-[:TARGET]->(b) "
+                "MERGE (:Condition)-[:CAUSES]->(trans)"
+            ),
+            [],
+        )
+        self.assertEqual(
+            rules("MERGE (s:S {code: 1}) MERGE (s)-[:R]->(:T)-[:R]->(:U)"), []
+        )
+        self.assertEqual(
+            rules("MATCH (a:S {code: 1}) MERGE (:T)-[:R]->(:U)"),
+            ["merge-without-key", "merge-without-key"],
+        )
+
+    def test_unbounded_paths(self):
+        for pattern in ["[*]", "[:R*]", "[r:R*2..]", "[*..]"]:
+            self.assertEqual(
+                rules("MATCH (a:A {id: 1})-" + pattern + "->(b) RETURN b"),
+                ["unbounded-path"],
+            )
+        for pattern in ["[*3]", "[:R*..5]", "[r:R*2..4]"]:
+            self.assertEqual(
+                rules("MATCH (a:A {id: 1})-" + pattern + "->(b) RETURN b"), []
+            )
+
+    def test_keywords_inside_strings_and_expressions_ignored(self):
+        self.assertEqual(
+            rules('MATCH (n:A {t: "MATCH (m)"}) WHERE n.x STARTS WITH "a" RETURN n'),
+            [],
+        )
+
+
+class WrittenLabelsTestCase(unittest.TestCase):
+    def test_labels_of_created_and_merged_nodes(self):
+        self.assertEqual(
+            written_labels("MATCH (c:C) MERGE (:A:B)-[:R]->(c) CREATE (:`D E`)"),
+            set(["A", "B", "D E"]),
+        )
+        self.assertEqual(
+            written_labels('MATCH (n:A {t: "CREATE (:B)"}) SET n:C'), set()
+        )
+
+
+class LintDirectoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        files = {
+            "a.cql": 'MERGE (:S {code: "a"});\nMERGE (:S {code: "b"});',
+            "b.cql": '{"priority": 1}\n'
+            'MERGE (:S {code: "a"});\nMATCH (a:S), (b:T) MERGE (a)-->(b);',
+        }
+        for name, text in files.items():
+            with open(os.path.join(self.test_dir, name), "w") as f:
+                f.write(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_issues_reported_with_sources(self):
+        issues = [
+            (os.path.basename(i.source.ref), i.source.index, i.rule)
+            for i in lint_directory(self.test_dir)
+        ]
+        self.assertEqual(
+            sorted(issues),
+            [
+                ("a.cql", 0, "literal-values"),
+                ("b.cql", 0, "repeated-statement"),
+                ("b.cql", 1, "cartesian-product"),
+            ],
+        )
+
+    def test_rules_can_be_disabled(self):
+        issues = lint_directory(self.test_dir, rules=["cartesian-product"])
+        self.assertEqual([i.rule for i in issues], ["cartesian-product"])
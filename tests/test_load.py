@@ -6,17 +6,23 @@ from __future__ import print_function
 
 from functools import partial
 import shutil, tempfile
+import sys
 import os
+import threading
 from os import path
+import time
 import unittest
 import warnings
 
 import six
 
 import pandas as pd
+from neo4j.exceptions import CypherSyntaxError, TransientError
 
 from cymod.cybase import CypherQuery
-from cymod.load import GraphLoader, EmbeddedGraphLoader
+from cymod.load import GraphLoader, ServerGraphLoader, EmbeddedGraphLoader, prefetch
+from cymod.delta import SourceManifest, source_label
+from cymod.memgraph import MemoryDriver
 from cymod.customise import NodeLabels
 from cymod.tabproc import EnvrStateAliasTranslator
 
@@ -52,6 +58,201 @@ def write_query_set_3_to_file(fname):
         f.write(s)
 
 
+class RecordingResult(object):
+    """Stand-in for the result of running a Neo4j query.
+
+    Args:
+        records (list)
+        error (Exception, optional): Raised when the result is first used,
+            as by a lazily fetched result whose query failed.
+    """
+
+    def __init__(self, records, error=None):
+        self.records = records
+        self.error = error
+
+    def single(self):
+        self.consume()
+        return self.records[0] if self.records else None
+
+    def __iter__(self):
+        self.consume()
+        return iter(self.records)
+
+    def consume(self):
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+
+class RecordingTransaction(object):
+    """Stand-in for a Neo4j transaction which records what it's asked to do."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.driver.log.append("BEGIN")
+
+    def run(self, statement, params=None):
+        return self.driver.run(self, statement, params)
+
+    def commit(self):
+        self.driver.fetch(self)
+        self.driver.log.append("COMMIT")
+
+    def rollback(self):
+        self.pending = None
+        self.driver.log.append("ROLLBACK")
+
+
+class RecordingSession(object):
+    """Stand-in for a Neo4j session which records what it's asked to do."""
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, statement, params=None):
+        return self.driver.run(self, statement, params)
+
+    def begin_transaction(self):
+        self.driver.fetch(self)
+        return RecordingTransaction(self.driver)
+
+    def close(self):
+        self.driver.fetch(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RecordingDriver(object):
+    """Stand-in for a Neo4j driver which records what it's asked to do.
+
+    Args:
+        fail_on (str, optional): Statements containing this string fail.
+        failures (int, optional): Number of times statements containing 
+            `fail_on` fail before succeeding. If None they always fail.
+        error (type): Type of exception raised by failing statements.
+        respond (callable, optional): Given a statement and its parameters,
+            returns the list of records the statement should produce.
+        lazy (bool): If True, failures are raised when the result is used,
+            or, like the Neo4j driver, when the next statement is run or the
+            transaction or session ends.
+    """
+
+    def __init__(
+        self, fail_on=None, failures=None, error=RuntimeError, respond=None, lazy=False
+    ):
+        self.log = []
+        self.params = []
+        self.fail_on = fail_on
+        self.failures = failures
+        self.error = error
+        self.respond = respond
+        self.lazy = lazy
+
+    def run(self, runner, statement, params):
+        """Run a statement in a session or transaction."""
+        self.fetch(runner)
+        error = None
+        try:
+            self.check(statement)
+        except Exception as e:
+            if not self.lazy:
+                raise
+            error = e
+        self.log.append(statement)
+        runner.pending = self.result(statement, params, error)
+        return runner.pending
+
+    def fetch(self, runner):
+        """Fetch the unused result of the last statement a runner ran."""
+        pending = getattr(runner, "pending", None)
+        runner.pending = None
+        if pending is not None:
+            pending.consume()
+
+    def result(self, statement, params, error=None):
+        self.params.append(params)
+        if self.respond:
+            return RecordingResult(self.respond(statement, params), error)
+        return RecordingResult([], error)
+
+    def check(self, statement):
+        if self.fail_on and self.fail_on in statement:
+            if self.failures is None:
+                raise self.error("Query failed: " + statement)
+            if self.failures > 0:
+                self.failures -= 1
+                raise self.error("Query failed: " + statement)
+
+    def session(self):
+        return RecordingSession(self)
+
+    def close(self):
+        pass
+
+
+class PrefetchTestCase(unittest.TestCase):
+    def test_items_yielded_in_order(self):
+        """prefetch should yield every item from the iterable, in order."""
+        self.assertEqual(list(prefetch(iter(range(100)), 3)), list(range(100)))
+
+    def test_producer_exceptions_reraised(self):
+        """Exceptions raised while producing items reach the consumer."""
+
+        def failing():
+            yield 1
+            raise KeyError("missing parameter")
+
+        items = prefetch(failing(), 2)
+        self.assertEqual(six.next(items), 1)
+        with self.assertRaises(KeyError):
+            six.next(items)
+
+    def test_producer_is_bounded(self):
+        """The producer should not run more than maxsize items ahead."""
+        produced = []
+
+        def counting():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        items = prefetch(counting(), 5)
+        six.next(items)
+        time.sleep(0.2)
+        # 1 consumed, 5 buffered and at most 1 waiting to be buffered
+        self.assertLessEqual(len(produced), 7)
+        items.close()
+
+    def test_producer_stopped_when_closed(self):
+        """Closing the generator should wait for the producer to stop."""
+        before = threading.active_count()
+        items = prefetch(iter(range(100)), 2)
+        six.next(items)
+        self.assertEqual(threading.active_count(), before + 1)
+        items.close()
+        self.assertEqual(threading.active_count(), before)
+
+    def test_producer_stopped_when_load_fails(self):
+        """A failed load shouldn't leave the producer running."""
+        test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_dir)
+        for i in range(5):
+            with open(path.join(test_dir, "{0}.cql".format(i)), "w") as f:
+                f.write("MERGE (n:TestNode {{id: {0}}});".format(i))
+        before = threading.active_count()
+        for workers in [1, 2]:
+            gl = ServerGraphLoader.from_driver(RecordingDriver(fail_on="id: 1"))
+            gl.load_cypher(test_dir)
+            with self.assertRaises(RuntimeError):
+                gl.commit(tx_scope="file", workers=workers, prefetch_size=1)
+            self.assertEqual(threading.active_count(), before)
+
+
 class GraphLoaderTestCase(unittest.TestCase):
     def setUp(self):
         # Create a temporary directory
@@ -264,6 +465,492 @@ class GraphLoaderTestCase(unittest.TestCase):
             self.fail("Could not use state_alias_translator in load_tabular.")
 
 
+class ServerGraphLoaderTestCase(unittest.TestCase):
+    def setUp(self):
+        # Create a temporary directory
+        self.test_dir = tempfile.mkdtemp()
+
+        dir1 = path.join(self.test_dir, "dir1")
+        os.makedirs(dir1)
+        write_query_set_1_to_file(path.join(dir1, "file1.cql"))
+        write_query_set_2_to_file(path.join(dir1, "file2.cql"))
+
+        dir2 = path.join(self.test_dir, "dir2")
+        os.makedirs(dir2)
+        write_query_set_1_to_file(path.join(dir2, "file3.cql"))
+
+    def tearDown(self):
+        # Remove the temp directory after the test
+        shutil.rmtree(self.test_dir)
+
+    def get_loader(self, driver):
+        gl = ServerGraphLoader.from_driver(driver)
+        gl.load_cypher(path.join(self.test_dir, "dir1"))
+        gl.load_cypher(path.join(self.test_dir, "dir2"))
+        return gl
+
+    def test_commit_per_query_uses_no_explicit_transactions(self):
+        """Default transaction scope should run each query on its own."""
+        driver = RecordingDriver()
+        self.get_loader(driver).commit()
+        self.assertEqual(
+            driver.log,
+            [
+                'MERGE (n:TestNode {test_str: "test value"});',
+                "MERGE (n:TestNode {test_int: 2});",
+                "MERGE (n:TestNode {test_bool: true});",
+                "MERGE (n:TestNode {test_bool: true});",
+            ],
+        )
+
+    def test_commit_per_file(self):
+        """File transaction scope should wrap each file in a transaction."""
+        driver = RecordingDriver()
+        self.get_loader(driver).commit(tx_scope="file")
+        self.assertEqual(driver.log.count("BEGIN"), 3)
+        self.assertEqual(driver.log.count("COMMIT"), 3)
+        self.assertEqual(driver.log[:4], ["BEGIN"] + driver.log[1:3] + ["COMMIT"])
+
+    def test_commit_per_priority_level(self):
+        """Priority scope should use a transaction per level in each job."""
+        gl = GraphLoader()
+        gl.load_cypher(path.join(self.test_dir, "dir1"))
+        gl.load_cypher(path.join(self.test_dir, "dir2"))
+        batches = list(gl.iterbatches(tx_scope="priority"))
+        self.assertEqual([len(b) for b in batches], [2, 1, 1])
+        self.assertEqual([b.level for b in batches], [(0, 0), (0, 1), (1, 1)])
+
+    def test_commit_whole_load(self):
+        """Load transaction scope should use a single transaction."""
+        driver = RecordingDriver()
+        self.get_loader(driver).commit(tx_scope="load")
+        self.assertEqual(driver.log[0], "BEGIN")
+        self.assertEqual(driver.log[-1], "COMMIT")
+        self.assertEqual(len(driver.log), 6)
+
+    def test_failed_file_is_rolled_back(self):
+        """A failure part way through a file should roll back the file."""
+        driver = RecordingDriver(fail_on="test_int")
+        with self.assertRaises(RuntimeError):
+            self.get_loader(driver).commit(tx_scope="file")
+        self.assertEqual(
+            driver.log,
+            ["BEGIN", 'MERGE (n:TestNode {test_str: "test value"});', "ROLLBACK"],
+        )
+
+    def test_parallel_commit_loads_all_queries(self):
+        """Parallel commit should load every query, respecting priorities."""
+        driver = RecordingDriver()
+        self.get_loader(driver).commit(tx_scope="file", workers=3)
+        statements = [q for q in driver.log if q not in ["BEGIN", "COMMIT"]]
+        self.assertEqual(len(statements), 4)
+        # Both priority 0 queries must come before any priority 1 query
+        self.assertEqual(
+            set(statements[:2]),
+            set(
+                [
+                    'MERGE (n:TestNode {test_str: "test value"});',
+                    "MERGE (n:TestNode {test_int: 2});",
+                ]
+            ),
+        )
+
+    def test_pipelined_commit_matches_serial_commit(self):
+        """Prefetching queries shouldn't change what's sent to the database."""
+        serial_driver = RecordingDriver()
+        self.get_loader(serial_driver).commit(tx_scope="file")
+        pipelined_driver = RecordingDriver()
+        self.get_loader(pipelined_driver).commit(tx_scope="file", prefetch_size=2)
+        self.assertEqual(serial_driver.log, pipelined_driver.log)
+
+    def test_checkpointed_load_can_be_resumed(self):
+        """Batches committed before a failure are skipped when resuming."""
+        checkpoint = path.join(self.test_dir, "load.ckpt")
+        driver = RecordingDriver(fail_on="test_bool")
+        with self.assertRaises(RuntimeError):
+            self.get_loader(driver).commit(
+                tx_scope="file", checkpoint_file=checkpoint
+            )
+
+        driver = RecordingDriver()
+        self.get_loader(driver).commit(
+            tx_scope="file", checkpoint_file=checkpoint, resume=True
+        )
+        # The priority 0 file was committed first time round
+        self.assertEqual(
+            driver.log,
+            [
+                "BEGIN",
+                "MERGE (n:TestNode {test_bool: true});",
+                "COMMIT",
+                "BEGIN",
+                "MERGE (n:TestNode {test_bool: true});",
+                "COMMIT",
+            ],
+        )
+
+    def test_lazy_errors_reported_against_failing_query(self):
+        """Errors fetched lazily should be raised by the query causing them."""
+        for fail_on in ["test_int", "test_bool"]:
+            driver = RecordingDriver(
+                fail_on=fail_on, error=CypherSyntaxError, lazy=True
+            )
+            stdout = sys.stdout
+            sys.stdout = six.StringIO()
+            try:
+                with self.assertRaises(CypherSyntaxError):
+                    self.get_loader(driver).commit()
+                output = sys.stdout.getvalue()
+            finally:
+                sys.stdout = stdout
+            self.assertIn("Offending cypher query", output)
+            self.assertIn(fail_on, output)
+            # The failing query is the last one sent
+            self.assertIn(fail_on, driver.log[-1])
+
+    def test_lazily_failed_query_not_checkpointed(self):
+        """A query whose failure surfaces lazily is loaded when resuming."""
+        checkpoint = path.join(self.test_dir, "load.ckpt")
+        driver = RecordingDriver(fail_on="test_int", lazy=True)
+        with self.assertRaises(RuntimeError):
+            self.get_loader(driver).commit(checkpoint_file=checkpoint)
+
+        driver = RecordingDriver(lazy=True)
+        self.get_loader(driver).commit(checkpoint_file=checkpoint, resume=True)
+        self.assertEqual(
+            driver.log,
+            [
+                "MERGE (n:TestNode {test_int: 2});",
+                "MERGE (n:TestNode {test_bool: true});",
+                "MERGE (n:TestNode {test_bool: true});",
+            ],
+        )
+
+    def test_lazy_transient_error_retries_failing_query(self):
+        """The query hitting a lazily raised transient error is retried."""
+        driver = RecordingDriver(
+            fail_on="test_int", failures=1, error=TransientError, lazy=True
+        )
+        self.get_loader(driver).commit(max_retries=1, retry_delay=0.01)
+        self.assertEqual(
+            driver.log[:3],
+            [
+                'MERGE (n:TestNode {test_str: "test value"});',
+                "MERGE (n:TestNode {test_int: 2});",
+                "MERGE (n:TestNode {test_int: 2});",
+            ],
+        )
+
+    def test_resume_requires_checkpoint_file(self):
+        with self.assertRaises(ValueError):
+            self.get_loader(RecordingDriver()).commit(resume=True)
+
+    def test_transient_errors_are_retried(self):
+        """Batches failing with transient errors should be retried."""
+        driver = RecordingDriver(fail_on="test_int", failures=2, error=TransientError)
+        loader = self.get_loader(driver)
+        loader.commit(tx_scope="file", max_retries=2, retry_delay=0.01)
+        self.assertEqual(driver.log.count("ROLLBACK"), 2)
+        self.assertEqual(driver.log.count("COMMIT"), 3)
+        self.assertEqual(loader.metrics.counters["retries_total"], 2)
+        self.assertEqual(loader.metrics.counters["batches_committed_total"], 3)
+
+    def test_retries_are_limited(self):
+        """Transient errors should be raised once retries are exhausted."""
+        driver = RecordingDriver(fail_on="test_int", failures=2, error=TransientError)
+        with self.assertRaises(TransientError):
+            self.get_loader(driver).commit(max_retries=1, retry_delay=0.01)
+
+    def test_refresh_graph_deletes_in_batches(self):
+        """refresh_graph should delete until a batch isn't full."""
+        remaining = [250]
+
+        def respond(statement, params):
+            deleted = min(remaining[0], params["batch_size"])
+            remaining[0] -= deleted
+            return [{"deleted": deleted}]
+
+        driver = RecordingDriver(respond=respond)
+        gl = ServerGraphLoader.from_driver(driver)
+        deleted = gl.refresh_graph({"model_ID": 3}, batch_size=100)
+        self.assertEqual(deleted, 250)
+        self.assertEqual(driver.log.count("COMMIT"), 3)
+        self.assertEqual(
+            driver.log[1],
+            "MATCH (n) WHERE n.`model_ID` = $p0 WITH n LIMIT $batch_size "
+            "DETACH DELETE n RETURN count(*) AS deleted",
+        )
+        # Values are passed as parameters, keeping their type
+        self.assertEqual(driver.params[0], {"p0": 3, "batch_size": 100})
+
+    def test_refresh_graph_restricted_to_labels(self):
+        """Each label given to refresh_graph should be refreshed in turn."""
+        driver = RecordingDriver(respond=lambda s, p: [{"deleted": 0}])
+        gl = ServerGraphLoader.from_driver(driver)
+        gl.refresh_graph({"project": "p", "model_ID": "m"}, labels=["State", "Cond"])
+        statements = [q for q in driver.log if q.startswith("MATCH")]
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(
+            statements[0].startswith(
+                "MATCH (n:`State`) WHERE n.`model_ID` = $p0 AND n.`project` = $p1"
+            )
+        )
+        self.assertTrue(statements[1].startswith("MATCH (n:`Cond`)"))
+
+    def test_refresh_graph_requires_params(self):
+        """Refreshing with no parameters would delete the whole graph."""
+        gl = ServerGraphLoader.from_driver(RecordingDriver())
+        with self.assertRaises(ValueError):
+            gl.refresh_graph({})
+
+    def test_ensure_indexes_before_commit(self):
+        """Indexes should be created and awaited before the first query."""
+        driver = RecordingDriver()
+        gl = ServerGraphLoader.from_driver(driver)
+        gl.load_tabular(
+            pd.DataFrame({"start": ["a"], "end": ["b"], "cond": ["low"]}),
+            "start",
+            "end",
+            global_params={"model_ID": 1},
+        )
+        gl.commit(ensure_indexes=True)
+        self.assertEqual(
+            driver.log[:4],
+            [
+                "CREATE INDEX `cymod_State_code_model_ID` IF NOT EXISTS "
+                "FOR (n:`State`) ON (n.`code`, n.`model_ID`)",
+                "CREATE INDEX `cymod_Transition_model_ID` IF NOT EXISTS "
+                "FOR (n:`Transition`) ON (n.`model_ID`)",
+                "CREATE INDEX `cymod_Condition_model_ID` IF NOT EXISTS "
+                "FOR (n:`Condition`) ON (n.`model_ID`)",
+                "CALL db.awaitIndexes($timeout)",
+            ],
+        )
+        self.assertEqual(len(driver.log), 5)
+
+    def test_schema_statements_run_first(self):
+        """Schema statements from all files run before any data statements."""
+        with open(path.join(self.test_dir, "dir2", "schema.cql"), "w") as f:
+            f.write(
+                '{ "priority": 2 }\n'
+                + "CREATE INDEX idx FOR (n:TestNode) ON (n.test_str);\n"
+                + 'MERGE (n:TestNode {test_str: "other value"});'
+            )
+
+        driver = RecordingDriver()
+        self.get_loader(driver).commit()
+        self.assertEqual(
+            driver.log[:2],
+            [
+                "CREATE INDEX idx FOR (n:TestNode) ON (n.test_str);",
+                "CALL db.awaitIndexes($timeout)",
+            ],
+        )
+        self.assertEqual(len(driver.log), 7)
+        self.assertEqual(
+            driver.log[-1], 'MERGE (n:TestNode {test_str: "other value"});'
+        )
+
+    def test_files_parsed_as_they_are_reached(self):
+        """Only files with schema statements are parsed ahead of the data."""
+        with open(path.join(self.test_dir, "dir2", "schema.cql"), "w") as f:
+            f.write("CREATE INDEX idx FOR (n:TestNode) ON (n.test_str);")
+
+        gl = self.get_loader(RecordingDriver())
+        query_iter = gl.iterqueries()
+        next(query_iter)
+        self.assertEqual(gl.metrics.counters["cypher_files_parsed_total"], 1)
+        next(query_iter)
+        self.assertEqual(gl.metrics.counters["cypher_files_parsed_total"], 2)
+        list(query_iter)
+        self.assertEqual(gl.metrics.counters["cypher_files_parsed_total"], 4)
+
+    def test_schema_statements_separate_from_data_in_load_scope(self):
+        """Schema and data statements can't share a transaction."""
+        with open(path.join(self.test_dir, "dir2", "schema.cql"), "w") as f:
+            f.write("CREATE INDEX idx FOR (n:TestNode) ON (n.test_str);")
+
+        driver = RecordingDriver()
+        self.get_loader(driver).commit(tx_scope="load")
+        self.assertEqual(
+            driver.log[:4],
+            [
+                "BEGIN",
+                "CREATE INDEX idx FOR (n:TestNode) ON (n.test_str);",
+                "COMMIT",
+                "CALL db.awaitIndexes($timeout)",
+            ],
+        )
+
+    def test_delta_commit_applies_only_changed_files(self):
+        """Only new or changed files should be applied by commit_delta."""
+        manifest = path.join(self.test_dir, "manifest.json")
+        model = {"model_ID": "m"}
+
+        driver = RecordingDriver()
+        summary = self.get_loader(driver).commit_delta(model, manifest)
+        self.assertEqual(len(summary["applied"]), 3)
+        self.assertEqual(driver.log.count("COMMIT"), 3)
+
+        driver = RecordingDriver()
+        summary = self.get_loader(driver).commit_delta(model, manifest)
+        self.assertEqual(summary, {"applied": [], "removed": [], "unchanged": 3})
+        self.assertEqual(len(driver.log), 0)
+
+        changed_file = path.join(self.test_dir, "dir2", "file3.cql")
+        write_query_set_2_to_file(changed_file)
+        driver = RecordingDriver()
+        summary = self.get_loader(driver).commit_delta(model, manifest)
+        self.assertEqual(summary["applied"], [changed_file])
+        # The file's old data is detached from it and deleted, then the new
+        # version applied with its data attributed to it
+        label = source_label(model, changed_file)
+        statements = [q for q in driver.log if q not in ["BEGIN", "COMMIT"]]
+        self.assertTrue(statements[0].startswith("MATCH (n:`" + label + "`)-[r]-()"))
+        self.assertTrue(statements[1].startswith("MATCH (n:`" + label + "`) WITH n"))
+        self.assertEqual(
+            statements[2:4],
+            [
+                'MERGE (n:TestNode {test_str: "test value"}) SET n:`' + label + "`;",
+                "MERGE (n:TestNode {test_int: 2}) SET n:`" + label + "`;",
+            ],
+        )
+        self.assertIn("CymodTouched", statements[4])
+        self.assertIn("CymodModified", statements[5])
+
+    def test_delta_commit_reapplies_dependents(self):
+        """Sources linked to a changed source should be re-applied."""
+        manifest = path.join(self.test_dir, "manifest.json")
+        model = {"model_ID": "m"}
+        unchanged_file = path.join(self.test_dir, "dir1", "file1.cql")
+        changed_file = path.join(self.test_dir, "dir2", "file3.cql")
+
+        def respond(statement, params):
+            # Every source touches a node belonging to changed_file
+            if "CymodTouched" in statement:
+                return [{"label": source_label(model, changed_file)}]
+            return []
+
+        self.get_loader(RecordingDriver(respond=respond)).commit_delta(
+            model, manifest
+        )
+        links = SourceManifest(manifest).links(model)
+        self.assertEqual(links[unchanged_file]["touches"], [changed_file])
+        self.assertEqual(links[changed_file]["touches"], [])
+
+        write_query_set_2_to_file(changed_file)
+        summary = self.get_loader(RecordingDriver()).commit_delta(model, manifest)
+        self.assertEqual(len(summary["applied"]), 3)
+        self.assertEqual(summary["applied"][-1], changed_file)
+
+    def test_delta_commit_rejects_unattributable_statements(self):
+        """Statements whose effects can't be attributed are rejected before
+        anything is deleted."""
+        manifest = path.join(self.test_dir, "manifest.json")
+        with open(path.join(self.test_dir, "dir2", "file4.cql"), "w") as f:
+            f.write("MATCH (n:TestNode) DETACH DELETE n;")
+        driver = RecordingDriver()
+        with self.assertRaises(ValueError):
+            self.get_loader(driver).commit_delta({"model_ID": "m"}, manifest)
+        self.assertEqual(driver.log, [])
+
+    def test_blue_green_commit_loads_new_version_then_swaps(self):
+        """The new version should be loaded, activated, then the old removed."""
+
+        def respond(statement, params):
+            if "RETURN old" in statement:
+                return [{"old": "m@old"}]
+            return [{"deleted": 0}]
+
+        driver = RecordingDriver(respond=respond)
+        gl = ServerGraphLoader.from_driver(driver)
+        gl.load_cypher(self.test_dir, global_params={"model_ID": "m"})
+        gl.load_tabular(
+            pd.DataFrame({"start": ["a"], "end": ["b"], "cond": ["low"]}),
+            "start",
+            "end",
+            global_params={"model_ID": "m"},
+        )
+        version, gc_thread = gl.commit_blue_green(
+            {"model_ID": "m"}, background_gc=False, tx_scope="file"
+        )
+        self.assertIsNone(gc_thread)
+        self.assertTrue(version.startswith("m@"))
+
+        tabular_statement = [q for q in driver.log if "State" in q][0]
+        self.assertIn('model_ID:"' + version + '"', tabular_statement)
+
+        swap_index = [i for i, q in enumerate(driver.log) if "RETURN old" in q][0]
+        self.assertEqual(
+            driver.log[swap_index],
+            "MERGE (p:`CymodActiveModel` {`model_ID`: $p0}) WITH p, p.version "
+            "AS old SET p.version = $version RETURN old",
+        )
+        self.assertIn({"p0": "m", "version": version}, driver.params)
+        # The old version is deleted after the swap
+        self.assertEqual(driver.params[-1], {"p0": "m@old", "batch_size": 10000})
+        # Original global params are restored afterwards
+        self.assertEqual(gl._load_job_queue[1].global_params, {"model_ID": "m"})
+
+    def test_blue_green_commit_failure_keeps_old_version(self):
+        """A failed load leaves the pointer alone and removes its data."""
+        model_dir = path.join(self.test_dir, "model")
+        os.makedirs(model_dir)
+        with open(path.join(model_dir, "nodes.cql"), "w") as f:
+            f.write("MERGE (:TestNode {model_ID: $model_ID, n: 1});")
+        driver = MemoryDriver()
+        gl = ServerGraphLoader.from_driver(driver)
+        gl.load_cypher(model_dir, global_params={"model_ID": "m"})
+        old_version, _ = gl.commit_blue_green({"model_ID": "m"}, background_gc=False)
+
+        with open(path.join(model_dir, "fails.cql"), "w") as f:
+            f.write('{"priority": 1}\nMERGE (:TestNode {n: unsupported(1)});')
+        gl = ServerGraphLoader.from_driver(driver)
+        gl.load_cypher(model_dir, global_params={"model_ID": "m"})
+        with self.assertRaises(ValueError):
+            gl.commit_blue_green({"model_ID": "m"}, background_gc=False)
+
+        self.assertEqual(gl.active_version({"model_ID": "m"}), old_version)
+        nodes = driver.graph.find_nodes(["TestNode"], {})
+        self.assertEqual([n["model_ID"] for n in nodes], [old_version])
+
+    def test_blue_green_commit_needs_versioned_jobs(self):
+        """Every job needs the version parameter to be loaded as a version."""
+        with self.assertRaises(ValueError):
+            self.get_loader(RecordingDriver()).commit_blue_green({"model_ID": "m"})
+
+    def test_parallel_commit_rejects_wide_tx_scope(self):
+        """Only query and file scopes make sense with several workers."""
+        with self.assertRaises(ValueError):
+            self.get_loader(RecordingDriver()).commit(
+                tx_scope="priority", workers=2
+            )
+
+    def test_invalid_tx_scope_raises_error(self):
+        """An unknown transaction scope should raise a ValueError."""
+        with self.assertRaises(ValueError):
+            self.get_loader(RecordingDriver()).commit(tx_scope="table")
+
+    def test_load_csv_table_committed_as_single_query(self):
+        """Tables loaded via LOAD CSV need one round trip, outside a tx."""
+        df = pd.DataFrame({"start": ["a", "b"], "end": ["b", "c"], "cond": [1, 2]})
+        driver = RecordingDriver()
+        gl = ServerGraphLoader.from_driver(driver)
+        gl.load_tabular(df, "start", "end", import_dir=self.test_dir)
+        gl.commit()
+        self.assertEqual(len(driver.log), 1)
+        self.assertTrue(driver.log[0].startswith("LOAD CSV WITH HEADERS"))
+        with self.assertRaises(ValueError):
+            gl.commit(tx_scope="file")
+        manifest = path.join(self.test_dir, "manifest.json")
+        with self.assertRaises(ValueError):
+            gl.commit_delta({"model_ID": "m"}, manifest)
+        with self.assertRaises(ValueError):
+            gl.profile()
+        self.assertEqual(len(driver.log), 1)
+        self.assertFalse(path.exists(manifest))
+
+
 class EmbeddedGraphLoaderTestCase(unittest.TestCase):
     def setUp(self):
         # Create a temporary directory
@@ -286,3 +973,90 @@ class EmbeddedGraphLoaderTestCase(unittest.TestCase):
 
         with self.assertRaises(StopIteration):
             six.next(query_strings)
+
+    def test_string_parameters_quoted(self):
+        """String parameters should become quoted Cypher strings."""
+        fname = path.join(self.test_dir, "file1.cql")
+        write_query_set_3_to_file(fname)
+
+        egl = EmbeddedGraphLoader()
+        egl.load_cypher(self.test_dir, global_params={"paramval": 'a "b"'})
+
+        self.assertEqual(
+            list(egl.query_generator()),
+            ['MERGE (n:TestNode {test_param: "a \\"b\\""});'],
+        )
+
+    def test_queries_fetched_in_chunks(self):
+        write_query_set_2_to_file(path.join(self.test_dir, "file1.cql"))
+        write_query_set_3_to_file(path.join(self.test_dir, "file2.cql"))
+
+        egl = EmbeddedGraphLoader()
+        egl.load_cypher(self.test_dir, global_params={"paramval": 3})
+
+        chunks = list(egl.query_chunks(chunk_size=2))
+        self.assertEqual([len(c) for c in chunks], [2, 1])
+        self.assertEqual(sum(chunks, []), list(egl.query_generator()))
+
+    def test_script_written_in_transactions(self):
+        write_query_set_2_to_file(path.join(self.test_dir, "file1.cql"))
+        with open(path.join(self.test_dir, "schema.cql"), "w") as f:
+            f.write("CREATE INDEX idx FOR (n:TestNode) ON (n.test_int);")
+
+        egl = EmbeddedGraphLoader()
+        egl.load_cypher(self.test_dir)
+        # Written outside the directory being loaded, so the script can't be
+        # picked up as a source
+        out_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, out_dir)
+        fname = path.join(out_dir, "script.cypher")
+        self.assertEqual(egl.write_script(fname, tx_size=1), 3)
+
+        with open(fname) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(
+            lines,
+            [
+                ":begin",
+                "CREATE INDEX idx FOR (n:TestNode) ON (n.test_int);",
+                ":commit",
+                ":begin",
+                'MERGE (n:TestNode {test_str: "test value"});',
+                ":commit",
+                ":begin",
+                "MERGE (n:TestNode {test_int: 2});",
+                ":commit",
+            ],
+        )
+
+    def test_load_csv_written_outside_transactions(self):
+        """CALL { ... } IN TRANSACTIONS can't run in an explicit transaction."""
+        write_query_set_2_to_file(path.join(self.test_dir, "file1.cql"))
+        egl = EmbeddedGraphLoader()
+        egl.load_cypher(self.test_dir)
+        egl.load_tabular(
+            pd.DataFrame({"start": ["a"], "end": ["b"], "cond": [1]}),
+            "start",
+            "end",
+            import_dir=self.test_dir,
+        )
+        out_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, out_dir)
+        fname = path.join(out_dir, "script.cypher")
+        self.assertEqual(egl.write_script(fname), 3)
+
+        with open(fname) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[:4], [":begin"] + lines[1:3] + [":commit"])
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[4].startswith("LOAD CSV WITH HEADERS"))
+        self.assertTrue(lines[4].endswith("IN TRANSACTIONS OF 10000 ROWS;"))
+
+    def test_statements_compiled_once(self):
+        egl = EmbeddedGraphLoader()
+        q1 = CypherQuery("RETURN $a;", params={"a": 1})
+        q2 = CypherQuery("RETURN $a;", params={"a": 2})
+        self.assertEqual(egl._query_to_concrete_str(q1), "RETURN 1;")
+        template = egl._templates["RETURN $a;"]
+        self.assertEqual(egl._query_to_concrete_str(q2), "RETURN 2;")
+        self.assertIs(egl._templates["RETURN $a;"], template)
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.memgraph
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import pandas as pd
+from neo4j.exceptions import CypherSyntaxError
+
+from cymod.load import ServerGraphLoader
+from cymod.memgraph import MemoryDriver, MemoryGraph
+from cymod.transtable import EnvironTransitionSet
+
+
+class MemoryGraphTestCase(unittest.TestCase):
+    def setUp(self):
+        self.driver = MemoryDriver()
+        self.session = self.driver.session()
+
+    def run_query(self, statement, **params):
+        return self.session.run(statement, params)
+
+    def test_merge_only_creates_missing_entities(self):
+        for _ in range(2):
+            self.run_query(
+                'MERGE (a:State {code:"a"}) MERGE (b:State {code:"b"}) '
+                "MERGE (a)<-[:SOURCE]-(t:Transition)-[:TARGET]->(b);"
+            )
+        self.assertEqual(
+            self.driver.graph.summary(),
+            {
+                "nodes": {"State": 2, "Transition": 1},
+                "relationships": {"SOURCE": 1, "TARGET": 1},
+            },
+        )
+
+    def test_match_where_and_return(self):
+        self.run_query(
+            "UNWIND $values AS v CREATE (:N {v: v, even: v % 2 = 0})",
+            values=[1, 2, 3, 4],
+        )
+        result = self.run_query(
+            "MATCH (n:N) WHERE n.even AND n.v IN $allowed "
+            "RETURN n.v AS v ORDER BY v DESC",
+            allowed=[1, 2, 4],
+        )
+        self.assertEqual(result.data(), [{"v": 4}, {"v": 2}])
+        record = self.run_query(
+            "MATCH (n:N) RETURN count(*) AS c, collect(n.v)"
+        ).single()
+        self.assertEqual(record["c"], 4)
+        self.assertEqual(sorted(record[1]), [1, 2, 3, 4])
+
+    def test_booleans_and_numbers_distinguished(self):
+        self.run_query("CREATE (:N {v: 1}), (:N {v: true})")
+        self.assertEqual(
+            self.run_query("MATCH (n:N {v: 1}) RETURN count(*) AS c").single()["c"], 1
+        )
+
+    def test_batched_detach_delete(self):
+        self.run_query(
+            "UNWIND $items AS i CREATE (:N {m: 1})-[:R]->(:M {m: 1})",
+            items=[1, 2, 3],
+        )
+        statement = (
+            "MATCH (n) WHERE n.`m` = $p0 WITH n LIMIT $batch_size "
+            "DETACH DELETE n RETURN count(*) AS deleted"
+        )
+        deleted = [
+            self.run_query(statement, p0=1, batch_size=4).single()["deleted"]
+            for _ in range(3)
+        ]
+        self.assertEqual(deleted, [4, 2, 0])
+        self.assertEqual(self.driver.graph.relationship_count(), 0)
+
+    def test_delete_connected_node_fails_atomically(self):
+        self.run_query("CREATE (:N)-[:R]->(:M)")
+        with self.assertRaises(ValueError):
+            self.run_query("MATCH (n) SET n.x = 1 DELETE n")
+        self.assertEqual(
+            self.run_query("MATCH (n) WHERE n.x = 1 RETURN n").data(), []
+        )
+
+    def test_transaction_rollback_undoes_changes(self):
+        self.run_query("CREATE (:N {v: 1})")
+        tx = self.session.begin_transaction()
+        tx.run("MATCH (n:N) SET n.v = 2")
+        tx.run("CREATE (:N {v: 3})")
+        tx.rollback()
+        self.assertEqual(
+            self.run_query("MATCH (n:N) RETURN n.v AS v").data(), [{"v": 1}]
+        )
+        # Indexes should be restored too
+        self.assertEqual(len(self.driver.graph.find_nodes(["N"], {"v": 1})), 1)
+        self.assertEqual(self.driver.graph.find_nodes(["N"], {"v": 2}), [])
+
+    def test_transaction_can_end_on_another_thread(self):
+        tx = self.session.begin_transaction()
+        tx.run("CREATE (:N {v: 1})")
+        thread = threading.Thread(target=tx.commit)
+        thread.start()
+        thread.join()
+        self.assertEqual(
+            self.run_query("MATCH (n:N) RETURN n.v AS v").data(), [{"v": 1}]
+        )
+
+    def test_unsupported_syntax_raises_syntax_error(self):
+        with self.assertRaises(CypherSyntaxError):
+            self.run_query("MATCH p = (a)-[*]->(b) RETURN p")
+
+    def test_duplicates_found(self):
+        self.run_query("CREATE (:A {x: 1}), (:A {x: 1}), (:A {x: 2})")
+        duplicates = self.driver.graph.duplicate_nodes()
+        self.assertEqual([len(group) for group in duplicates], [2])
+
+
+class MemoryGraphLoadTestCase(unittest.TestCase):
+    """Models loaded by the loaders should produce the expected graphs."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def load_table(self, fresh_load):
+        df = pd.DataFrame(
+            {
+                "start": ["a", "a", "b", "b"],
+                "end": ["b", "b", "a", "b"],
+                "cond": ["low", "high", "low", "low"],
+            }
+        )
+        driver = MemoryDriver()
+        loader = ServerGraphLoader.from_driver(driver)
+        for _ in range(2):
+            loader.load_tabular(
+                df, "start", "end", global_params={"id": 1}, fresh_load=fresh_load
+            )
+        loader.commit()
+        return driver.graph
+
+    def test_fresh_load_matches_merge_load(self):
+        merged = self.load_table(fresh_load=False)
+        fresh = self.load_table(fresh_load=True)
+        self.assertEqual(fresh.summary(), merged.summary())
+        self.assertEqual(
+            merged.summary(),
+            {
+                "nodes": {"State": 2, "Transition": 3, "Condition": 4},
+                "relationships": {"SOURCE": 3, "TARGET": 3, "CAUSES": 4},
+            },
+        )
+        self.assertEqual(fresh.duplicate_nodes(), [])
+
+    def test_fresh_load_alongside_cypher_files(self):
+        """Cypher files may create other nodes, but not the table's."""
+        with open(os.path.join(self.test_dir, "model.cql"), "w") as f:
+            f.write('MERGE (:Model {id: 1, name: "State (:State)"});')
+        graphs = []
+        for fresh_load in [False, True]:
+            driver = MemoryDriver()
+            loader = ServerGraphLoader.from_driver(driver)
+            loader.load_cypher(self.test_dir)
+            loader.load_tabular(
+                pd.DataFrame({"start": ["a"], "end": ["b"], "cond": [1]}),
+                "start",
+                "end",
+                fresh_load=fresh_load,
+            )
+            loader.commit()
+            graphs.append(driver.graph.summary())
+        self.assertEqual(graphs[0], graphs[1])
+
+        with open(os.path.join(self.test_dir, "states.cql"), "w") as f:
+            f.write('MERGE (:State {code: "a"});')
+        driver = MemoryDriver()
+        loader = ServerGraphLoader.from_driver(driver)
+        loader.load_cypher(self.test_dir)
+        loader.load_tabular(
+            pd.DataFrame({"start": ["a"], "end": ["b"], "cond": [1]}),
+            "start",
+            "end",
+            fresh_load=True,
+        )
+        with self.assertRaises(ValueError):
+            loader.commit()
+        self.assertEqual(driver.graph.node_count(), 0)
+
+    def test_fresh_transition_set_files_match_merged_files(self):
+        df = pd.DataFrame(
+            {
+                "start": ["a", "a", "b", "b", "a"],
+                "end": ["b", "b", "a", "a", "a"],
+                "delta_t": [1, 2, 1, 1, 3],
+                "water": ["xeric", "hydric", "xeric", "xeric", "hydric"],
+            }
+        )
+        graphs = []
+        for fresh_load in [False, True]:
+            project = os.path.join(self.test_dir, str(fresh_load))
+            with open(os.path.join(self.test_dir, "types.cql"), "w") as f:
+                f.write(
+                    'MERGE (:LandCoverType {code:"a", model_ID:$model_ID});\n'
+                    'MERGE (:LandCoverType {code:"b", model_ID:$model_ID});'
+                )
+            EnvironTransitionSet(df, "start", "end", "delta_t").write_cypher_files(
+                project, fresh_load=fresh_load
+            )
+            driver = MemoryDriver()
+            loader = ServerGraphLoader.from_driver(driver)
+            loader.load_cypher(self.test_dir, global_params={"model_ID": 1})
+            loader.commit(tx_scope="file")
+            shutil.rmtree(project)
+            graphs.append(driver.graph)
+        self.assertEqual(graphs[1].summary(), graphs[0].summary())
+        self.assertEqual(graphs[1].duplicate_nodes(), [])
+        self.assertEqual(graphs[1].duplicate_relationships(), [])
+
+    def test_transition_set_files_load(self):
+        abstract = os.path.join(self.test_dir, "abstract")
+        os.makedirs(abstract)
+        with open(os.path.join(abstract, "LandCoverType_w.cql"), "w") as f:
+            f.write(
+                '{"priority": 0}\n'
+                'MERGE (:LandCoverType {code:"a", model_ID:$model_ID});\n'
+                'MERGE (:LandCoverType {code:"b", model_ID:$model_ID});'
+            )
+        df = pd.DataFrame(
+            {
+                "start": ["a", "a", "b"],
+                "end": ["b", "b", "a"],
+                "delta_t": [1, 2, 1],
+                "water": ["xeric", "hydric", "xeric"],
+            }
+        )
+        EnvironTransitionSet(df, "start", "end", "delta_t").write_cypher_files(
+            self.test_dir, fresh_load=True
+        )
+
+        driver = MemoryDriver(MemoryGraph())
+        loader = ServerGraphLoader.from_driver(driver)
+        loader.load_cypher(self.test_dir, global_params={"model_ID": 1})
+        loader.commit(tx_scope="file")
+
+        self.assertEqual(
+            driver.graph.summary(),
+            {
+                "nodes": {
+                    "LandCoverType": 2,
+                    "SuccessionTrajectory": 2,
+                    "EnvironCondition": 2,
+                },
+                "relationships": {"SOURCE": 2, "TARGET": 2, "CAUSES": 3},
+            },
+        )
+
+    def test_refresh_graph_removes_model(self):
+        graph = self.load_table(fresh_load=False)
+        loader = ServerGraphLoader.from_driver(MemoryDriver(graph))
+        self.assertEqual(loader.refresh_graph({"id": 1}, batch_size=2), 9)
+        self.assertEqual(graph.node_count(), 0)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.metrics
+"""
+from __future__ import print_function
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from cymod.load import ServerGraphLoader
+from cymod.memgraph import MemoryDriver, MemorySession
+from cymod.metrics import Histogram, Metrics
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_values_counted_in_buckets(self):
+        histogram = Histogram(buckets=[1, 2, 5])
+        for value in [0.5, 1, 1.5, 4, 10]:
+            histogram.observe(value)
+        # A value equal to a bound is counted in that bound's bucket
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual(histogram.sum, 17)
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(1), 10)
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.metrics.inc("queries_committed_total", 3)
+        self.metrics.set("table_rows_per_second", 12.5)
+        self.metrics.observe("batch_seconds", 0.002)
+
+    def test_prometheus_format(self):
+        lines = self.metrics.to_prometheus().splitlines()
+        self.assertIn("# TYPE cymod_queries_committed_total counter", lines)
+        self.assertIn("cymod_queries_committed_total 3", lines)
+        self.assertIn("cymod_table_rows_per_second 12.5", lines)
+        self.assertIn("# TYPE cymod_batch_seconds histogram", lines)
+        self.assertIn('cymod_batch_seconds_bucket{le="0.001"} 0', lines)
+        self.assertIn('cymod_batch_seconds_bucket{le="0.0025"} 1', lines)
+        self.assertIn('cymod_batch_seconds_bucket{le="+Inf"} 1', lines)
+        self.assertIn("cymod_batch_seconds_count 1", lines)
+
+    def test_rate_from_counter_and_histogram(self):
+        self.metrics.set_rate("queries_per_second", "queries_committed_total", "x")
+        self.assertNotIn("queries_per_second", self.metrics.gauges)
+        self.metrics.observe("x", 2.0)
+        self.metrics.set_rate("queries_per_second", "queries_committed_total", "x")
+        self.assertEqual(self.metrics.gauges["queries_per_second"], 1.5)
+
+    def test_json_export(self):
+        test_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(test_dir, "metrics.json")
+            self.metrics.to_json(filename)
+            with open(filename) as f:
+                data = json.load(f)
+        finally:
+            shutil.rmtree(test_dir)
+        self.assertEqual(data["counters"], {"queries_committed_total": 3})
+        self.assertEqual(data["histograms"]["batch_seconds"]["count"], 1)
+        self.assertEqual(data["histograms"]["batch_seconds"]["buckets"]["0.0025"], 1)
+
+
+class SlowResult(object):
+    """Result which takes time to fetch, like a lazily fetched result."""
+
+    def consume(self):
+        time.sleep(0.05)
+
+
+class SlowSession(MemorySession):
+    def run(self, statement, parameters=None, **kwparameters):
+        super(SlowSession, self).run(statement, parameters, **kwparameters)
+        return SlowResult()
+
+
+class SlowDriver(MemoryDriver):
+    def session(self, **kwargs):
+        return SlowSession(self.graph)
+
+
+class LoaderMetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        for name in ["a.cql", "b.cql"]:
+            with open(os.path.join(self.test_dir, name), "w") as f:
+                f.write("MERGE (:A {id: 1});\nMERGE (:A {id: 2});")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_pipeline_stages_recorded(self):
+        loader = ServerGraphLoader.from_driver(MemoryDriver())
+        loader.load_cypher(self.test_dir)
+        loader.load_tabular(
+            pd.DataFrame({"start": ["a", "b"], "end": ["b", "c"], "cond": [1, 2]}),
+            "start",
+            "end",
+        )
+        loader.commit(tx_scope="file")
+
+        counters = loader.metrics.counters
+        self.assertEqual(counters["files_discovered_total"], 2)
+        self.assertEqual(counters["cypher_files_parsed_total"], 2)
+        self.assertEqual(counters["cypher_bytes_parsed_total"], 78)
+        self.assertEqual(counters["table_rows_total"], 2)
+        self.assertEqual(counters["batches_committed_total"], 3)
+        self.assertEqual(counters["queries_committed_total"], 6)
+        histograms = loader.metrics.histograms
+        self.assertEqual(histograms["query_seconds"].count, 6)
+        self.assertEqual(histograms["commit_seconds"].count, 1)
+        self.assertIn("table_rows_per_second", loader.metrics.gauges)
+
+    def test_query_time_includes_fetching_result(self):
+        loader = ServerGraphLoader.from_driver(SlowDriver())
+        loader.load_cypher(self.test_dir)
+        loader.commit()
+        histograms = loader.metrics.histograms
+        self.assertGreaterEqual(histograms["query_seconds"].min, 0.05)
+        self.assertGreaterEqual(histograms["batch_seconds"].min, 0.05)
+
+    def test_instrumentation_can_be_disabled(self):
+        loader = ServerGraphLoader.from_driver(MemoryDriver())
+        loader.metrics = None
+        loader.load_cypher(self.test_dir)
+        loader.commit()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.profiling
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import namedtuple
+
+import pandas as pd
+
+from cymod.load import ServerGraphLoader
+from cymod.profiling import statement_template, plan_operators
+
+Summary = namedtuple("Summary", ["plan", "profile"])
+
+
+def plan(operator, db_hits=0, rows=1, estimated_rows=1.0, children=()):
+    return {
+        "operatorType": operator + "@neo4j",
+        "dbHits": db_hits,
+        "rows": rows,
+        "args": {"EstimatedRows": estimated_rows},
+        "children": list(children),
+    }
+
+
+class PlanResult(object):
+    def __init__(self, summary):
+        self.summary = summary
+
+    def consume(self):
+        return self.summary
+
+
+class PlanTransaction(object):
+    """Stand-in for a transaction returning plans made by the driver's
+    `planner`."""
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, statement, params=None):
+        self.driver.log.append(statement)
+        tree = self.driver.planner(statement)
+        if statement.startswith("EXPLAIN"):
+            return PlanResult(Summary(tree, None))
+        return PlanResult(Summary(None, tree))
+
+    def commit(self):
+        self.driver.log.append("COMMIT")
+
+    def rollback(self):
+        self.driver.log.append("ROLLBACK")
+
+
+class PlanSession(object):
+    def __init__(self, driver):
+        self.driver = driver
+
+    def begin_transaction(self):
+        return PlanTransaction(self.driver)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class PlanDriver(object):
+    def __init__(self, planner):
+        self.planner = planner
+        self.log = []
+
+    def session(self, **kwargs):
+        return PlanSession(self)
+
+
+def planner(statement):
+    """Plans Cypher file queries with a cartesian product and table rows with
+    an eager label scan."""
+    if "MATCH" in statement:
+        return plan(
+            "ProduceResults",
+            children=[
+                plan(
+                    "CartesianProduct",
+                    db_hits=10,
+                    children=[plan("NodeIndexSeek"), plan("NodeIndexSeek")],
+                )
+            ],
+        )
+    return plan(
+        "ProduceResults",
+        children=[plan("Eager", children=[plan("NodeByLabelScan", db_hits=4)])],
+    )
+
+
+class StatementTemplateTestCase(unittest.TestCase):
+    def test_literals_replaced(self):
+        self.assertEqual(
+            statement_template('MERGE (:`S 1` {code: "a", n: 2.5})\n  SET x.y = -1'),
+            "MERGE (:`S 1` {code: ?, n: ?}) SET x.y = ?",
+        )
+
+    def test_parameters_and_names_kept(self):
+        statement = "MATCH (n1:A {id: $p1}) RETURN n1.x2"
+        self.assertEqual(statement_template(statement), statement)
+
+
+class PlanOperatorsTestCase(unittest.TestCase):
+    def test_plan_flattened_depth_first(self):
+        names = [op.name for op in plan_operators(planner("MATCH"))]
+        self.assertEqual(
+            names,
+            ["ProduceResults", "CartesianProduct", "NodeIndexSeek", "NodeIndexSeek"],
+        )
+
+
+class LoaderProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.test_dir, "a.cql"), "w") as f:
+            f.write(
+                "MATCH (a:A), (b:B) MERGE (a)-[:R]->(b);\n"
+                "CREATE INDEX FOR (n:A) ON (n.id);"
+            )
+        self.driver = PlanDriver(planner)
+        self.loader = ServerGraphLoader.from_driver(self.driver)
+        self.loader.load_cypher(self.test_dir)
+        self.loader.load_tabular(
+            pd.DataFrame(
+                {"start": ["a", "b", "c"], "end": ["b", "c", "a"], "cond": [1, 2, 3]}
+            ),
+            "start",
+            "end",
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_templates_profiled_once_and_rolled_back(self):
+        profile = self.loader.profile()
+        self.assertEqual(len(profile.profiles), 2)
+        self.assertEqual(
+            [s.split()[0] for s in self.driver.log], ["PROFILE", "ROLLBACK"] * 2
+        )
+
+    def test_hazards_ranked_by_total_cost(self):
+        hazardous = self.loader.profile().hazardous()
+        # Each table row costs 4 db hits
+        self.assertEqual([p.cost for p in hazardous], [12, 10])
+        self.assertEqual(hazardous[0].hazards, ["eager", "label scan"])
+        self.assertEqual(hazardous[0].executions, 3)
+        self.assertEqual(hazardous[1].hazards, ["cartesian product"])
+        self.assertEqual(hazardous[1].query.source.index, 0)
+        report = self.loader.profile().format_report(top=1).splitlines()
+        self.assertEqual(len(report), 3)
+        self.assertIn("table row 0: eager, label scan", report[1])
+
+    def test_explain_ranks_by_estimated_rows(self):
+        profile = self.loader.profile(explain=True)
+        self.assertTrue(self.driver.log[0].startswith("EXPLAIN"))
+        self.assertEqual([p.cost for p in profile.ranked()], [9, 4])
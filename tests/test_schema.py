@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.schema
+"""
+from __future__ import print_function
+
+import unittest
+
+from cymod.schema import IndexSpec, lookup_specs_from_statement, unique_specs
+
+
+class IndexSpecTestCase(unittest.TestCase):
+    def test_index_statement(self):
+        """Non-unique specs should produce an idempotent CREATE INDEX."""
+        spec = IndexSpec("State", ["code", "model_ID"])
+        self.assertEqual(
+            spec.statement(),
+            "CREATE INDEX `cymod_State_code_model_ID` IF NOT EXISTS "
+            "FOR (n:`State`) ON (n.`code`, n.`model_ID`)",
+        )
+
+    def test_constraint_statement(self):
+        """Unique specs should produce an idempotent CREATE CONSTRAINT."""
+        spec = IndexSpec("State", ["code"], unique=True)
+        self.assertEqual(
+            spec.statement(),
+            "CREATE CONSTRAINT `cymod_State_code` IF NOT EXISTS "
+            "FOR (n:`State`) REQUIRE n.`code` IS UNIQUE",
+        )
+
+    def test_composite_constraint_statement(self):
+        """Neo4j 4.4 only has composite constraints in the form of node keys."""
+        spec = IndexSpec("State", ["code", "model_ID"], unique=True)
+        self.assertEqual(
+            spec.statement(),
+            "CREATE CONSTRAINT `cymod_State_code_model_ID` IF NOT EXISTS "
+            "FOR (n:`State`) REQUIRE (n.`code`, n.`model_ID`) IS NODE KEY",
+        )
+
+    def test_equality(self):
+        self.assertEqual(IndexSpec("A", ["b"]), IndexSpec("A", ("b",)))
+        self.assertNotEqual(IndexSpec("A", ["b"]), IndexSpec("A", ["b"], True))
+        self.assertEqual(
+            unique_specs([IndexSpec("A", ["b"]), IndexSpec("A", ["b"])]),
+            [IndexSpec("A", ["b"])],
+        )
+
+
+class LookupSpecsFromStatementTestCase(unittest.TestCase):
+    def test_match_on_global_param_found(self):
+        """Labelled MATCH patterns using global params should be indexed."""
+        statement = (
+            'MATCH (srcLCT:LandCoverType {code:"a", model_ID:$model_ID}), '
+            '(tgtLCT:LandCoverType {code:"b", model_ID:$model_ID}) '
+            "CREATE (traj:SuccessionTrajectory {model_ID:$model_ID}) "
+            "MERGE (srcLCT)<-[:SOURCE]-(traj)-[:TARGET]->(tgtLCT);"
+        )
+        self.assertEqual(
+            lookup_specs_from_statement(statement, ["model_ID"]),
+            [
+                IndexSpec("LandCoverType", ["code", "model_ID"]),
+                IndexSpec("LandCoverType", ["code", "model_ID"]),
+            ],
+        )
+
+    def test_create_patterns_ignored(self):
+        """CREATE clauses don't look nodes up, so need no index."""
+        statement = "CREATE (n:Thing {model_ID:$model_ID});"
+        self.assertEqual(lookup_specs_from_statement(statement, ["model_ID"]), [])
+
+    def test_patterns_without_global_params_ignored(self):
+        statement = 'MERGE (n:Thing {code:"a"});'
+        self.assertEqual(lookup_specs_from_statement(statement, ["model_ID"]), [])
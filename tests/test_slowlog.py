@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.slowlog
+"""
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+import six
+import pandas as pd
+
+from cymod.cybase import CypherQuery, CypherQuerySource, CypherQueryBatch
+from cymod.load import ServerGraphLoader
+from cymod.memgraph import MemoryDriver, MemorySession
+from cymod.slowlog import SlowQueryLog
+
+
+def cypher_query(filename, index, params=None):
+    return CypherQuery(
+        "MERGE (:A {id: $id})",
+        params=params or {},
+        source=CypherQuerySource(filename, "cypher", index),
+    )
+
+
+class SlowQueryLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.test_dir, "slow.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def read_log(self):
+        with open(self.filename) as f:
+            return [json.loads(line) for line in f]
+
+    def test_only_slow_statements_logged(self):
+        with SlowQueryLog(self.filename, threshold=0.5) as log:
+            log.record_query(cypher_query("a.cql", 0, {"id": "xyz"}), 0.1)
+            log.record_query(cypher_query("a.cql", 1, {"id": "xyz"}), 0.6)
+            log.record_batch(CypherQueryBatch([cypher_query("a.cql", 0)]), 0.7)
+        entries = self.read_log()
+        self.assertEqual([e["kind"] for e in entries], ["query", "batch"])
+        self.assertEqual(entries[0]["source"], "a.cql")
+        self.assertEqual(entries[0]["index"], 1)
+        self.assertEqual(entries[0]["param_bytes"], {"id": 5})
+        self.assertEqual(entries[1]["queries"], 1)
+        self.assertEqual(log.slow_count, 2)
+
+    def test_sources_ranked_by_total_time(self):
+        log = SlowQueryLog(threshold=10, top=2)
+        for filename, elapsed in [("a.cql", 1), ("b.cql", 3), ("a.cql", 1), ("c", 0)]:
+            log.record_query(cypher_query(filename, 0), elapsed)
+        self.assertEqual(
+            log.slowest_sources(), [("b.cql", 3, 1, 3), ("a.cql", 2, 2, 1)]
+        )
+        self.assertIn("b.cql", log.format_summary().splitlines()[1])
+
+
+class TimeoutSession(MemorySession):
+    """Session recording the timeout of each statement it runs."""
+
+    timeouts = []
+
+    def run(self, statement, parameters=None, **kwparameters):
+        self.timeouts.append(getattr(statement, "timeout", None))
+        return super(TimeoutSession, self).run(statement, parameters, **kwparameters)
+
+
+class TimeoutDriver(MemoryDriver):
+    def session(self, **kwargs):
+        return TimeoutSession(self.graph)
+
+
+class LazyResult(object):
+    """Result whose query only takes time once it's fetched, as with a lazily
+    fetched result from the Neo4j driver."""
+
+    def __init__(self, result, delay):
+        self.result = result
+        self.delay = delay
+
+    def consume(self):
+        time.sleep(self.delay)
+        return self.result.consume()
+
+
+class LazyRunner(object):
+    """Wraps a session or transaction, delaying the results of statements
+    containing 'id: 2'."""
+
+    def __init__(self, runner):
+        self.runner = runner
+
+    def run(self, statement, parameters=None):
+        delay = 0.1 if "id: 2" in statement else 0
+        return LazyResult(self.runner.run(statement, parameters), delay)
+
+    def begin_transaction(self, **kwargs):
+        return LazyRunner(self.runner.begin_transaction(**kwargs))
+
+    def commit(self):
+        self.runner.commit()
+
+    def rollback(self):
+        self.runner.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class LazyDriver(MemoryDriver):
+    def session(self, **kwargs):
+        return LazyRunner(MemorySession(self.graph))
+
+
+class LoaderSlowQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.model_dir = os.path.join(self.test_dir, "model")
+        os.makedirs(self.model_dir)
+        with open(os.path.join(self.model_dir, "a.cql"), "w") as f:
+            f.write("MERGE (:A {id: 1});\nMERGE (:A {id: 2});")
+        self.filename = os.path.join(self.test_dir, "slow.jsonl")
+        self.stderr = sys.stderr
+        sys.stderr = six.StringIO()
+        TimeoutSession.timeouts = []
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+        shutil.rmtree(self.test_dir)
+
+    def loader(self, driver):
+        loader = ServerGraphLoader.from_driver(driver)
+        loader.load_cypher(self.model_dir)
+        loader.load_tabular(
+            pd.DataFrame({"start": ["a"], "end": ["b"], "cond": [1]}), "start", "end"
+        )
+        return loader
+
+    def test_slow_statements_logged_with_sources(self):
+        with SlowQueryLog(self.filename, threshold=0) as log:
+            self.loader(MemoryDriver()).commit(slow_query_log=log)
+        with open(self.filename) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(
+            [(os.path.basename(e["source"]), e["index"]) for e in entries[:2]],
+            [("a.cql", 0), ("a.cql", 1)],
+        )
+        self.assertEqual(entries[2]["source_type"], "tabular")
+        self.assertIn("Slowest sources", sys.stderr.getvalue())
+
+    def test_batches_logged_outside_query_scope(self):
+        with SlowQueryLog(self.filename, threshold=0) as log:
+            self.loader(MemoryDriver()).commit(tx_scope="file", slow_query_log=log)
+        with open(self.filename) as f:
+            kinds = [json.loads(line)["kind"] for line in f]
+        self.assertEqual(kinds.count("batch"), 2)
+        self.assertEqual(kinds.count("query"), 3)
+
+    def test_time_charged_to_query_fetched_lazily(self):
+        for tx_scope in ["query", "file"]:
+            with SlowQueryLog(self.filename, threshold=0.05) as log:
+                self.loader(LazyDriver()).commit(tx_scope=tx_scope, slow_query_log=log)
+            with open(self.filename) as f:
+                entries = [json.loads(line) for line in f]
+            queries = [e for e in entries if e["kind"] == "query"]
+            self.assertEqual(len(queries), 1)
+            self.assertIn("id: 2", queries[0]["statement"])
+            self.assertEqual(queries[0]["index"], 1)
+
+    def test_query_timeout_sent_with_statements(self):
+        self.loader(TimeoutDriver()).commit(query_timeout=2.5)
+        self.assertEqual(TimeoutSession.timeouts, [2.5, 2.5, 2.5])
+        self.assertEqual(sys.stderr.getvalue(), "")
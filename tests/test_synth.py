@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.synth
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cymod.cyproc import CypherFileFinder
+from cymod.tabproc import TransTableProcessor
+from cymod.load import ServerGraphLoader
+from cymod.memgraph import MemoryDriver
+from cymod.synth import generate_model, transition_table, write_cypher_tree
+
+
+def read_tree(root_dir):
+    contents = {}
+    for dirpath, _, files in os.walk(root_dir):
+        for f in files:
+            filename = os.path.join(dirpath, f)
+            with open(filename) as fh:
+                contents[os.path.relpath(filename, root_dir)] = fh.read()
+    return contents
+
+
+class SyntheticModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_same_seed_gives_same_model(self):
+        dirs = [os.path.join(self.test_dir, name) for name in ["a", "b", "c"]]
+        for directory, seed in zip(dirs, [1, 1, 2]):
+            write_cypher_tree(directory, 10, 5, seed=seed)
+        self.assertEqual(read_tree(dirs[0]), read_tree(dirs[1]))
+        self.assertNotEqual(read_tree(dirs[0]), read_tree(dirs[2]))
+        table = transition_table(20, 5, 2, seed=3)
+        self.assertTrue(table.equals(transition_table(20, 5, 2, seed=3)))
+
+    def test_cypher_files_parsed_with_headers(self):
+        filenames = write_cypher_tree(self.test_dir, 12, 7, depth=2, n_priorities=2)
+        files = list(CypherFileFinder(self.test_dir).iterfiles())
+        self.assertEqual(sorted(f.filename for f in files), sorted(filenames))
+        self.assertEqual(set(f.priority for f in files), set([0, 1]))
+        for cypher_file in files:
+            self.assertEqual(len(cypher_file.queries), 7)
+            self.assertIsNotNone(cypher_file.queries[0].params["view"])
+
+    def test_table_has_requested_shape(self):
+        table = transition_table(100, 4, 3, n_levels=2)
+        self.assertEqual(
+            list(table.columns), ["start", "end", "cond0", "cond1", "cond2", "delta_t"]
+        )
+        self.assertEqual(len(table), 100)
+        self.assertFalse((table["start"] == table["end"]).any())
+        self.assertEqual(set(table["cond1"]), set([0, 1]))
+
+    def test_generated_model_loads(self):
+        model = generate_model(
+            self.test_dir,
+            n_files=8,
+            statements_per_file=10,
+            n_rows=30,
+            n_states=6,
+            n_conditions=2,
+        )
+        self.assertTrue(os.path.isfile(os.path.join(self.test_dir, "transitions.csv")))
+
+        # Every code in the table has an alias
+        processor = TransTableProcessor(
+            model.table.drop("delta_t", axis=1),
+            "start",
+            "end",
+            state_alias_translator=model.translator,
+        )
+        self.assertEqual(len(list(processor.iterqueries())), 30)
+
+        driver = MemoryDriver()
+        loader = ServerGraphLoader.from_driver(driver)
+        loader.load_cypher(model.cypher_dir)
+        loader.commit()
+        entity_files = [
+            f for f in CypherFileFinder(model.cypher_dir).iterfiles() if f.priority == 0
+        ]
+        self.assertEqual(
+            driver.graph.summary()["nodes"], {"Entity": 10 * len(entity_files)}
+        )
@@ -5,6 +5,9 @@ Tests for cymod.tabproc
 from __future__ import print_function
 from functools import partial
 
+import os
+import shutil
+import tempfile
 import unittest
 
 import six
@@ -12,8 +15,13 @@ import six
 import pandas as pd
 
 from cymod.cybase import CypherQuery
-from cymod.tabproc import TransTableProcessor, EnvrStateAliasTranslator
+from cymod.tabproc import (
+    TransTableProcessor,
+    CsvTransTableProcessor,
+    EnvrStateAliasTranslator,
+)
 from cymod.customise import NodeLabels
+from cymod.schema import IndexSpec
 
 
 class TransTableProcessorTestCase(unittest.TestCase):
@@ -49,6 +57,28 @@ class TransTableProcessorTestCase(unittest.TestCase):
     def tearDown(self):
         del self.demo_explicit_table
 
+    def test_index_specs_include_global_params(self):
+        """Lookups made by generated queries should be described."""
+        ttp = TransTableProcessor(
+            self.demo_explicit_table,
+            "start",
+            "end",
+            labels=NodeLabels({"State": "MyState"}),
+            global_params={"model_ID": 1, "project": "p"},
+        )
+        self.assertEqual(
+            ttp.index_specs(unique=True),
+            [
+                IndexSpec("MyState", ["code", "model_ID", "project"], unique=True),
+                IndexSpec("Transition", ["model_ID", "project"]),
+                IndexSpec("Condition", ["model_ID", "project"]),
+            ],
+        )
+
+    def test_index_specs_without_global_params(self):
+        ttp = TransTableProcessor(self.demo_explicit_table, "start", "end")
+        self.assertEqual(ttp.index_specs(), [IndexSpec("State", ["code"])])
+
     def test_explicit_codes_queries_correct(self):
         """TransTableProcessorTestCase.iterqueries() yields correct queries."""
         ttp = TransTableProcessor(self.demo_explicit_table, "start", "end")
@@ -195,6 +225,132 @@ class TransTableProcessorTestCase(unittest.TestCase):
         self.assertEqual(six.next(query_iter).statement, query2.statement)
         self.assertRaises(StopIteration, partial(six.next, query_iter))
 
+    def test_fresh_load_creates_entities_not_yet_emitted(self):
+        """Entities described by earlier rows are matched, not created."""
+        df = pd.DataFrame(
+            {
+                "start": ["state1", "state1", "state2", "state2"],
+                "end": ["state2", "state2", "state2", "state2"],
+                "cond": ["low", "high", "low", "low"],
+            }
+        )
+        ttp = TransTableProcessor(
+            df, "start", "end", global_params={"id": 1}, fresh_load=True
+        )
+        statements = [q.statement for q in ttp.iterqueries()]
+
+        self.assertEqual(
+            statements,
+            [
+                'CREATE (start:State {code:"state1", id:1}) '
+                + 'CREATE (end:State {code:"state2", id:1}) '
+                + "CREATE (start)<-[:SOURCE]-(trans:Transition {id:1})"
+                + "-[:TARGET]->(end) "
+                + 'CREATE (cond:Condition {cond:"low", id:1})-[:CAUSES]->(trans);',
+                'MATCH (start:State {code:"state1", id:1}) '
+                + 'MATCH (end:State {code:"state2", id:1}) '
+                + "MATCH (start)<-[:SOURCE]-(trans:Transition {id:1})"
+                + "-[:TARGET]->(end) "
+                + 'CREATE (cond:Condition {cond:"high", id:1})-[:CAUSES]->(trans);',
+                'MATCH (start:State {code:"state2", id:1}) '
+                + "CREATE (start)<-[:SOURCE]-(trans:Transition {id:1})"
+                + "-[:TARGET]->(start) "
+                + 'CREATE (cond:Condition {cond:"low", id:1})-[:CAUSES]->(trans);',
+                'MATCH (start:State {code:"state2", id:1}) '
+                + "MATCH (start)<-[:SOURCE]-(trans:Transition {id:1})"
+                + "-[:TARGET]->(start) "
+                + 'MERGE (cond:Condition {cond:"low", id:1})-[:CAUSES]->(trans);',
+            ],
+        )
+
+    def test_fresh_load_shares_emitted_entities_between_tables(self):
+        """States created by one table are matched by the next."""
+        emitted = set()
+        first = TransTableProcessor(
+            self.demo_explicit_table, "start", "end", fresh_load=True
+        )
+        second = TransTableProcessor(
+            self.demo_explicit_table, "start", "end", fresh_load=True
+        )
+        list(first.iterqueries(emitted=emitted))
+        statement = six.next(second.iterqueries(emitted=emitted)).statement
+        self.assertTrue(statement.startswith('MATCH (start:State {code:"state1"})'))
+        self.assertNotIn("CREATE", statement)
+
+    def test_emitted_ignored_without_fresh_load(self):
+        ttp = TransTableProcessor(self.demo_explicit_table, "start", "end")
+        statement = six.next(ttp.iterqueries(emitted=set())).statement
+        self.assertTrue(statement.startswith("MERGE"))
+
+
+class CsvTransTableProcessorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.import_dir = tempfile.mkdtemp()
+        self.table = pd.DataFrame(
+            {
+                "start": [0, 1],
+                "end": [1, 2],
+                "cond1": [0, 1],
+                "cond2": [2.5, 3.5],
+                "cond3": [True, False],
+            }
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.import_dir)
+
+    def test_single_load_csv_query_generated(self):
+        """The query should perform the same MERGEs, converting types."""
+        ttp = CsvTransTableProcessor(
+            self.table,
+            "start",
+            "end",
+            self.import_dir,
+            file_name="table.csv",
+            batch_size=500,
+            labels=NodeLabels({"State": "MyState"}),
+            global_params={"id": "test-id"},
+        )
+        queries = list(ttp.iterqueries())
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(
+            queries[0].statement,
+            'LOAD CSV WITH HEADERS FROM "file:///table.csv" AS row '
+            + "CALL { WITH row "
+            + 'MERGE (start:MyState {code:row.`start`, id:"test-id"}) '
+            + 'MERGE (end:MyState {code:row.`end`, id:"test-id"}) '
+            + "MERGE (start)<-[:SOURCE]-"
+            + '(trans:Transition {id:"test-id"})-[:TARGET]->(end) '
+            + "MERGE (cond:Condition {cond1:toInteger(row.`cond1`), "
+            + "cond2:toFloat(row.`cond2`), cond3:toBoolean(row.`cond3`), "
+            + 'id:"test-id"})-[:CAUSES]->(trans) '
+            + "} IN TRANSACTIONS OF 500 ROWS;",
+        )
+
+    def test_aliased_table_written_to_import_dir(self):
+        trans = EnvrStateAliasTranslator()
+        trans.state_aliases = {0: "state1", 1: "state2", 2: "state3"}
+        ttp = CsvTransTableProcessor(
+            self.table, "start", "end", self.import_dir, state_alias_translator=trans
+        )
+        ttp.prepare()
+        written = pd.read_csv(os.path.join(self.import_dir, ttp.file_name))
+        self.assertEqual(list(written["start"]), ["state1", "state2"])
+        self.assertEqual(list(written["cond2"]), [2.5, 3.5])
+
+    def test_table_written_once(self):
+        """Generating the query again shouldn't rewrite the file."""
+        ttp = CsvTransTableProcessor(self.table, "start", "end", self.import_dir)
+        writes = []
+        write_csv = ttp.write_csv
+        ttp.write_csv = lambda: writes.append(1) or write_csv()
+        fname = ttp.prepare()
+        list(ttp.iterqueries())
+        self.assertEqual(ttp.prepare(), fname)
+        list(ttp.iterqueries())
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(os.path.exists(fname))
+
 
 class EnvrStateAliasTranslatorTestCase(unittest.TestCase):
     """Tests for the ``EnvrStateAliasTranslator`` class.
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for cymod.tracing
+"""
+from __future__ import print_function
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from cymod.load import ServerGraphLoader
+from cymod.memgraph import MemoryDriver
+from cymod.tracing import Tracer, SpanSwitch
+
+
+def contains(outer, inner):
+    return (
+        outer["ts"] <= inner["ts"]
+        and inner["ts"] + inner["dur"] <= outer["ts"] + outer["dur"]
+    )
+
+
+class LoaderTracingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.model_dir = os.path.join(self.test_dir, "model")
+        os.makedirs(self.model_dir)
+        for name in ["a.cql", "b.cql"]:
+            with open(os.path.join(self.model_dir, name), "w") as f:
+                f.write("MERGE (:A {id: 1});\nMERGE (:A {id: 2});")
+        self.loader = ServerGraphLoader.from_driver(MemoryDriver())
+        self.loader.tracer = Tracer()
+        self.loader.load_cypher(self.model_dir)
+        self.loader.load_tabular(
+            pd.DataFrame({"start": ["a"], "end": ["b"], "cond": [1]}), "start", "end"
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def events(self, name):
+        events = self.loader.tracer.chrome_trace_events()
+        return [e for e in events if e["name"] == name]
+
+    def test_spans_nest_from_load_to_query(self):
+        self.loader.commit(tx_scope="query")
+        (load,) = self.events("load")
+        jobs = self.events("job")
+        files = self.events("file")
+        queries = self.events("query")
+        self.assertEqual([j["args"]["job"] for j in jobs], [0, 1])
+        self.assertEqual(len(files), 3)
+        self.assertEqual(len(self.events("batch")), 5)
+        self.assertEqual(len(queries), 5)
+
+        for job in jobs:
+            self.assertTrue(contains(load, job))
+        self.assertTrue(all(contains(jobs[0], f) for f in files[:2]))
+        self.assertTrue(contains(jobs[1], files[2]))
+        self.assertEqual(files[2]["args"], {"source.type": "tabular"})
+        self.assertEqual(
+            sorted(os.path.basename(f["args"]["source.file"]) for f in files[:2]),
+            ["a.cql", "b.cql"],
+        )
+        self.assertEqual(queries[0]["args"]["source.index"], 0)
+
+    def test_parallel_load_traced(self):
+        self.loader.commit(tx_scope="file", workers=2)
+        self.assertEqual(len(self.events("load")), 1)
+        self.assertEqual(len(self.events("file")), 3)
+        self.assertEqual(len(self.events("batch")), 3)
+
+    def test_chrome_trace_written(self):
+        self.loader.commit(tx_scope="file")
+        filename = os.path.join(self.test_dir, "trace.json")
+        self.loader.tracer.write_chrome_trace(filename)
+        with open(filename) as f:
+            trace = json.load(f)
+        event = trace["traceEvents"][0]
+        self.assertEqual(event["name"], "load")
+        self.assertEqual(event["ph"], "X")
+        self.assertEqual(event["args"], {"tx_scope": "file", "workers": 1})
+
+
+class SpanSwitchTestCase(unittest.TestCase):
+    def test_span_kept_open_while_key_unchanged(self):
+        tracer = Tracer()
+        switch = SpanSwitch(tracer, "file")
+        for key in ["a", "a", "b", None, "b"]:
+            switch.switch(key, code=key)
+        switch.close()
+        self.assertEqual([s.attributes["code"] for s in tracer.spans], ["a", "b", "b"])